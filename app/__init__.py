@@ -1,9 +1,9 @@
 import logging
 from celery import Celery
-from celery.schedules import crontab
 
 from flask import Flask
 
+from .commands import register_commands
 from .config import config
 from .extensions import init_extensions, init_jwt_callbacks
 from .routes import register_routes
@@ -19,17 +19,12 @@ def create_app():
 
     # Register routes
     register_routes(app)
+    register_commands(app)
 
     # Configure Celery
     celery.conf.update(app.config)
 
-    # Configure Celery Beat schedule
-    celery.conf.beat_schedule = {
-        "cleanup-expired-tokens": {
-            "task": "app.tasks.cleanup_expired_tokens",
-            "schedule": crontab(hour="*/1"),  # Run every hour
-        },
-    }
+    # The Celery Beat schedule lives with the worker's app, in extensions.py
 
     # Configure logging
     logging.basicConfig(
@@ -0,0 +1,147 @@
+import click
+from flask import Flask
+
+
+def register_commands(app: Flask):
+    """Register custom ``flask`` CLI commands."""
+
+    @app.cli.command("rebuild-vector-index")
+    def rebuild_vector_index():
+        """Rebuild the visual similarity index from the embeddings in Postgres."""
+        from .tasks import rebuild_vector_index_task
+
+        count = rebuild_vector_index_task()
+        click.echo(f"Vector index rebuilt with {count} vectors")
+
+    @app.cli.command("extract-colors")
+    @click.option("--batch-size", default=256, show_default=True)
+    @click.option(
+        "--workers",
+        type=int,
+        default=None,
+        help="Defaults to COLOR_EXTRACTION_WORKERS.",
+    )
+    @click.option(
+        "--all",
+        "overwrite",
+        is_flag=True,
+        help="Recompute items that already have colors.",
+    )
+    def extract_colors(batch_size, workers, overwrite):
+        """Extract dominant colors locally for items, in parallel batches."""
+        from .extensions import db
+        from .models.clothing_item import Item
+        from .services.color_service import color_service
+        from .utils.image_cache import image_cache
+
+        query = Item.query.filter(Item.image_url.isnot(None)).order_by(Item.id)
+        if not overwrite:
+            query = query.filter(Item.dominant_colors.is_(None))
+
+        updated, last_id = 0, None
+        while True:
+            batch_query = query if last_id is None else query.filter(Item.id > last_id)
+            items = batch_query.limit(batch_size).all()
+            if not items:
+                break
+            last_id = items[-1].id
+
+            images, fetched = [], []
+            for item in items:
+                try:
+                    images.append(image_cache.fetch(item.image_url))
+                    fetched.append(item)
+                except Exception as e:
+                    click.echo(f"Skipping item {item.id}: {e}", err=True)
+
+            palettes = color_service.extract_colors_batch(images, workers=workers)
+            for item, palette in zip(fetched, palettes):
+                if palette:
+                    item.dominant_colors = [color["hex"] for color in palette]
+                    updated += 1
+            db.session.commit()
+
+        click.echo(f"Extracted colors for {updated} items")
+
+    @app.cli.command("reindex-colors")
+    @click.option("--batch-size", default=10000, show_default=True)
+    def reindex_colors(batch_size):
+        """Rebuild the color similarity index columns from dominant_colors."""
+        from .services.search_service import search_service
+
+        count = search_service.reindex_color_index(batch_size=batch_size)
+        click.echo(f"Color index rebuilt for {count} items")
+
+    @app.cli.command("backfill-email-index")
+    @click.option("--batch-size", default=500, show_default=True)
+    def backfill_email_index(batch_size):
+        """Add blind email indexes to old privacy vault documents, then index them."""
+        from pymongo.errors import OperationFailure
+
+        from .models.user_privacy import UserPrivacy
+
+        count = UserPrivacy.backfill_email_index(batch_size=batch_size)
+        click.echo(f"Backfilled email_index on {count} privacy documents")
+        try:
+            UserPrivacy.ensure_indexes()
+        except OperationFailure as e:
+            # Most likely the same email registered twice before lookups were indexed
+            raise click.ClickException(f"Could not create the unique email index: {e}")
+        click.echo("Unique email_index index is in place")
+
+    @app.cli.command("dispatch-auctions")
+    @click.option(
+        "--sync/--no-sync",
+        default=True,
+        show_default=True,
+        help="Queue every active auction (and rebuild missing auction books) "
+        "from Postgres before starting.",
+    )
+    def dispatch_auctions(sync):
+        """Close auctions as they end (runs until interrupted)."""
+        from .services.auction_book import auction_book
+        from .services.auction_events import auction_events
+        from .services.auction_scheduler import auction_scheduler
+
+        if sync:
+            count = auction_scheduler.sync_from_database()
+            click.echo(f"Queued {count} active auctions")
+            count = auction_book.sync_from_database()
+            if count:
+                click.echo(f"Rebuilt {count} auction books")
+
+        def report(batch):
+            click.echo(f"Closed {len(batch)} auctions")
+            auction_events.auctions_closed(batch)
+
+        try:
+            auction_scheduler.run(on_settled=report)
+        except KeyboardInterrupt:
+            pass
+
+    @app.cli.command("relay-outbox")
+    def relay_outbox():
+        """Publish queued Celery tasks from the outbox (runs until interrupted)."""
+        from . import tasks  # noqa: F401 (registers the tasks sent in chunks)
+        from .services.outbox import outbox
+
+        try:
+            outbox.run()
+        except KeyboardInterrupt:
+            pass
+
+    @app.cli.command("recount-unread-notifications")
+    def recount_unread_notifications():
+        """Set each user's unread notification counter from their notifications."""
+        from .services.notification_service import notification_service
+
+        count = notification_service.recount_unread()
+        click.echo(f"Updated unread counters for {count} users")
+
+    @app.cli.command("recount-item-likes")
+    def recount_item_likes():
+        """Set each item's like count from its likes."""
+        from .services.engagement import engagement
+
+        count = engagement.recount_likes()
+        click.echo(f"Updated like counts for {count} items")
@@ -55,6 +55,13 @@ class Config:
     # Search
     ALGOLIA_APP_ID = os.getenv("ALGOLIA_APP_ID")
     ALGOLIA_API_KEY = os.getenv("ALGOLIA_WRITE_API_KEY")
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "fulltext")  # "fulltext" | "ilike"
+    SEARCH_TEXT_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "english")
+    SEARCH_FACET_LIMIT = int(os.getenv("SEARCH_FACET_LIMIT", "20"))  # Top-N values
+    SEARCH_PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000, 100000, 500000]  # Satoshis
+    # Color similarity search: grid cell edge and largest accepted tolerance (delta E)
+    COLOR_GRID_SIZE = float(os.getenv("COLOR_GRID_SIZE", "10"))
+    COLOR_MAX_TOLERANCE = float(os.getenv("COLOR_MAX_TOLERANCE", "50"))
 
     MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
     MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
@@ -81,6 +88,118 @@ class Config:
     CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
     EMBEDDING_DIMENSION = 512
 
+    # Vector index for visual similarity (shared on-disk by all workers)
+    VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "instance/vector_index")
+    VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "ivf")  # "ivf" | "flat"
+    VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "1024"))
+    VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+
+    # Local content-addressed cache of downloaded item images
+    IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", "instance/image_cache")
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+    # Processes used for batch dominant-color extraction
+    COLOR_EXTRACTION_WORKERS = int(
+        os.getenv("COLOR_EXTRACTION_WORKERS", str(os.cpu_count() or 1))
+    )
+
+    # Auctions closed per settlement statement
+    AUCTION_SETTLEMENT_BATCH_SIZE = int(
+        os.getenv("AUCTION_SETTLEMENT_BATCH_SIZE", "1000")
+    )
+
+    # Auction close queue (a Redis sorted set); empty keeps it in-process
+    AUCTION_SCHEDULER_REDIS_URL = os.getenv(
+        "AUCTION_SCHEDULER_REDIS_URL",
+        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    )
+    AUCTION_DISPATCH_POLL_INTERVAL = float(
+        os.getenv("AUCTION_DISPATCH_POLL_INTERVAL", "0.25")
+    )
+
+    # Transactional outbox relay (flask relay-outbox)
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+    OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.2"))
+
+    # Notifications: repeats of a type, item and recipient within the window
+    # (seconds; 0 disables) share a row, and email goes out as a digest
+    NOTIFICATION_COALESCE_WINDOW = int(os.getenv("NOTIFICATION_COALESCE_WINDOW", "900"))
+    NOTIFICATION_DIGEST_INTERVAL = int(
+        os.getenv("NOTIFICATION_DIGEST_INTERVAL", "300")
+    )  # Seconds
+    NOTIFICATION_DIGEST_BATCH_SIZE = int(
+        os.getenv("NOTIFICATION_DIGEST_BATCH_SIZE", "1000")
+    )  # Recipients claimed per batch
+
+    # Trending feed: time-decayed engagement scores, buffered in Redis (empty
+    # keeps them in-process) and flushed to items.trending_score
+    TRENDING_REDIS_URL = os.getenv(
+        "TRENDING_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    )
+    TRENDING_HALF_LIFE = int(os.getenv("TRENDING_HALF_LIFE", "21600"))  # Seconds
+    TRENDING_FLUSH_INTERVAL = int(os.getenv("TRENDING_FLUSH_INTERVAL", "30"))
+    TRENDING_FLUSH_SIZE = int(os.getenv("TRENDING_FLUSH_SIZE", "1000"))
+    TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "200"))  # Places cached
+    TRENDING_CACHE_TTL = int(os.getenv("TRENDING_CACHE_TTL", "30"))  # Seconds
+
+    # Item view/like/watcher counters, buffered in Redis (empty keeps them
+    # in-process) and flushed to the items table in batches
+    ENGAGEMENT_REDIS_URL = os.getenv(
+        "ENGAGEMENT_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    )
+    ENGAGEMENT_FLUSH_INTERVAL = int(os.getenv("ENGAGEMENT_FLUSH_INTERVAL", "10"))
+    ENGAGEMENT_FLUSH_SIZE = int(os.getenv("ENGAGEMENT_FLUSH_SIZE", "1000"))
+
+    # Outfit recommendations cached per (user, occasion, weather) in Redis
+    # (empty keeps them in-process), precomputed nightly for active users
+    RECOMMENDATION_CACHE_REDIS_URL = os.getenv(
+        "RECOMMENDATION_CACHE_REDIS_URL",
+        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    )
+    # Seconds before a cached outfit is refreshed in the background
+    RECOMMENDATION_FRESH_FOR = int(os.getenv("RECOMMENDATION_FRESH_FOR", "21600"))
+    # Seconds before it is dropped and recomputed inline
+    RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", "172800"))
+    # Users who asked within this many days get precomputed
+    RECOMMENDATION_ACTIVE_DAYS = int(os.getenv("RECOMMENDATION_ACTIVE_DAYS", "14"))
+    RECOMMENDATION_PRECOMPUTE_HOUR = int(
+        os.getenv("RECOMMENDATION_PRECOMPUTE_HOUR", "3")
+    )  # UTC
+
+    # Live order book for auctions in their final minutes; empty disables it
+    AUCTION_BOOK_REDIS_URL = os.getenv("AUCTION_BOOK_REDIS_URL", "")
+    AUCTION_BOOK_WINDOW = int(os.getenv("AUCTION_BOOK_WINDOW", "900"))  # Seconds
+    AUCTION_BOOK_FLUSH_SIZE = int(os.getenv("AUCTION_BOOK_FLUSH_SIZE", "1000"))
+
+    # Socket.IO: the Redis queue fanning events out across web workers (and
+    # from the dispatcher and Celery); empty keeps them in one process
+    SOCKETIO_MESSAGE_QUEUE = os.getenv(
+        "SOCKETIO_MESSAGE_QUEUE", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    )
+    SOCKETIO_ASYNC_MODE = os.getenv("SOCKETIO_ASYNC_MODE")  # Autodetected if unset
+
+    # JWT revocation cache: per-worker Bloom filter, Redis as the source of truth
+    TOKEN_REVOCATION_REDIS_URL = os.getenv(
+        "TOKEN_REVOCATION_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    )
+    TOKEN_REVOCATION_BLOOM_CAPACITY = int(
+        os.getenv("TOKEN_REVOCATION_BLOOM_CAPACITY", "1000000")
+    )
+    TOKEN_REVOCATION_BLOOM_ERROR_RATE = float(
+        os.getenv("TOKEN_REVOCATION_BLOOM_ERROR_RATE", "0.001")
+    )
+    TOKEN_REVOCATION_REBUILD_INTERVAL = int(
+        os.getenv("TOKEN_REVOCATION_REBUILD_INTERVAL", "3600")
+    )
+
+    # Cache of Gemini responses per (image hash, prompt version, model)
+    LLM_CACHE_REDIS_URL = os.getenv(
+        "LLM_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    )
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "instance/llm_cache.sqlite3")
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+
     # Rate Limiting
     RATELIMIT_DEFAULT = "200 per day;50 per hour"
     RATELIMIT_STORAGE_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -1,11 +1,13 @@
 import sentry_sdk
 from celery import Celery
+from celery.schedules import crontab
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_mail import Mail
 from flask_migrate import Migrate
+from flask_socketio import SocketIO
 from flask_sqlalchemy import SQLAlchemy
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
@@ -30,6 +32,9 @@ limiter = Limiter(key_func=get_remote_address)
 # CORS
 cors = CORS()
 
+# Real-time auction updates; workers share rooms through the message queue
+socketio = SocketIO()
+
 # Initialize Celery
 celery = Celery(
     "fitcheck",
@@ -45,6 +50,33 @@ celery.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    beat_schedule={
+        "cleanup-expired-tokens": {
+            "task": "app.tasks.cleanup_expired_tokens",
+            "schedule": crontab(minute=0),  # Run every hour
+        },
+        # Backstop only: the auction dispatcher closes auctions as they end
+        "settle-expired-auctions": {
+            "task": "app.tasks.cleanup_expired_bids",
+            "schedule": crontab(minute="*/5"),  # Run every 5 minutes
+        },
+        "send-notification-digests": {
+            "task": "app.tasks.send_notification_digests",
+            "schedule": config.NOTIFICATION_DIGEST_INTERVAL,
+        },
+        "flush-trending-scores": {
+            "task": "app.tasks.flush_trending_scores",
+            "schedule": config.TRENDING_FLUSH_INTERVAL,
+        },
+        "flush-engagement-counters": {
+            "task": "app.tasks.flush_engagement_counters",
+            "schedule": config.ENGAGEMENT_FLUSH_INTERVAL,
+        },
+        "precompute-recommendations": {
+            "task": "app.tasks.precompute_recommendations",
+            "schedule": crontab(minute=0, hour=config.RECOMMENDATION_PRECOMPUTE_HOUR),
+        },
+    },
 )
 
 
@@ -74,6 +106,13 @@ def init_extensions(app):
     jwt.init_app(app)
     limiter.init_app(app)
     cors.init_app(app)
+    origins = app.config.get("CORS_ORIGINS") or "*"
+    socketio.init_app(
+        app,
+        message_queue=app.config.get("SOCKETIO_MESSAGE_QUEUE") or None,
+        async_mode=app.config.get("SOCKETIO_ASYNC_MODE") or None,
+        cors_allowed_origins="*" if "*" in origins else origins,
+    )
 
     if app.config.get("SENTRY_DSN"):
         sentry_sdk.init(
@@ -87,10 +126,8 @@ def init_extensions(app):
 
 def init_jwt_callbacks():
     """Initialize JWT callbacks after all models are loaded"""
-    from app.models.token_blocklist import TokenBlocklist
+    from app.services.token_revocation import token_revocation
 
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
-        jti = jwt_payload["jti"]
-        token = TokenBlocklist.query.filter_by(jti=jti).scalar()
-        return token is not None
+        return token_revocation.is_revoked(jwt_payload["jti"])
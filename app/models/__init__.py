@@ -2,6 +2,8 @@ from .user import User
 from .clothing_item import Item
 from .notification import Notification
 from .bid import Bid
+from .item_like import ItemLike
+from .outbox import OutboxEvent
 from .token_blocklist import TokenBlocklist
 from .user_privacy import UserPrivacy
 
@@ -10,6 +12,8 @@ __all__ = [
     "Item",
     "Notification",
     "Bid",
+    "ItemLike",
+    "OutboxEvent",
     "TokenBlocklist",
     "UserPrivacy",
 ]
@@ -48,6 +48,11 @@ class Bid(db.Model):
         db.DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24), index=True
     )
 
+    __table_args__ = (
+        # Highest bid per item, for auction settlement
+        db.Index("ix_bids_item_amount", "item_id", "amount"),
+    )
+
     # Relationships (optimized)
     user = db.relationship("User", back_populates="bids")
     item = db.relationship("Item", back_populates="bids")
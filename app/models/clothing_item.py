@@ -2,10 +2,25 @@ from enum import Enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import JSON
-from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy import JSON, event, func, inspect
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
+from sqlalchemy.orm import deferred, load_only
 
+from app.config import config
 from app.extensions import db
+from app.utils.color import hex_to_lab, lab_cells
+
+# Columns that feed the full-text search document, with their ts_rank weight
+SEARCH_VECTOR_WEIGHTS = {
+    "title": "A",
+    "brand": "A",
+    "category": "B",
+    "tags": "B",
+    "description": "C",
+}
+
+# Only this many dominant colors (the most prominent ones) are color-indexed
+COLOR_INDEX_MAX_COLORS = 5
 
 
 class AuctionStatus(Enum):
@@ -18,13 +33,16 @@ class Item(db.Model):
     __tablename__ = "items"
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=False, index=True
+    )  # Wardrobes load by owner
 
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
+    last_worn_at = db.Column(db.DateTime)  # Set by the owner, for recommendations
 
     # Media fields
     image_url = db.Column(db.String(255))
@@ -39,15 +57,20 @@ class Item(db.Model):
     # Size System
     size_type = db.Column(db.String(20), nullable=False)  # "clothing"|"footwear"
     size_value = db.Column(db.String(20), nullable=False)  # "M", "42", "10W"
-    size_compatibility = db.Column(JSON, nullable=False)  # Structured measurements
+    size_compatibility = deferred(
+        db.Column(JSON, nullable=False), group="detail"
+    )  # Structured measurements
     # Example: {"waist_min": 30, "waist_max": 32, "inseam_min": 28, "length_min": 100, "length_max": 105}
 
     # Description
-    description = db.Column(db.Text)
+    description = deferred(db.Column(db.Text), group="detail")
 
     # Auction Details
     auction_start_price = db.Column(db.Numeric(10, 2), nullable=False)  # Satoshis
     auction_current_bid = db.Column(db.Numeric(10, 2))  # Satoshis
+    auction_current_bidder_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=True
+    )  # Highest bidder, and the winner once the auction is settled
     auction_ends_at = db.Column(db.DateTime, nullable=False, index=True)
     auction_status = db.Column(
         db.Enum(AuctionStatus),
@@ -57,8 +80,10 @@ class Item(db.Model):
     )
 
     # AI/Discovery
-    embedding = db.Column(ARRAY(db.Float))  # Vector for visual search
+    embedding = deferred(db.Column(ARRAY(db.Float)))  # Vector for visual search
     style = db.Column(ARRAY(db.String(50)))  # For storing clothing style
+    vibe = db.Column(ARRAY(db.String(50)))  # Overall mood, e.g. "relaxed"
+    detected_objects = db.Column(ARRAY(db.String(50)))  # Garments seen in the image
 
     # Brand and Category
     brand = db.Column(db.String(100))  # "Nike", "Adidas", etc.
@@ -67,51 +92,267 @@ class Item(db.Model):
     tags = db.Column(ARRAY(db.String(50)))  # "jacket", "dress", "sneakers"
     is_public = db.Column(db.Boolean, default=True)
 
+    # Engagement counters, flushed in batches (see EngagementCounters)
+    views_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    likes_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    watchers_count = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )  # Clients watching the item live
+    # Time-decayed popularity, in log2 (see TrendingService)
+    trending_score = db.Column(
+        db.Float, default=0.0, server_default="0", nullable=False
+    )
+
+    # Full-text search document, maintained on insert/update (see below)
+    search_vector = deferred(db.Column(TSVECTOR))
+
+    # Color similarity index, maintained from dominant_colors (see below):
+    # flattened L*a*b* triples, and the grid cells they fall into
+    color_lab = deferred(db.Column(ARRAY(db.REAL)))
+    color_cells = deferred(db.Column(ARRAY(db.Integer)))
+
+    __table_args__ = (
+        db.Index("ix_items_search_vector", "search_vector", postgresql_using="gin"),
+        db.Index("ix_items_color_cells", "color_cells", postgresql_using="gin"),
+        # Keyset pagination for the newest-first and trending listings; btree
+        # indexes scan backwards, so these also serve the DESC orderings
+        db.Index("ix_items_public_created_at", "is_public", "created_at", "id"),
+        db.Index(
+            "ix_items_public_trending",
+            "is_public",
+            "trending_score",
+            "created_at",
+            "id",
+        ),
+        # Auction settlement: active auctions by end time
+        db.Index("ix_items_auction_due", "auction_status", "auction_ends_at"),
+    )
+
     # Relationships (optimized)
-    user = db.relationship("User", back_populates="items")
+    user = db.relationship("User", back_populates="items", foreign_keys=[user_id])
     bids = db.relationship(
         "Bid", back_populates="item", lazy="dynamic", order_by="Bid.amount.desc()"
     )
 
-    def to_dict(self):
+    def to_dict(self, projection="detail", fields=None):
+        """
+        Serialize the item.
+
+        Args:
+            projection (str): One of ITEM_PROJECTIONS ("card", "detail", "internal").
+            fields (list): Only return these fields (overrides ``projection``).
+        """
         return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "title": self.title,
-            "description": self.description,
-            "category": self.category,
-            "brand": self.brand,
-            "size_type": self.size_type,
-            "size_value": self.size_value,
-            "size_compatibility": self.size_compatibility,
-            "condition": self.condition,
-            "price": float(self.price) if self.price else None,
-            "image_url": self.image_url,
-            "thumbnail_url": self.thumbnail_url,
-            "tags": self.tags,
-            "is_public": self.is_public,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-            "current_price": self.auction_current_bid or self.auction_start_price,
-            "time_remaining": max(
-                0, (self.auction_ends_at - datetime.utcnow()).total_seconds()
-            ),
-            "size": f"{self.size_value} ({self.size_type})",
-            "dominant_colors": self.dominant_colors
-            or [],  # Ensure dominant_colors is returned
-            "style": self.style
-            or [],  # New: Include style in the dictionary representation
-            "auction_status": self.auction_status.value,  # Return enum value as string
-            "auction_start_price": (
-                float(self.auction_start_price) if self.auction_start_price else None
-            ),
-            "auction_current_bid": (
-                float(self.auction_current_bid) if self.auction_current_bid else None
-            ),
-            "auction_ends_at": (
-                self.auction_ends_at.isoformat() if self.auction_ends_at else None
-            ),
+            name: ITEM_FIELDS[name][1](self) for name in item_fields(projection, fields)
         }
 
     def __repr__(self):
         return f"<Item {self.title}>"
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+# Every serializable field: the columns it reads, and how it is computed
+ITEM_FIELDS = {
+    "id": (("id",), lambda item: str(item.id)),
+    "user_id": (("user_id",), lambda item: str(item.user_id)),
+    "title": (("title",), lambda item: item.title),
+    "description": (("description",), lambda item: item.description),
+    "category": (("category",), lambda item: item.category),
+    "brand": (("brand",), lambda item: item.brand),
+    "size_type": (("size_type",), lambda item: item.size_type),
+    "size_value": (("size_value",), lambda item: item.size_value),
+    "size_compatibility": (
+        ("size_compatibility",),
+        lambda item: item.size_compatibility,
+    ),
+    "condition": (("condition",), lambda item: item.condition),
+    "price": (("price",), lambda item: _float(item.price)),
+    "image_url": (("image_url",), lambda item: item.image_url),
+    "thumbnail_url": (("thumbnail_url",), lambda item: item.thumbnail_url),
+    "tags": (("tags",), lambda item: item.tags),
+    "is_public": (("is_public",), lambda item: item.is_public),
+    "views_count": (("views_count",), lambda item: item.views_count),
+    "likes_count": (("likes_count",), lambda item: item.likes_count),
+    "watchers_count": (("watchers_count",), lambda item: item.watchers_count),
+    "created_at": (("created_at",), lambda item: _isoformat(item.created_at)),
+    "updated_at": (("updated_at",), lambda item: _isoformat(item.updated_at)),
+    "current_price": (
+        ("auction_current_bid", "auction_start_price"),
+        lambda item: item.auction_current_bid or item.auction_start_price,
+    ),
+    "time_remaining": (
+        ("auction_ends_at",),
+        lambda item: max(0, (item.auction_ends_at - datetime.utcnow()).total_seconds()),
+    ),
+    "size": (
+        ("size_value", "size_type"),
+        lambda item: f"{item.size_value} ({item.size_type})",
+    ),
+    "dominant_colors": (("dominant_colors",), lambda item: item.dominant_colors or []),
+    "style": (("style",), lambda item: item.style or []),
+    "vibe": (("vibe",), lambda item: item.vibe or []),
+    "detected_objects": (
+        ("detected_objects",),
+        lambda item: item.detected_objects or [],
+    ),
+    "auction_status": (("auction_status",), lambda item: item.auction_status.value),
+    "auction_start_price": (
+        ("auction_start_price",),
+        lambda item: _float(item.auction_start_price),
+    ),
+    "auction_current_bid": (
+        ("auction_current_bid",),
+        lambda item: _float(item.auction_current_bid),
+    ),
+    "auction_ends_at": (
+        ("auction_ends_at",),
+        lambda item: _isoformat(item.auction_ends_at),
+    ),
+    # Internal only
+    "cloudinary_public_id": (
+        ("cloudinary_public_id",),
+        lambda item: item.cloudinary_public_id,
+    ),
+    "embedding": (("embedding",), lambda item: item.embedding),
+}
+
+_INTERNAL_FIELDS = ("cloudinary_public_id", "embedding")
+
+ITEM_PROJECTIONS = {
+    # Feed/search tiles
+    "card": (
+        "id",
+        "user_id",
+        "title",
+        "category",
+        "brand",
+        "size",
+        "condition",
+        "price",
+        "current_price",
+        "image_url",
+        "thumbnail_url",
+        "dominant_colors",
+        "views_count",
+        "likes_count",
+        "watchers_count",
+        "auction_status",
+        "auction_ends_at",
+        "time_remaining",
+        "created_at",
+    ),
+    # The full public representation
+    "detail": tuple(name for name in ITEM_FIELDS if name not in _INTERNAL_FIELDS),
+    "internal": tuple(ITEM_FIELDS),
+}
+
+
+def item_fields(projection="detail", fields=None):
+    """
+    Field names to serialize for a projection, or for an explicit ``fields``
+    list. Raises ValueError for unknown projections or fields.
+    """
+    if projection not in ITEM_PROJECTIONS:
+        raise ValueError(
+            f"Unknown projection {projection!r}, expected one of "
+            f"{', '.join(ITEM_PROJECTIONS)}"
+        )
+    if not fields:
+        return ITEM_PROJECTIONS[projection]
+
+    unknown = [name for name in fields if name not in ITEM_PROJECTIONS["detail"]]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # The id always comes along so clients can key and paginate results
+    return tuple(dict.fromkeys(["id", *fields]))
+
+
+def item_load_options(projection="detail", fields=None):
+    """
+    Query option loading just the columns a projection serializes, e.g.
+    ``Item.query.options(item_load_options("card"))``.
+    """
+    columns = dict.fromkeys(
+        column
+        for name in item_fields(projection, fields)
+        for column in ITEM_FIELDS[name][0]
+    )
+    return load_only(*(getattr(Item, column) for column in columns))
+
+
+def search_vector_expression(title, brand, category, description, tags):
+    """
+    Build the weighted tsvector SQL expression for an item.
+
+    Arguments may be column expressions (for set-based backfills) or plain
+    values; ``tags`` must already be flattened to a space separated string.
+    """
+    values = {
+        "title": title,
+        "brand": brand,
+        "category": category,
+        "tags": tags,
+        "description": description,
+    }
+    vector = None
+    for field, weight in SEARCH_VECTOR_WEIGHTS.items():
+        weighted = func.setweight(
+            func.to_tsvector(
+                config.SEARCH_TEXT_CONFIG, func.coalesce(values[field], "")
+            ),
+            weight,
+        )
+        vector = weighted if vector is None else vector.op("||")(weighted)
+    return vector
+
+
+@event.listens_for(Item, "before_insert")
+@event.listens_for(Item, "before_update")
+def _refresh_search_vector(mapper, connection, target):
+    """Recompute search_vector when any of its source columns change."""
+    state = inspect(target)
+    if state.persistent and not any(
+        state.attrs[field].history.has_changes() for field in SEARCH_VECTOR_WEIGHTS
+    ):
+        return
+
+    target.search_vector = search_vector_expression(
+        title=target.title,
+        brand=target.brand,
+        category=target.category,
+        description=target.description,
+        tags=" ".join(target.tags or []),
+    )
+
+
+def color_index_values(dominant_colors):
+    """``(color_lab, color_cells)`` for a list of hex codes"""
+    labs = []
+    for hex_code in (dominant_colors or [])[:COLOR_INDEX_MAX_COLORS]:
+        try:
+            labs.append(hex_to_lab(hex_code))
+        except ValueError:
+            continue
+    if not labs:
+        return None, None
+    cells = lab_cells(labs, config.COLOR_GRID_SIZE)
+    flat = [round(float(value), 2) for lab in labs for value in lab]
+    return flat, sorted(set(cells))
+
+
+@event.listens_for(Item, "before_insert")
+@event.listens_for(Item, "before_update")
+def _refresh_color_index(mapper, connection, target):
+    """Recompute color_lab and color_cells when dominant_colors changes."""
+    state = inspect(target)
+    if state.persistent and not state.attrs.dominant_colors.history.has_changes():
+        return
+
+    target.color_lab, target.color_cells = color_index_values(target.dominant_colors)
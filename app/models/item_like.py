@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.extensions import db
+
+
+class ItemLike(db.Model):
+    """One user's like of an item; items.likes_count is the buffered tally."""
+
+    __tablename__ = "item_likes"
+
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("users.id"), primary_key=True)
+    item_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("items.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,  # Recounting an item's likes
+    )
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ItemLike {self.user_id} {self.item_id}>"
@@ -2,16 +2,20 @@ import uuid
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import JSON
+from sqlalchemy import JSON, func
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import joinedload, load_only
 
 from app.extensions import db
+from app.models.clothing_item import Item
+from app.models.user import User
 
 
 class NotificationType(Enum):
     BID_RECEIVED = "bid_received"
     BID_OUTBID = "bid_outbid"
     AUCTION_WON = "auction_won"
+    AUCTION_SOLD = "auction_sold"
     AUCTION_EXPIRED = "auction_expired"
     SIZE_RESTOCK = "size_restock"  # For saved searches
     SYSTEM_MESSAGE = "system_message"
@@ -28,6 +32,7 @@ class Notification(db.Model):
         UUID(as_uuid=True),
         db.ForeignKey("items.id"),
         nullable=True,  # Some notifications won't link to items
+        index=True,
     )
     actor_id = db.Column(
         UUID(as_uuid=True),
@@ -35,11 +40,40 @@ class Notification(db.Model):
         nullable=True,  # System-generated notifs won't have an actor
     )
 
-    notification_data = db.Column(JSON, nullable=True)
+    notification_data = db.Column(JSON, nullable=True)  # The latest event's
+
+    # Events merged into this row; repeats of a type, item and recipient within
+    # one coalescing window (starting at window_start) share a row
+    count = db.Column(db.Integer, default=1, server_default="1", nullable=False)
+    window_start = db.Column(db.DateTime, nullable=True)
 
     is_read = db.Column(db.Boolean, default=False, index=True)
+    # Waiting for the next email digest
+    email_pending = db.Column(
+        db.Boolean, default=True, server_default="false", nullable=False
+    )
     created_at = db.Column(
-        db.DateTime, default=datetime.utcnow, index=True  # For sorting
+        db.DateTime, default=datetime.utcnow, index=True  # Latest event, for sorting
+    )
+
+    __table_args__ = (
+        # Keyset pagination of a user's notifications, newest first
+        db.Index("ix_notifications_user_created_at", "user_id", "created_at", "id"),
+        # The coalescing upsert's conflict target; rows without a window
+        # (or an item) never merge
+        db.Index(
+            "ux_notifications_coalesce",
+            "user_id",
+            "type",
+            "item_id",
+            "window_start",
+            unique=True,
+        ),
+        db.Index(
+            "ix_notifications_email_pending",
+            "user_id",
+            postgresql_where=db.text("email_pending"),
+        ),
     )
 
     user = db.relationship("User", foreign_keys=[user_id])
@@ -51,6 +85,7 @@ class Notification(db.Model):
             "id": str(self.id),
             "type": self.type.value,
             "is_read": self.is_read,
+            "count": self.count,
             "created_at": self.created_at.isoformat(),
             "preview": self._generate_preview(),
         }
@@ -59,7 +94,7 @@ class Notification(db.Model):
             base["item"] = {
                 "id": str(self.item_id),
                 "title": self.item.title if self.item else "[Deleted]",
-                "image": self.item.images[0] if self.item else None,
+                "image": self.item.image_url if self.item else None,
             }
 
         if self.actor_id:
@@ -75,15 +110,45 @@ class Notification(db.Model):
             NotificationType.BID_RECEIVED: "New bid on your item",
             NotificationType.BID_OUTBID: "You've been outbid",
             NotificationType.AUCTION_WON: "You won the auction!",
+            NotificationType.AUCTION_SOLD: "Your item was sold!",
             NotificationType.AUCTION_EXPIRED: "Your auction ended unsold",
             NotificationType.SIZE_RESTOCK: "New items in your size",
         }
-        return previews.get(self.type, "New notification")
+        preview = previews.get(self.type, "New notification")
+        return f"{preview} ({self.count})" if self.count and self.count > 1 else preview
 
     def mark_read(self):
         if not self.is_read:
             self.is_read = True
+            User.query.filter_by(id=self.user_id).update(
+                {
+                    "unread_notifications": func.greatest(
+                        User.unread_notifications - 1, 0
+                    )
+                }
+            )
             db.session.commit()
 
     def __repr__(self):
         return f"<Notification {self.type} for {self.user_id}>"
+
+
+def notification_feed_options():
+    """
+    Query options loading a feed page in one query: the columns ``to_dict``
+    reads, with each row's item and actor joined in rather than lazy-loaded
+    one by one, e.g. ``Notification.query.options(*notification_feed_options())``.
+    """
+    return (
+        load_only(
+            Notification.id,
+            Notification.type,
+            Notification.item_id,
+            Notification.actor_id,
+            Notification.count,
+            Notification.is_read,
+            Notification.created_at,
+        ),
+        joinedload(Notification.item).load_only(Item.id, Item.title, Item.image_url),
+        joinedload(Notification.actor).load_only(User.id, User.username),
+    )
@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import JSON
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.extensions import db
+
+
+class OutboxEvent(db.Model):
+    """A Celery task to publish, written in the transaction that called for it."""
+
+    __tablename__ = "outbox_events"
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    task = db.Column(db.String(200), nullable=False)  # Registered task name
+    args = db.Column(JSON, nullable=False, default=list)
+    kwargs = db.Column(JSON, nullable=False, default=dict)
+    task_id = db.Column(UUID(as_uuid=True), nullable=False, default=uuid.uuid4)
+    # Pending events with the same key collapse into one
+    dedup_key = db.Column(db.String(255), unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<OutboxEvent {self.id} {self.task}>"
@@ -47,7 +47,13 @@ class User(db.Model):
     payout_hold = db.Column(db.Boolean, default=True)  # For new sellers
     completed_sales = db.Column(db.Integer, default=0)
 
-    temp_balance_hold = db.Column(db.Float, default=0.0)
+    balance = db.Column(db.Float, default=0.0, server_default="0", nullable=False)
+    temp_balance_hold = db.Column(db.Float, default=0.0)  # Held for leading bids
+
+    # Unread notifications, kept in step with the notification rows
+    unread_notifications = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
 
     # New size preference fields
     body_type = db.Column(db.String(20))  # apple/pear/rectangle
@@ -60,7 +66,9 @@ class User(db.Model):
     )
 
     # Relationships
-    items = db.relationship("Item", backref="owner", lazy=True)
+    items = db.relationship(
+        "Item", foreign_keys="Item.user_id", backref="owner", lazy=True
+    )
     fits = db.relationship("Fit", backref="creator", lazy=True)
     bids = db.relationship("Bid", backref="bidder", lazy=True)
     notifications = db.relationship(
@@ -1,7 +1,8 @@
 from datetime import datetime
 from bson import ObjectId
-from app.extensions import privacy_vault
-from app.utils.encryption import encrypt_data, decrypt_data
+from pymongo import ASCENDING, UpdateOne
+from app import extensions
+from app.utils.encryption import blind_index, encrypt_data, decrypt_data
 
 
 class UserPrivacy:
@@ -10,7 +11,8 @@ class UserPrivacy:
     @classmethod
     def get_collection(cls):
         if cls._collection is None:
-            cls._collection = privacy_vault.user_privacy
+            # Read through the module: privacy_vault is only set by init_extensions
+            cls._collection = extensions.privacy_vault.user_privacy
         return cls._collection
 
     @classmethod
@@ -39,6 +41,7 @@ class UserPrivacy:
         encrypted_data = {
             "user_id": str(user_id),
             "email": encrypt_data(email),
+            "email_index": blind_index(email),
             "phone": encrypt_data(phone) if phone else None,
             "address": encrypt_data(address) if address else None,
             "payment_info": encrypt_data(payment_info) if payment_info else None,
@@ -51,18 +54,55 @@ class UserPrivacy:
 
     @classmethod
     def get_by_email(cls, email):
-        """Find user privacy data by email"""
-        # Since email is encrypted, we need to search through all documents
-        # This is not efficient for large datasets, consider adding an index
-        for doc in cls.get_collection().find():
-            try:
-                decrypted_email = decrypt_data(doc["email"])
-                if decrypted_email == email:
-                    return cls._decrypt_document(doc)
-            except Exception:
-                continue
+        """Find user privacy data by email, via its blind index"""
+        doc = cls.get_collection().find_one({"email_index": blind_index(email)})
+        if doc:
+            return cls._decrypt_document(doc)
         return None
 
+    @classmethod
+    def ensure_indexes(cls):
+        """Create the vault's indexes (idempotent)"""
+        cls.get_collection().create_index(
+            [("email_index", ASCENDING)],
+            name="email_index_unique",
+            unique=True,
+            # Documents not yet backfilled have no index value
+            partialFilterExpression={"email_index": {"$type": "string"}},
+        )
+
+    @classmethod
+    def backfill_email_index(cls, batch_size=500):
+        """
+        Add ``email_index`` to documents written before it existed.
+        Returns the number of documents updated.
+        """
+        collection = cls.get_collection()
+        updated = 0
+        while True:
+            docs = list(
+                collection.find(
+                    {"email_index": {"$exists": False}, "email": {"$ne": None}},
+                    {"email": 1},
+                ).limit(batch_size)
+            )
+            if not docs:
+                return updated
+            operations = []
+            for doc in docs:
+                try:
+                    email_index = blind_index(decrypt_data(doc["email"]))
+                except Exception as e:
+                    # Mark it so the next batch doesn't pick it up again
+                    print(f"Could not decrypt email of privacy doc {doc['_id']}: {e}")
+                    email_index = None
+                operations.append(
+                    UpdateOne(
+                        {"_id": doc["_id"]}, {"$set": {"email_index": email_index}}
+                    )
+                )
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+
     @classmethod
     def get_by_user_id(cls, user_id):
         doc = cls.get_collection().find_one({"user_id": str(user_id)})
@@ -102,6 +142,8 @@ class UserPrivacy:
                 and value is not None
             ):
                 update_data[key] = encrypt_data(value)
+                if key == "email":
+                    update_data["email_index"] = blind_index(value)
 
         if update_data:
             update_data["updated_at"] = datetime.utcnow()
@@ -10,6 +10,7 @@ from .notification import notification_bp
 from .search import search_bp
 from .user import user_bp
 from .webhooks import webhooks_bp
+from . import live  # noqa: F401 (registers the Socket.IO event handlers)
 
 
 def register_routes(app: Flask):
@@ -1,11 +1,14 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
+from app.extensions import db
 from app.services.ai_service import (
     ai_service,
 )
-
-from app.tasks import generate_item_embedding_task
+from app.services.outbox import outbox
+from app.tasks import enrich_item_task, generate_item_embedding_task
+from app.utils.pagination import cursor_params
+from app.utils.projection import ItemProjection
 
 ai_bp = Blueprint("ai", __name__)
 
@@ -24,14 +27,17 @@ def embed_item(item_id):
     """
     user_id = get_jwt_identity()
 
-    # Trigger async task for embedding generation
-    task = generate_item_embedding_task(item_id)
+    # Queue the embedding task; the outbox relay publishes it
+    task_id = outbox.enqueue(
+        generate_item_embedding_task, [item_id], dedup_key=f"embed_item:{item_id}"
+    )
+    db.session.commit()
 
     return (
         jsonify(
             {
                 "message": "Embedding generation started",
-                "task_id": task.id,
+                "task_id": task_id,
             }
         ),
         202,
@@ -52,10 +58,13 @@ def tag_item(item_id):
     """
     user_id = get_jwt_identity()
 
-    # Trigger async task for tag generation
-    task = ai_service.generate_item_tags.delay(item_id)
+    # Trigger the enrichment pipeline, which generates tags among the rest
+    task_id = outbox.enqueue(
+        enrich_item_task, [item_id], dedup_key=f"enrich_item:{item_id}"
+    )
+    db.session.commit()
 
-    return jsonify({"message": "Tag generation started", "task_id": task.id}), 202
+    return jsonify({"message": "Tag generation started", "task_id": task_id}), 202
 
 
 @ai_bp.route("/ai/recommendations", methods=["GET"])
@@ -67,6 +76,11 @@ def get_personalized_recommendations():
     Query Parameters:
     - page: Page number for pagination (default: 1)
     - per_page: Number of items per page (default: 20)
+    - cursor: Opaque cursor from ``next_cursor``; switches to cursor pagination
+      (pass it empty for the first page)
+    - with_total: With cursor, also return an estimated total (default: false)
+    - projection: Item representation, "card" (default) or "detail"
+    - fields: Comma-separated item fields to return instead of a projection
 
     Returns:
     - JSON response with paginated recommendations
@@ -75,8 +89,22 @@ def get_personalized_recommendations():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
+    projection = ItemProjection.from_args(request.args)
+
+    cursor_mode = cursor_params(request.args)
+    if cursor_mode:
+        cursor, with_total = cursor_mode
+        recommendations = ai_service.get_recommendations_page(
+            user_id=user_id,
+            cursor=cursor,
+            per_page=per_page,
+            with_total=with_total,
+            projection=projection,
+        )
+        return jsonify(recommendations), 200
+
     recommendations = ai_service.get_recommendations(
-        user_id=user_id, page=page, per_page=per_page
+        user_id=user_id, page=page, per_page=per_page, projection=projection
     )
 
     return jsonify(recommendations), 200
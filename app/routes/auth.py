@@ -14,6 +14,7 @@ from app.extensions import db
 from app.models import User
 from app.models.user_privacy import UserPrivacy
 from app.models.token_blocklist import TokenBlocklist
+from app.services.token_revocation import token_revocation
 
 
 class UserStatus(Enum):
@@ -135,10 +136,17 @@ def logout():
     if existing_token:
         return jsonify({"message": "Token already invalidated"}), 200
 
-    # Add token to blocklist
+    # Tell every worker's revocation cache, then commit the blocklist row
+    # (the authoritative store); a revocation they can't hear about fails
     blocklist_entry = TokenBlocklist(jti=jti, expires_at=exp)
     db.session.add(blocklist_entry)
-    db.session.commit()
+    try:
+        token_revocation.revoke(jti, exp)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error logging out token {jti}: {e}")
+        return jsonify({"error": "Failed to log out"}), 500
 
     return jsonify({"message": "Successfully logged out"}), 200
 
@@ -1,12 +1,13 @@
-from datetime import datetime, timedelta
-from app.models.clothing_item import AuctionStatus, Item
-from app.models.user import User
+from datetime import datetime
+
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
-from app.extensions import db
-
-from app.models.bid import Bid, BidStatus
+from app.models.bid import Bid
+from app.services.auction_book import auction_book
+from app.services.auction_events import auction_events
+from app.services.notification_service import notification_service
+from app.services.trending import trending
 
 bid_bp = Blueprint("bid", __name__)
 
@@ -21,61 +22,41 @@ def create_bid():
 
     if not amount or not item_id:
         return jsonify({"error": "Amount and item_id are required"}), 400
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+        return jsonify({"error": "Amount must be a positive number"}), 400
 
-    # Check if the item is still active
-    item = Item.query.get_or_404(item_id)
-    if item.auction_status != AuctionStatus.ACTIVE:
-        return jsonify({"error": "Item is not active"}), 400
-
-    # Check if the user has enough balance
-    user = User.query.get_or_404(user_id)
-    if user.balance < amount + user.temp_balance_hold:
-        return jsonify({"error": "Insufficient balance"}), 400
-
-    # Check if the bid is higher than the current bid
-    if item.auction_current_bid and amount <= item.auction_current_bid:
-        return jsonify({"error": "Bid must be higher than current bid"}), 400
-
-    # Create new bid with proper status and expiration
-    bid = Bid(
-        amount=amount,
-        user_id=user_id,
-        item_id=item_id,
-        status=BidStatus.RESERVED,  # Initial status
-        status_updated_at=datetime.utcnow(),
-        expires_at=datetime.utcnow() + timedelta(hours=24),  # 24-hour expiration
-    )
-
-    # Update item's current bid information
-    item.auction_current_bid = amount
-    item.auction_current_bidder_id = user_id
-    item.auction_current_bid_at = datetime.utcnow()
-
-    # Put a hold on the user's account for the bid amount
-    user.temp_balance_hold += amount
-
+    # The item, balance and current-bid checks happen atomically (in the
+    # database, or the auction book for a closing auction), so concurrent
+    # bids cannot both win the same price level
     try:
-        db.session.add(bid)
-        db.session.commit()
+        result = auction_book.place_bid(user_id, item_id, round(float(amount), 2))
+    except Exception as e:
+        print(f"Error placing bid on item {item_id}: {e}")
+        return jsonify({"error": "Failed to create bid"}), 500
 
+    if result.status == "not_found":
+        return jsonify({"error": "Item not found"}), 404
+    if result.status == "not_active":
+        return jsonify({"error": "Item is not active"}), 400
+    if result.status == "insufficient_balance":
+        return jsonify({"error": "Insufficient balance"}), 400
+    if result.status == "outbid":
         return (
             jsonify(
                 {
-                    "message": "Bid created successfully",
-                    "bid": {
-                        "id": str(bid.id),
-                        "amount": bid.amount,
-                        "status": bid.status.value,
-                        "expires_at": bid.expires_at.isoformat(),
-                        "created_at": bid.created_at.isoformat(),
-                    },
+                    "error": "Bid must be higher than current bid",
+                    "current_bid": result.current_bid,
                 }
             ),
-            201,
+            409,
         )
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": "Failed to create bid"}), 500
+
+    auction_events.bid_placed(item_id, user_id, result)
+    trending.record(item_id, "bid")
+    notification_service.send_bid_notifications(
+        item_id, user_id, result.bid["amount"], result.outbid_user_id
+    )
+    return jsonify({"message": "Bid created successfully", "bid": result.bid}), 201
 
 
 @bid_bp.route("/bids/<string:bid_id>", methods=["GET"])
@@ -99,3 +80,33 @@ def get_user_bids():
         ),
         200,
     )
+
+
+@bid_bp.route("/items/<uuid:item_id>/bids", methods=["GET"])
+def get_item_bids(item_id):
+    """Bid history, newest (and highest) first."""
+    limit = min(request.args.get("limit", 50, type=int), 200)
+    history = auction_book.history(item_id, limit)
+    if history is not None:
+        bids = [
+            {
+                "id": bid["id"],
+                "amount": bid["amount"],
+                "user_id": bid["user_id"],
+                "created_at": datetime.utcfromtimestamp(bid["created_at"]).isoformat(),
+            }
+            for bid in history
+        ]
+    else:
+        bids = [
+            {
+                "id": str(bid.id),
+                "amount": bid.amount,
+                "user_id": str(bid.user_id),
+                "created_at": bid.created_at.isoformat(),
+            }
+            for bid in Bid.query.filter_by(item_id=item_id)
+            .order_by(Bid.amount.desc())
+            .limit(limit)
+        ]
+    return jsonify({"bids": bids}), 200
@@ -2,7 +2,10 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from app.models.clothing_item import Item
-from app.services.recommendation_service import RecommendationEngine
+from app.services.recommendation_cache import recommendation_cache
+from app.services.trending import trending
+from app.utils.pagination import cursor_params, keyset_paginate
+from app.utils.projection import ItemProjection
 
 feed_bp = Blueprint("feed", __name__)
 
@@ -14,8 +17,8 @@ def get_home_feed():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
-    # Get personalized recommendations
-    recommendation = RecommendationEngine.recommend_outfit(user_id)
+    # Get personalized recommendations, precomputed when the cache has them
+    recommendation = recommendation_cache.get(user_id)
 
     if "error" in recommendation:
         return jsonify({"error": recommendation["error"]}), 400
@@ -38,17 +41,33 @@ def get_trending_feed():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
-    # Get trending items based on likes and recent activity
-    items = (
-        Item.query.filter_by(is_public=True)
-        .order_by(Item.likes_count.desc(), Item.created_at.desc())
-        .paginate(page=page, per_page=per_page)
+    # Items by time-decayed engagement (bids, likes and views); the top
+    # pages come precomputed from the trending service's cache
+    projection = ItemProjection.from_args(request.args)
+    cursor_mode = cursor_params(request.args)
+    if not cursor_mode:
+        cached = trending.page(projection, page, per_page)
+        if cached is not None:
+            return jsonify(cached), 200
+
+    query = Item.query.filter_by(is_public=True).options(projection.load_options)
+    order_by = [(column, True) for column in trending.ORDER_BY]
+
+    if cursor_mode:
+        cursor, with_total = cursor_mode
+        items = keyset_paginate(
+            query, order_by, cursor=cursor, per_page=per_page, with_total=with_total
+        )
+        return jsonify(items.to_dict(serialize=projection.serialize)), 200
+
+    items = query.order_by(*(column.desc() for column, _ in order_by)).paginate(
+        page=page, per_page=per_page
     )
 
     return (
         jsonify(
             {
-                "items": [item.to_dict() for item in items.items],
+                "items": [projection.serialize(item) for item in items.items],
                 "total": items.total,
                 "pages": items.pages,
                 "current_page": items.page,
@@ -65,9 +84,9 @@ def get_recommendations():
     occasion = request.args.get("occasion")
     weather = request.args.get("weather")
 
-    # Get contextual recommendations
-    recommendation = RecommendationEngine.recommend_outfit(
-        user_id=user_id, occasion=occasion, weather=weather
+    # Get contextual recommendations, precomputed when the cache has them
+    recommendation = recommendation_cache.get(
+        user_id, occasion=occasion, weather=weather
     )
 
     if "error" in recommendation:
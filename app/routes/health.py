@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify
 from sqlalchemy import text
 
 from app.extensions import db
+from app.services.token_revocation import token_revocation
 
 health_bp = Blueprint("health", __name__)
 
@@ -33,3 +34,9 @@ def healthcheck():
             ),
             500,
         )
+
+
+@health_bp.route("/health/metrics", methods=["GET"])
+def metrics():
+    """In-process cache metrics for this worker"""
+    return jsonify({"token_revocation": token_revocation.metrics()}), 200
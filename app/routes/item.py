@@ -1,13 +1,25 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import undefer
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 
 from app.extensions import db
 from app.models.clothing_item import Item, AuctionStatus
+from app.models.item_like import ItemLike
 
 from app.services.ai_service import ai_service
+from app.services.auction_book import auction_book
+from app.services.auction_scheduler import auction_scheduler
+from app.services.engagement import engagement
+from app.services.outbox import outbox
+from app.services.recommendation_cache import recommendation_cache
+from app.tasks import enrich_item_task
 from app.utils.image_handler import image_handler
+from app.utils.pagination import cursor_params, keyset_paginate
+from app.utils.projection import ItemProjection
 
 item_bp = Blueprint("item", __name__)
 
@@ -17,16 +29,29 @@ def list_items():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
-    items = (
-        Item.query.filter_by(is_public=True)
-        .order_by(Item.created_at.desc())
-        .paginate(page=page, per_page=per_page)
+    projection = ItemProjection.from_args(request.args)
+    query = Item.query.filter_by(is_public=True).options(projection.load_options)
+
+    cursor_mode = cursor_params(request.args)
+    if cursor_mode:
+        cursor, with_total = cursor_mode
+        items = keyset_paginate(
+            query,
+            [(Item.created_at, True), (Item.id, True)],
+            cursor=cursor,
+            per_page=per_page,
+            with_total=with_total,
+        )
+        return jsonify(items.to_dict(serialize=projection.serialize)), 200
+
+    items = query.order_by(Item.created_at.desc(), Item.id.desc()).paginate(
+        page=page, per_page=per_page
     )
 
     return (
         jsonify(
             {
-                "items": [item.to_dict() for item in items.items],
+                "items": [projection.serialize(item) for item in items.items],
                 "total": items.total,
                 "pages": items.pages,
                 "current_page": items.page,
@@ -94,12 +119,15 @@ def create_item():
         )
 
         db.session.add(item)
-        db.session.commit()
+        db.session.flush()
 
-        # Trigger async tasks for AI processing
-        ai_service.generate_item_embedding.delay(item.id)
-        ai_service.generate_item_tags.delay(item.id)
-        ai_service.extract_dominant_colors.delay(item.id)
+        # Trigger the AI enrichment pipeline (tags, colors, style, embedding)
+        # once the item is committed, through the outbox
+        outbox.enqueue(
+            enrich_item_task, [str(item.id)], dedup_key=f"enrich_item:{item.id}"
+        )
+        db.session.commit()
+        recommendation_cache.invalidate(user_id)
 
         return (
             jsonify({"message": "Item created successfully", "item": item.to_dict()}),
@@ -115,10 +143,107 @@ def create_item():
 
 @item_bp.route("/items/<string:item_id>", methods=["GET"])
 def get_item(item_id):
-    item = Item.query.get_or_404(item_id)
+    projection = ItemProjection.from_args(request.args, default="detail")
+    item = Item.query.options(projection.load_options).get_or_404(item_id)
     if not item.is_public:
         return jsonify({"error": "Item not found"}), 404
-    return jsonify(item.to_dict()), 200
+
+    engagement.incr(item.id, "views")
+    data = projection.serialize(item)
+    # During an auction's final minutes the book is ahead of the items row
+    current_bid = auction_book.current_bid(item.id)
+    if current_bid is not None:
+        if "auction_current_bid" in data:
+            data["auction_current_bid"] = current_bid
+        if "current_price" in data:
+            data["current_price"] = current_bid
+    return jsonify(data), 200
+
+
+@item_bp.route("/items/<uuid:item_id>/similar", methods=["GET"])
+def get_similar_items(item_id):
+    k = min(request.args.get("k", 10, type=int), 50)
+    projection = ItemProjection.from_args(request.args)
+
+    item = Item.query.options(undefer(Item.embedding)).get_or_404(item_id)
+    if not item.is_public:
+        return jsonify({"error": "Item not found"}), 404
+    if not item.embedding:
+        return jsonify({"items": []}), 200
+
+    # Over-fetch so private items can be dropped without a second lookup
+    matches = ai_service.find_similar_items(
+        item.embedding, k=k * 2, exclude=[str(item.id)]
+    )
+    scores = {item_id: score for item_id, score in matches}
+    similar = (
+        Item.query.options(projection.load_options)
+        .filter(Item.id.in_(list(scores)), Item.is_public == True)
+        .all()
+    )
+    similar.sort(key=lambda match: scores[str(match.id)], reverse=True)
+
+    return (
+        jsonify(
+            {
+                "items": [
+                    dict(projection.serialize(match), similarity=scores[str(match.id)])
+                    for match in similar[:k]
+                ]
+            }
+        ),
+        200,
+    )
+
+
+@item_bp.route("/items/<uuid:item_id>/like", methods=["POST"])
+@jwt_required()
+def like_item(item_id):
+    user_id = get_jwt_identity()
+    if not Item.query.filter_by(id=item_id, is_public=True).count():
+        return jsonify({"error": "Item not found"}), 404
+
+    liked = db.session.execute(
+        insert(ItemLike)
+        .values(user_id=user_id, item_id=item_id)
+        .on_conflict_do_nothing()
+        .returning(ItemLike.item_id)
+    ).first()
+    db.session.commit()
+    # Only a new like counts, so liking twice is harmless
+    if liked:
+        engagement.incr(item_id, "likes")
+    return jsonify({"liked": True}), 200
+
+
+@item_bp.route("/items/<uuid:item_id>/like", methods=["DELETE"])
+@jwt_required()
+def unlike_item(item_id):
+    user_id = get_jwt_identity()
+    unliked = db.session.execute(
+        delete(ItemLike)
+        .where(ItemLike.user_id == user_id, ItemLike.item_id == item_id)
+        .returning(ItemLike.item_id)
+    ).first()
+    db.session.commit()
+    if unliked:
+        engagement.incr(item_id, "likes", -1)
+    return jsonify({"liked": False}), 200
+
+
+@item_bp.route("/items/<uuid:item_id>/worn", methods=["POST"])
+@jwt_required()
+def mark_item_worn(item_id):
+    """Record that the owner wore the item today, so outfits rotate it out."""
+    user_id = get_jwt_identity()
+    item = Item.query.get_or_404(item_id)
+    if str(item.user_id) != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    item.last_worn_at = datetime.utcnow()
+    db.session.commit()
+    recommendation_cache.invalidate(user_id)
+    return jsonify({"last_worn_at": item.last_worn_at.isoformat()}), 200
 
 
 @item_bp.route("/items/<string:item_id>", methods=["PATCH"])
@@ -147,6 +272,7 @@ def update_item(item_id):
         item.cloudinary_public_id = upload_result["public_id"]
 
     db.session.commit()
+    recommendation_cache.invalidate(item.user_id)
     return jsonify(item.to_dict()), 200
 
 
@@ -161,6 +287,10 @@ def delete_item(item_id):
 
     db.session.delete(item)
     db.session.commit()
+    recommendation_cache.invalidate(item.user_id)
+    ai_service.remove_from_index(item_id)
+    auction_scheduler.cancel(item_id)
+    auction_book.close(item_id)
     return jsonify({"message": "Item deleted successfully"}), 200
 
 
@@ -190,8 +320,12 @@ def start_auction(item_id):
         return jsonify({"error": "Item already has an active auction"}), 400
 
     try:
-        # Parse auction end time
+        # Parse auction end time, stored as naive UTC
         auction_ends_at = datetime.fromisoformat(data.get("auction_ends_at"))
+        if auction_ends_at.tzinfo is not None:
+            auction_ends_at = auction_ends_at.astimezone(timezone.utc).replace(
+                tzinfo=None
+            )
 
         # Update item with auction details
         item.auction_start_price = data.get("auction_start_price")
@@ -201,6 +335,8 @@ def start_auction(item_id):
         item.auction_current_bidder_id = None  # Reset current bidder
 
         db.session.commit()
+        auction_scheduler.schedule(item.id, auction_ends_at)
+        recommendation_cache.invalidate(item.user_id)
 
         return (
             jsonify(
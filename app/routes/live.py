@@ -0,0 +1,97 @@
+import uuid
+from datetime import datetime
+
+from flask_jwt_extended import decode_token
+from flask_socketio import join_room, leave_room, rooms
+
+from app.extensions import socketio
+from app.models.clothing_item import Item
+from app.services.auction_book import auction_book
+from app.services.auction_events import item_room, user_room
+from app.services.engagement import engagement
+from app.services.token_revocation import token_revocation
+
+
+@socketio.on("connect")
+def connect(auth=None):
+    """
+    Anyone may connect to watch items. A client that sends its access token
+    (``auth={"token": ...}``) also joins its own room for ``outbid`` events.
+    """
+    token = (auth or {}).get("token")
+    if not token:
+        return
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return False  # Refuse the connection rather than ignore a bad token
+    if token_revocation.is_revoked(claims["jti"]):
+        return False
+    join_room(user_room(claims["sub"]))
+
+
+def _item_id(data):
+    try:
+        return uuid.UUID(str((data or {}).get("item_id")))
+    except ValueError:
+        return None
+
+
+@socketio.on("watch")
+def watch(data):
+    """Join an item's room; the ack carries its current auction state."""
+    item_id = _item_id(data)
+    item = (
+        Item.query.with_entities(
+            Item.auction_status,
+            Item.auction_current_bid,
+            Item.auction_start_price,
+            Item.auction_ends_at,
+        )
+        .filter(Item.id == item_id, Item.is_public == True)
+        .first()
+        if item_id
+        else None
+    )
+    if item is None:
+        return {"error": "Item not found"}
+
+    if item_room(item_id) not in rooms():
+        join_room(item_room(item_id))
+        engagement.incr(item_id, "watchers")
+    current_bid = auction_book.current_bid(item_id)
+    if current_bid is None and item.auction_current_bid is not None:
+        current_bid = float(item.auction_current_bid)
+    return {
+        "item_id": str(item_id),
+        "auction_status": item.auction_status and item.auction_status.value,
+        "auction_current_bid": current_bid,
+        "auction_start_price": (
+            float(item.auction_start_price)
+            if item.auction_start_price is not None
+            else None
+        ),
+        "auction_ends_at": item.auction_ends_at and item.auction_ends_at.isoformat(),
+        "time_remaining": (
+            max(0, (item.auction_ends_at - datetime.utcnow()).total_seconds())
+            if item.auction_ends_at
+            else None
+        ),
+    }
+
+
+@socketio.on("unwatch")
+def unwatch(data):
+    item_id = _item_id(data)
+    if item_id and item_room(item_id) in rooms():
+        leave_room(item_room(item_id))
+        engagement.incr(item_id, "watchers", -1)
+
+
+@socketio.on("disconnect")
+def disconnect(reason=None):
+    """Stop counting the client as a watcher of the items it still watched."""
+    prefix = item_room("")
+    for room in rooms():
+        if room.startswith(prefix):
+            engagement.incr(room[len(prefix) :], "watchers", -1)
@@ -3,6 +3,8 @@ from flask_jwt_extended import get_jwt_identity, jwt_required
 
 from app.extensions import db
 from app.models import Notification, User
+from app.models.notification import notification_feed_options
+from app.utils.pagination import cursor_params, keyset_paginate
 
 notification_bp = Blueprint("notification", __name__)
 
@@ -14,12 +16,26 @@ def get_notifications():
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
-    notifications = (
-        Notification.query.filter_by(user_id=user_id)
-        .order_by(Notification.created_at.desc())
-        .paginate(page=page, per_page=per_page)
+    query = Notification.query.filter_by(user_id=user_id).options(
+        *notification_feed_options()
     )
 
+    cursor_mode = cursor_params(request.args)
+    if cursor_mode:
+        cursor, with_total = cursor_mode
+        notifications = keyset_paginate(
+            query,
+            [(Notification.created_at, True), (Notification.id, True)],
+            cursor=cursor,
+            per_page=per_page,
+            with_total=with_total,
+        )
+        return jsonify(notifications.to_dict(key="notifications")), 200
+
+    notifications = query.order_by(
+        Notification.created_at.desc(), Notification.id.desc()
+    ).paginate(page=page, per_page=per_page)
+
     return (
         jsonify(
             {
@@ -40,14 +56,35 @@ def get_notifications():
 def mark_all_read():
     user_id = get_jwt_identity()
 
-    Notification.query.filter_by(user_id=user_id, is_read=False).update(
+    read = Notification.query.filter_by(user_id=user_id, is_read=False).update(
         {"is_read": True}
     )
+    if read:
+        # Subtract what this marked: rows arriving meanwhile stay counted
+        User.query.filter_by(id=user_id).update(
+            {
+                "unread_notifications": db.func.greatest(
+                    User.unread_notifications - read, 0
+                )
+            }
+        )
 
     db.session.commit()
     return jsonify({"message": "All notifications marked as read"}), 200
 
 
+@notification_bp.route("/notifications/unread-count", methods=["GET"])
+@jwt_required()
+def get_unread_count():
+    user_id = get_jwt_identity()
+    unread = (
+        User.query.with_entities(User.unread_notifications)
+        .filter_by(id=user_id)
+        .scalar()
+    )
+    return jsonify({"unread_count": unread or 0}), 200
+
+
 @notification_bp.route("/notifications/token", methods=["POST"])
 @jwt_required()
 def register_push_token():
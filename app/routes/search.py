@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
-from app.services.search_service import search_service
+from app.config import config
+from app.services.search_service import HEX_COLOR_RE, search_service
 from app.services.ai_service import ai_service
 from app.utils.decorators import handle_errors
+from app.utils.pagination import InvalidCursor, cursor_params
+from app.utils.projection import InvalidProjection, ItemProjection
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
 search_bp = Blueprint("search", __name__)
@@ -16,55 +19,83 @@ def search_items():
     Query Parameters:
     - q: Search query string
     - category: Filter by category (e.g., tops, bottoms, shoes)
-    - color: Filter by color
+    - color: Filter by color (hex code, e.g. %23223355)
+    - color_tolerance: Match colors within this delta E of color instead of
+      exactly, ranked by closeness
     - brand: Filter by brand
     - min_price: Minimum price
     - max_price: Maximum price
-    - sort: Sort field (e.g., price, created_at)
+    - sort: Sort field (e.g., price, created_at, relevance). Defaults to
+      relevance when q or color_tolerance is given, created_at otherwise
     - order: Sort order (asc or desc)
     - page: Page number for pagination
     - per_page: Items per page
+    - cursor: Opaque cursor from ``next_cursor``; switches to cursor pagination
+      (pass it empty for the first page)
+    - with_total: With cursor, also return an estimated total
+    - projection: Item representation, "card" (default) or "detail"
+    - fields: Comma-separated item fields to return instead of a projection
+    - facet_limit: Max values returned per facet (price ranges are never cut)
 
     Returns:
     - JSON response with search results and facets
     """
     # Get search parameters
     query = request.args.get("q", "")
-    category = request.args.get("category")
-    color = request.args.get("color")
-    brand = request.args.get("brand")
-    min_price = request.args.get("min_price", type=float)
-    max_price = request.args.get("max_price", type=float)
-    sort = request.args.get("sort", "created_at")
     order = request.args.get("order", "desc")
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
+    facet_limit = request.args.get("facet_limit", config.SEARCH_FACET_LIMIT, type=int)
 
-    # Build filters
-    filters = {}
-    if category:
-        filters["category"] = category
-    if color:
-        filters["color"] = color
-    if brand:
-        filters["brand"] = brand
-    if min_price is not None:
-        filters["min_price"] = min_price
-    if max_price is not None:
-        filters["max_price"] = max_price
+    filters = _search_filters()
+    error = _validate_filters(filters)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        projection = ItemProjection.from_args(request.args)
+    except InvalidProjection as e:
+        return jsonify({"error": e.description}), 400
+    ranked = query or "color_tolerance" in filters
+    sort = request.args.get("sort", "relevance" if ranked else "created_at")
 
     # Get search results
-    pagination = search_service.search_items(
-        query=query,
-        filters=filters,
-        sort=sort,
-        order=order,
-        page=page,
-        per_page=per_page,
-    )
+    cursor_mode = cursor_params(request.args)
+    if cursor_mode:
+        cursor, with_total = cursor_mode
+        try:
+            results = search_service.search_items_page(
+                query=query,
+                filters=filters,
+                sort=sort,
+                order=order,
+                cursor=cursor,
+                per_page=per_page,
+                with_total=with_total,
+                load_options=[projection.load_options],
+            ).to_dict(serialize=projection.serialize)
+        except InvalidCursor as e:
+            return jsonify({"error": e.description}), 400
+    else:
+        pagination = search_service.search_items(
+            query=query,
+            filters=filters,
+            sort=sort,
+            order=order,
+            page=page,
+            per_page=per_page,
+            load_options=[projection.load_options],
+        )
+        results = {
+            "items": [projection.serialize(item) for item in pagination.items],
+            "total": pagination.total,
+            "pages": pagination.pages,
+            "current_page": pagination.page,
+            "has_next": pagination.has_next,
+            "has_prev": pagination.has_prev,
+        }
 
     # Get facets for the current search
-    facets = search_service.get_facets(query=query, filters=filters)
+    facets = search_service.get_facets(query=query, filters=filters, limit=facet_limit)
 
     # Get tag suggestions if query is provided
     tag_suggestions = []
@@ -73,14 +104,7 @@ def search_items():
 
     return jsonify(
         {
-            "results": {
-                "items": [item.to_dict() for item in pagination.items],
-                "total": pagination.total,
-                "pages": pagination.pages,
-                "current_page": pagination.page,
-                "has_next": pagination.has_next,
-                "has_prev": pagination.has_prev,
-            },
+            "results": results,
             "facets": facets,
             "tag_suggestions": tag_suggestions,
             "page": page,
@@ -94,10 +118,52 @@ def search_items():
 def get_facets():
     """Get available facets for the current search results"""
     query = request.args.get("q", "")
-    facets = search_service.get_facets(query)
+    facet_limit = request.args.get("facet_limit", config.SEARCH_FACET_LIMIT, type=int)
+    filters = _search_filters()
+    error = _validate_filters(filters)
+    if error:
+        return jsonify({"error": error}), 400
+    facets = search_service.get_facets(query, filters=filters, limit=facet_limit)
     return jsonify(facets)
 
 
+def _search_filters():
+    """Build the search filter dict from the request query string"""
+    category = request.args.get("category")
+    color = request.args.get("color")
+    color_tolerance = request.args.get("color_tolerance", type=float)
+    brand = request.args.get("brand")
+    min_price = request.args.get("min_price", type=float)
+    max_price = request.args.get("max_price", type=float)
+
+    filters = {}
+    if category:
+        filters["category"] = category
+    if color:
+        filters["color"] = color
+        if color_tolerance is not None:
+            filters["color_tolerance"] = color_tolerance
+    if brand:
+        filters["brand"] = brand
+    if min_price is not None:
+        filters["min_price"] = min_price
+    if max_price is not None:
+        filters["max_price"] = max_price
+    return filters
+
+
+def _validate_filters(filters):
+    """Error message for filters the search service can't apply, or None"""
+    if "color_tolerance" in filters:
+        if not HEX_COLOR_RE.match(filters["color"]):
+            return "color must be a hex code like #223355 when color_tolerance is set"
+        if not 0 <= filters["color_tolerance"] <= config.COLOR_MAX_TOLERANCE:
+            return (
+                f"color_tolerance must be between 0 and {config.COLOR_MAX_TOLERANCE:g}"
+            )
+    return None
+
+
 @search_bp.route("/tags/suggestions", methods=["GET"])
 def get_suggestions():
     query = request.args.get("q", "")
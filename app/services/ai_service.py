@@ -1,4 +1,5 @@
-from typing import Any, Dict, List, Optional
+import json
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 
 # Import necessary components for Tools
@@ -10,8 +11,26 @@ from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmb
 from app.config import config
 from app.extensions import db
 from app.models.clothing_item import Item
+from app.services.color_service import color_service
+from app.services.llm_cache import cached_image_response
+from app.services.vector_index import vector_index
+from app.utils.image_cache import image_cache
+from app.utils.pagination import keyset_paginate
+from app.utils.projection import ItemProjection
 
 from google import genai
+from google.genai import types
+
+# Structured-output schema for analyze_item_image: one request, every attribute
+ITEM_ANALYSIS_FIELDS = ["tags", "style", "vibe", "objects"]
+ITEM_ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        field: {"type": "ARRAY", "items": {"type": "STRING"}}
+        for field in ITEM_ANALYSIS_FIELDS
+    },
+    "required": ITEM_ANALYSIS_FIELDS,
+}
 
 
 class AIService:
@@ -31,8 +50,12 @@ class AIService:
                 "Warning: GOOGLE_API_KEY not found in config. Please set it for AI services to work."
             )
 
+        # Model names are part of the response cache key
+        self.vision_model = "gemini-2.5-pro-preview"
+        self.structured_model = config.GEMINI_MODEL
+
         self.vision_llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro-preview",
+            model=self.vision_model,
             google_api_key=config.GOOGLE_API_KEY,
             temperature=0.4,  # Lower temperature for more focused, less creative outputs
         )
@@ -118,38 +141,156 @@ class AIService:
             # for the agent to understand how to call it.
         ]
 
-    def generate_embedding(self, image_url: str) -> List[float]:
+    def generate_embedding(
+        self,
+        image_url: Optional[str] = None,
+        image_bytes: Optional[bytes] = None,
+        mime_type: str = "image/jpeg",
+    ) -> List[float]:
         """
         Generates a numerical embedding vector for an image using Gemini's embedding model.
         This method is kept as embeddings can be useful for other purposes even without FAISS,
         e.g., for direct comparison within the application logic.
 
+        Pass ``image_bytes`` when the image is already downloaded; it is sent
+        inline, so Gemini does not fetch the URL a second time.
+
         Args:
             image_url (str): The URL of the image to generate the embedding for.
+            image_bytes (bytes): The encoded image, instead of ``image_url``.
+            mime_type (str): The MIME type of ``image_bytes``.
 
         Returns:
             List[float]: The generated embedding vector as a list of floats.
                          Returns an empty list if an error occurs.
         """
+        source = image_url or f"{len(image_bytes or b'')} inline bytes"
         try:
-            response = self.client.embed_content(
-                model="models/embedding-001",
-                content={"parts": [{"image_uri": image_url}]},
-                task_type="RETRIEVAL_DOCUMENT",
-            )
-            embedding = response["embedding"]
+            if image_bytes is not None:
+                response = self.client.models.embed_content(
+                    model=config.GEMINI_EMBEDDING_MODEL,
+                    contents=[
+                        types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+                    ],
+                    config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT"),
+                )
+                embedding = list(response.embeddings[0].values)
+            else:
+                response = self.client.embed_content(
+                    model="models/embedding-001",
+                    content={"parts": [{"image_uri": image_url}]},
+                    task_type="RETRIEVAL_DOCUMENT",
+                )
+                embedding = response["embedding"]
             print(
-                f"Successfully generated embedding of length {len(embedding)} for {image_url}"
+                f"Successfully generated embedding of length {len(embedding)} for {source}"
             )
             return embedding
         except Exception as e:
-            print(f"Error generating embedding for {image_url}: {e}")
+            print(f"Error generating embedding for {source}: {e}")
             return []
 
+    def add_to_index(self, embedding: List[float], item_id: str) -> None:
+        """
+        Adds (or replaces) an item's embedding in the shared vector index used for
+        visual similarity search.
+
+        Args:
+            embedding (List[float]): The item's embedding vector.
+            item_id (str): The ID of the item the embedding belongs to.
+        """
+        vector_index.add(item_id, embedding)
+        print(f"Added embedding for item {item_id} to the vector index")
+
+    def remove_from_index(self, item_id: str) -> None:
+        """
+        Removes an item from the vector index so it no longer shows up as similar.
+
+        Args:
+            item_id (str): The ID of the item to remove.
+        """
+        vector_index.delete(item_id)
+
+    def find_similar_items(
+        self, embedding: List[float], k: int = 10, exclude: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Finds the items whose embeddings are closest to the given one.
+
+        Args:
+            embedding (List[float]): The query embedding.
+            k (int): The maximum number of matches to return.
+            exclude (Optional[List[str]]): Item IDs to leave out (e.g. the query item).
+
+        Returns:
+            List[Tuple[str, float]]: (item_id, cosine similarity) pairs, most similar first.
+                                     Returns an empty list if an error occurs.
+        """
+        try:
+            return vector_index.search(embedding, k=k, exclude=exclude or ())
+        except Exception as e:
+            print(f"Error searching the vector index: {e}")
+            return []
+
+    @cached_image_response("analyze_item_image", model_attr="structured_model")
+    def analyze_item_image(
+        self, image_bytes: bytes, mime_type: str = "image/jpeg"
+    ) -> Dict[str, List[str]]:
+        """
+        Extracts tags, style, vibe and detected objects from an item
+        image in a single structured-output Gemini request. The image is sent inline,
+        so callers download it once and reuse the bytes.
+
+        Args:
+            image_bytes (bytes): The encoded image.
+            mime_type (str): The MIME type of ``image_bytes``.
+
+        Returns:
+            Dict[str, List[str]]: Lists keyed by "tags", "style", "vibe" and
+                                  "objects". Lists are empty if an error occurs.
+        """
+        prompt = """
+        As an **expert fashion analyst**, analyze the prominent clothing item or main outfit in this image and return JSON with:
+        - **tags**: specific tags covering item type, material, pattern, occasion, season, fit/cut, detailing, neckline and sleeve length where clearly applicable. Example: `t-shirt, cotton, solid, casual, summer, regular-fit, plain, crew-neck, short-sleeve`
+        - **style**: the 3-5 most relevant style terms. Example: `streetwear, urban, casual, athleisure, modern`
+        - **vibe**: 3-5 terms for the overall vibe or mood. Example: `casual, comfortable, relaxed, approachable`
+        - **objects**: only the distinct clothing items and accessories worn, no people or background. Example: `t-shirt, denim jacket, jeans, sneakers`
+        Use concise lowercase terms.
+        """
+        try:
+            response = self.client.models.generate_content(
+                model=self.structured_model,
+                contents=[
+                    types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                    prompt,
+                ],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=ITEM_ANALYSIS_SCHEMA,
+                    temperature=0.4,
+                ),
+            )
+            parsed = json.loads(response.text)
+            analysis = {
+                field: [
+                    str(value).strip().lower()
+                    for value in parsed.get(field) or []
+                    if str(value).strip()
+                ]
+                for field in ITEM_ANALYSIS_FIELDS
+            }
+            print(f"Analyzed item image: {analysis}")
+            return analysis
+        except Exception as e:
+            print(f"Error analyzing item image: {e}")
+            return {field: [] for field in ITEM_ANALYSIS_FIELDS}
+
     def generate_colors(self, image_url: str) -> List[str]:
         """
-        Identifies and lists the dominant colors present in the clothing items in an image
-        using Gemini-Pro-Vision.
+        Identifies and lists the dominant colors present in the clothing items in an image.
+
+        Colors are extracted locally by ``color_service``; Gemini is only asked when
+        the image can't be processed locally.
 
         Args:
             image_url (str): The URL of the image.
@@ -158,6 +299,27 @@ class AIService:
             List[str]: A list of dominant color names (e.g., ["red", "blue", "green"]).
                        Returns an empty list if an error occurs.
         """
+        try:
+            palette = color_service.extract_colors(image_cache.fetch(image_url))
+            if palette:
+                colors = list(dict.fromkeys(color["name"] for color in palette))
+                print(f"Extracted colors for {image_url}: {colors}")
+                return colors
+        except Exception as e:
+            print(f"Local color extraction failed for {image_url}, asking Gemini: {e}")
+        return self.generate_colors_with_llm(image_url)
+
+    @cached_image_response("generate_colors", model_attr="vision_model")
+    def generate_colors_with_llm(self, image_url: str) -> List[str]:
+        """
+        Fallback for ``generate_colors`` using Gemini-Pro-Vision.
+
+        Args:
+            image_url (str): The URL of the image.
+
+        Returns:
+            List[str]: A list of dominant color names. Returns an empty list if an error occurs.
+        """
         try:
             # Optimized Prompt
             prompt = "Analyze the clothing in this image. What are the dominant colors of the **clothing items**? List them as a concise, comma-separated list of common color names. Example: `navy blue, forest green, off-white`"
@@ -171,6 +333,7 @@ class AIService:
             print(f"Error generating colors for {image_url}: {e}")
             return []
 
+    @cached_image_response("get_clothing_style", model_attr="vision_model")
     def get_clothing_style(self, image_url: str) -> List[str]:
         """
         Determines the overall clothing style present in an image using Gemini-Pro-Vision.
@@ -204,6 +367,7 @@ class AIService:
             print(f"Error analyzing clothing style for {image_url}: {e}")
             return []
 
+    @cached_image_response("detect_objects_in_image", model_attr="vision_model")
     def detect_objects_in_image(self, image_url: str) -> List[str]:
         """
         Detects prominent objects within an image using Gemini-Pro-Vision, with a focus on clothing.
@@ -235,6 +399,7 @@ class AIService:
             print(f"Error detecting objects in {image_url}: {e}")
             return []
 
+    @cached_image_response("segment_image_for_clothing", model_attr="vision_model")
     def segment_image_for_clothing(self, image_url: str) -> List[str]:
         """
         Semantically segments and describes individual clothing parts worn by a person in an image.
@@ -272,6 +437,7 @@ class AIService:
             print(f"Error segmenting clothing parts for {image_url}: {e}")
             return []
 
+    @cached_image_response("get_clothing_vibe", model_attr="vision_model")
     def get_clothing_vibe(self, image_url: str) -> List[str]:
         """
         Determines the overall vibe or mood conveyed by the clothing in an image.
@@ -300,6 +466,7 @@ class AIService:
             print(f"Error getting clothing vibe for {image_url}: {e}")
             return []
 
+    @cached_image_response("generate_tags", model_attr="vision_model")
     def generate_tags(self, image_url: str) -> List[str]:
         """
         Generates descriptive tags for a clothing item using LLMChain for more structured output.
@@ -442,7 +609,11 @@ class AIService:
             return {}
 
     def get_recommendations(
-        self, user_id: str, page: int = 1, per_page: int = 10
+        self,
+        user_id: str,
+        page: int = 1,
+        per_page: int = 10,
+        projection: Optional[ItemProjection] = None,
     ) -> Dict[str, Any]:
         """
         Provides personalized item recommendations for a user with pagination.
@@ -453,6 +624,8 @@ class AIService:
             user_id (str): The ID of the user.
             page (int): The page number for pagination.
             per_page (int): The number of items per page.
+            projection (Optional[ItemProjection]): Item columns to load and return.
+                                                   Defaults to the "card" projection.
 
         Returns:
             Dict[str, Any]: A dictionary containing paginated results and metadata about the recommendations.
@@ -462,12 +635,17 @@ class AIService:
         print(
             f"Getting placeholder recommendations for user {user_id}, page {page}, per_page {per_page}"
         )
-        query = Item.query.filter(Item.is_public == True)
+        projection = projection or ItemProjection("card")
+        query = (
+            Item.query.filter(Item.is_public == True)
+            .options(projection.load_options)
+            .order_by(Item.created_at.desc(), Item.id.desc())
+        )
 
         pagination = query.paginate(page=page, per_page=per_page, error_out=False)
 
         return {
-            "items": [item.to_dict() for item in pagination.items],
+            "items": [projection.serialize(item) for item in pagination.items],
             "total": pagination.total,
             "pages": pagination.pages,
             "current_page": pagination.page,
@@ -475,6 +653,40 @@ class AIService:
             "has_prev": pagination.has_prev,
         }
 
+    def get_recommendations_page(
+        self,
+        user_id: str,
+        cursor: Optional[str] = None,
+        per_page: int = 10,
+        with_total: bool = False,
+        projection: Optional[ItemProjection] = None,
+    ) -> Dict[str, Any]:
+        """
+        Cursor-paginated variant of ``get_recommendations``.
+
+        Args:
+            user_id (str): The ID of the user.
+            cursor (Optional[str]): ``next_cursor`` from the previous page, if any.
+            per_page (int): The number of items per page.
+            with_total (bool): Include an estimated total.
+            projection (Optional[ItemProjection]): Item columns to load and return.
+
+        Returns:
+            Dict[str, Any]: The items plus ``next_cursor``/``has_next`` (and ``total``).
+        """
+        projection = projection or ItemProjection("card")
+        query = Item.query.filter(Item.is_public == True).options(
+            projection.load_options
+        )
+        page = keyset_paginate(
+            query,
+            [(Item.created_at, True), (Item.id, True)],
+            cursor=cursor,
+            per_page=per_page,
+            with_total=with_total,
+        )
+        return page.to_dict(serialize=projection.serialize)
+
     def process_fashion_query_with_agent(
         self, query: str, image_url: Optional[str] = None
     ) -> Dict[str, Any]:
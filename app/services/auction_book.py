@@ -0,0 +1,615 @@
+import bisect
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import redis
+from sqlalchemy import func, insert, select, update
+
+from app.config import config
+from app.extensions import db
+from app.models.bid import Bid, BidStatus
+from app.models.clothing_item import AuctionStatus, Item
+from app.models.user import User
+from app.services.bid_service import BID_EXPIRY, BidResult, bid_service
+
+
+def _epoch(moment: datetime) -> float:
+    """Seconds since the epoch; naive datetimes are UTC, like auction_ends_at."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _bid_entry(bid_id, item_id, user_id, amount, created_at):
+    return {
+        "id": str(bid_id),
+        "item_id": str(item_id),
+        "user_id": str(user_id),
+        "amount": float(amount),
+        "created_at": _epoch(created_at),
+    }
+
+
+class InMemoryBookStore:
+    """Process-local stand-in for ``RedisBookStore``, for tests and dev."""
+
+    def __init__(self):
+        self._books = {}  # item id -> {"start_price", "ends_at", "amounts", "bids"}
+        self._pending = []
+        self._holds = defaultdict(float)  # user id -> unflushed leading amounts
+        self._unflushed = {}  # bid id -> amount, while it leads unflushed
+        self._lock = threading.Lock()
+
+    def open(self, item_id: str, start_price: float, ends_at: float, bids) -> bool:
+        with self._lock:
+            if item_id in self._books:
+                return False
+            bids = sorted(bids, key=lambda bid: bid["amount"])
+            self._books[item_id] = {
+                "start_price": start_price,
+                "ends_at": ends_at,
+                "amounts": [bid["amount"] for bid in bids],
+                "bids": bids,
+            }
+            return True
+
+    def is_open(self, item_id: str) -> bool:
+        return item_id in self._books
+
+    def close(self, item_ids) -> None:
+        with self._lock:
+            for item_id in item_ids:
+                self._books.pop(item_id, None)
+
+    def place(self, bid: dict, spendable: float):
+        with self._lock:
+            book = self._books.get(bid["item_id"])
+            if book is None:
+                return "closed", None, None
+            if time.time() >= book["ends_at"]:
+                return "not_active", None, None
+            previous = book["bids"][-1] if book["bids"] else None
+            if previous:
+                if bid["amount"] <= previous["amount"]:
+                    return "outbid", previous["amount"], None
+            elif bid["amount"] < book["start_price"]:
+                return "outbid", book["start_price"], None
+            spendable -= self._holds[bid["user_id"]]
+            if previous and previous["user_id"] == bid["user_id"]:
+                spendable += previous["amount"]
+            if spendable < bid["amount"]:
+                return "insufficient_balance", None, None
+            position = bisect.bisect(book["amounts"], bid["amount"])
+            book["amounts"].insert(position, bid["amount"])
+            book["bids"].insert(position, bid)
+            self._pending.append(bid)
+            self._holds[bid["user_id"]] += bid["amount"]
+            self._unflushed[bid["id"]] = bid["amount"]
+            if previous and self._unflushed.pop(previous["id"], None) is not None:
+                self._holds[previous["user_id"]] -= previous["amount"]
+            return "accepted", bid["amount"], previous
+
+    def flushed(self, bids: list) -> None:
+        with self._lock:
+            for bid in bids:
+                if self._unflushed.pop(bid["id"], None) is not None:
+                    self._holds[bid["user_id"]] -= bid["amount"]
+
+    def top(self, item_id: str):
+        book = self._books.get(item_id)
+        if book is None:
+            return None
+        with self._lock:
+            top = book["bids"][-1] if book["bids"] else {"amount": None}
+            return dict(top, ends_at=book["ends_at"])
+
+    def history(self, item_id: str, limit: int) -> list:
+        book = self._books.get(item_id)
+        if book is None:
+            return None
+        with self._lock:
+            return book["bids"][::-1][:limit]
+
+    def drain(self, limit: int) -> list:
+        with self._lock:
+            drained, self._pending = self._pending[:limit], self._pending[limit:]
+        return drained
+
+    def requeue(self, bids: list) -> None:
+        with self._lock:
+            self._pending[:0] = bids
+
+
+class RedisBookStore:
+    """
+    One sorted set of bids (scored by amount) and one hash of auction
+    terms per item, plus a list of accepted bids not yet written to Postgres.
+    Leading bids not yet written are also kept by id, and their amounts
+    summed per user, for the holds Postgres does not know about yet.
+    """
+
+    PENDING_KEY = "auctions:book:pending"
+    HOLDS_KEY = "auctions:book:holds"
+    UNFLUSHED_KEY = "auctions:book:unflushed"
+
+    # Accept the bid only if the auction is still running and it beats the
+    # top of the book; queue it for Postgres in the same step. Returns the
+    # status, the price to beat (or accepted) and the bid it displaced. The
+    # end is checked against Redis's clock, which every web server shares.
+    # The bidder's balance from Postgres (ARGV[5]) must cover the bid on top
+    # of their leading bids not yet flushed; a displaced one stops counting
+    PLACE_SCRIPT = """
+    local terms = redis.call('HMGET', KEYS[1], 'start_price', 'ends_at')
+    if not terms[2] then
+        return {'closed', false, false}
+    end
+    local now = redis.call('TIME')
+    if tonumber(now[1]) + tonumber(now[2]) / 1000000 >= tonumber(terms[2]) then
+        return {'not_active', false, false}
+    end
+    local amount = tonumber(ARGV[2])
+    local top = redis.call('ZREVRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+    if top[2] then
+        if amount <= tonumber(top[2]) then
+            return {'outbid', top[2], false}
+        end
+    elseif amount < tonumber(terms[1]) then
+        return {'outbid', terms[1], false}
+    end
+    local leader = top[1] and cjson.decode(top[1])
+    local spendable = tonumber(ARGV[5]) - tonumber(redis.call('HGET', KEYS[4], ARGV[3]) or 0)
+    if leader and leader.user_id == ARGV[3] then
+        spendable = spendable + tonumber(top[2])
+    end
+    if spendable < amount then
+        return {'insufficient_balance', false, false}
+    end
+    redis.call('ZADD', KEYS[2], amount, ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], redis.call('PTTL', KEYS[1]))
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+    redis.call('HINCRBYFLOAT', KEYS[4], ARGV[3], ARGV[2])
+    redis.call('HSET', KEYS[5], ARGV[4], ARGV[2])
+    if leader and redis.call('HDEL', KEYS[5], leader.id) == 1 then
+        local left = redis.call('HINCRBYFLOAT', KEYS[4], leader.user_id, -tonumber(top[2]))
+        if tonumber(left) < 0.005 then
+            redis.call('HDEL', KEYS[4], leader.user_id)
+        end
+    end
+    return {'accepted', ARGV[2], top[1] or false}
+    """
+
+    # Flushed bids' holds are in Postgres now; drop those still counted here
+    FLUSHED_SCRIPT = """
+    for i = 1, #ARGV, 3 do
+        if redis.call('HDEL', KEYS[2], ARGV[i]) == 1 then
+            local left = redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i + 1], -tonumber(ARGV[i + 2]))
+            if tonumber(left) < 0.005 then
+                redis.call('HDEL', KEYS[1], ARGV[i + 1])
+            end
+        end
+    end
+    """
+
+    # Create the book unless another process got there first
+    OPEN_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'start_price', ARGV[1], 'ends_at', ARGV[2])
+    for i = 4, #ARGV, 2 do
+        redis.call('ZADD', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('EXPIREAT', KEYS[1], ARGV[3])
+    redis.call('EXPIREAT', KEYS[2], ARGV[3])
+    return 1
+    """
+
+    # Books outlive their auction by this long in case nobody closes them
+    RETENTION = 24 * 3600
+
+    def __init__(self, redis_url: str):
+        self._redis = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True,
+        )
+        self._place = self._redis.register_script(self.PLACE_SCRIPT)
+        self._open = self._redis.register_script(self.OPEN_SCRIPT)
+        self._flushed = self._redis.register_script(self.FLUSHED_SCRIPT)
+
+    @staticmethod
+    def _keys(item_id):
+        return f"auction:{item_id}:terms", f"auction:{item_id}:bids"
+
+    def open(self, item_id: str, start_price: float, ends_at: float, bids) -> bool:
+        args = [start_price, ends_at, int(ends_at) + self.RETENTION]
+        for bid in bids:
+            args += [bid["amount"], json.dumps(bid)]
+        return bool(self._open(keys=self._keys(item_id), args=args))
+
+    def is_open(self, item_id: str) -> bool:
+        return bool(self._redis.exists(self._keys(item_id)[0]))
+
+    def close(self, item_ids) -> None:
+        # One DEL, so each book is gone at once for PLACE_SCRIPT
+        self._redis.delete(
+            *(key for item_id in item_ids for key in self._keys(item_id))
+        )
+
+    def place(self, bid: dict, spendable: float):
+        status, amount, previous = self._place(
+            keys=[
+                *self._keys(bid["item_id"]),
+                self.PENDING_KEY,
+                self.HOLDS_KEY,
+                self.UNFLUSHED_KEY,
+            ],
+            args=[json.dumps(bid), bid["amount"], bid["user_id"], bid["id"], spendable],
+        )
+        return (
+            status,
+            float(amount) if amount else None,
+            json.loads(previous) if previous else None,
+        )
+
+    def top(self, item_id: str):
+        terms_key, bids_key = self._keys(item_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hget(terms_key, "ends_at")
+        pipe.zrevrange(bids_key, 0, 0)
+        ends_at, top = pipe.execute()
+        if ends_at is None:
+            return None
+        top = json.loads(top[0]) if top else {"amount": None}
+        return dict(top, ends_at=float(ends_at))
+
+    def history(self, item_id: str, limit: int) -> list:
+        terms_key, bids_key = self._keys(item_id)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.exists(terms_key)
+        pipe.zrevrange(bids_key, 0, limit - 1)
+        exists, bids = pipe.execute()
+        if not exists:
+            return None
+        return [json.loads(bid) for bid in bids]
+
+    def flushed(self, bids: list) -> None:
+        args = []
+        for bid in bids:
+            args += [bid["id"], bid["user_id"], bid["amount"]]
+        if args:
+            self._flushed(keys=[self.HOLDS_KEY, self.UNFLUSHED_KEY], args=args)
+
+    def drain(self, limit: int) -> list:
+        return [
+            json.loads(bid) for bid in self._redis.lpop(self.PENDING_KEY, limit) or []
+        ]
+
+    def requeue(self, bids: list) -> None:
+        if bids:
+            self._redis.lpush(
+                self.PENDING_KEY, *(json.dumps(bid) for bid in reversed(bids))
+            )
+
+
+class AuctionBook:
+    """
+    Live order book for auctions in their final minutes.
+
+    Once an auction is within ``window`` of its end, its bids stop going
+    through Postgres: the book, rebuilt from the ``bids`` table on first use,
+    accepts a bid only if it beats the top of the book, in one atomic step,
+    so outbid detection and the highest bid are O(log n) reads that never
+    touch the ``items`` row. Accepted bids are queued and written to Postgres
+    in batches by ``flush`` (the auction dispatcher runs it every poll, and
+    before settling, once ``seal`` has closed the book), which also moves the
+    balance holds. To take the lead, a bidder's free balance in Postgres
+    must cover the bid on top of their leading bids still waiting to be
+    flushed, whose holds the book counts until then.
+
+    ``BidService`` refuses bids on auctions inside the window, so no bid can
+    reach Postgres behind the book's back.
+    """
+
+    HISTORY_SIZE = 200  # Most recent bids loaded into a rebuilt book
+
+    def __init__(self, store=None, window=900, flush_size=1000):
+        self.store = store
+        self.window = timedelta(seconds=window)
+        self.flush_size = flush_size
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def place_bid(self, user_id, item_id, amount: float) -> BidResult:
+        """Place a bid through the book if the auction is closing, else via Postgres."""
+        if not self.enabled:
+            return bid_service.place_bid(user_id, item_id, amount)
+
+        item_id = str(item_id)
+        try:
+            is_open = self.store.is_open(item_id)
+        except redis.RedisError as e:
+            # Postgres still takes bids on auctions outside the window
+            print(f"Auction book unavailable for item {item_id}: {e}")
+            is_open = False
+        if not is_open:
+            result = bid_service.place_bid(
+                user_id, item_id, amount, closes_after=datetime.utcnow() + self.window
+            )
+            if result.status != "closing":
+                return result
+            self.open(item_id)
+        return self._place(user_id, item_id, amount)
+
+    def _place(self, user_id, item_id, amount):
+        # Most bids on a hot item lose; turn those away before any database read
+        now = datetime.utcnow()
+        top = self.store.top(item_id)
+        if top is None or _epoch(now) >= top["ends_at"]:
+            return BidResult("not_active")
+        current = top["amount"]
+        if current is not None and amount <= current:
+            return BidResult("outbid", current_bid=current)
+
+        spendable = db.session.execute(
+            select(User.balance - func.coalesce(User.temp_balance_hold, 0)).where(
+                User.id == user_id
+            )
+        ).scalar()
+        db.session.rollback()
+        if spendable is None:
+            return BidResult("insufficient_balance")
+
+        # The store checks the balance, net of unflushed holds, as it accepts
+        bid = _bid_entry(uuid.uuid4(), item_id, user_id, amount, now)
+        status, current, previous = self.store.place(bid, float(spendable))
+        if status == "closed":
+            # Settled (and closed) between our reads
+            return BidResult("not_active")
+        if status != "accepted":
+            return BidResult(status, current_bid=current)
+        return BidResult(
+            "accepted",
+            bid={
+                "id": bid["id"],
+                "amount": amount,
+                "status": BidStatus.RESERVED.value,
+                "expires_at": (now + BID_EXPIRY).isoformat(),
+                "created_at": now.isoformat(),
+            },
+            current_bid=amount,
+            outbid_user_id=previous and previous["user_id"],
+        )
+
+    def open(self, item_id) -> bool:
+        """Build an auction's book from Postgres unless it already has one."""
+        # Share-lock the item so bids committing through Postgres right now
+        # are in the rebuilt book; later ones are refused as "closing"
+        item = db.session.execute(
+            select(Item.auction_start_price, Item.auction_ends_at)
+            .where(Item.id == item_id)
+            .with_for_update(read=True)
+        ).first()
+        bids = db.session.execute(
+            select(Bid.id, Bid.item_id, Bid.user_id, Bid.amount, Bid.created_at)
+            .where(Bid.item_id == item_id)
+            .order_by(Bid.amount.desc())
+            .limit(self.HISTORY_SIZE)
+        ).all()
+        db.session.rollback()
+        if item is None:
+            return False
+        return self.store.open(
+            str(item_id),
+            float(item.auction_start_price),
+            _epoch(item.auction_ends_at),
+            [_bid_entry(*bid) for bid in bids],
+        )
+
+    def close(self, item_id) -> None:
+        if self.enabled:
+            try:
+                self.store.close([str(item_id)])
+            except redis.RedisError as e:
+                # The book expires on its own a day after the auction
+                print(f"Could not close auction book for item {item_id}: {e}")
+
+    def seal(self, item_ids=None, now=None) -> int:
+        """
+        Close the books of auctions about to be settled, then flush, so every
+        bid they took is in Postgres and none can follow. With no
+        ``item_ids``, every active auction that has ended. Errors are raised:
+        settling next to a book still taking bids would lose them.
+
+        Returns:
+            int: The number of bids flushed
+        """
+        if not self.enabled:
+            return 0
+        if item_ids is None:
+            item_ids = db.session.scalars(
+                select(Item.id).where(
+                    Item.auction_status == AuctionStatus.ACTIVE,
+                    Item.auction_ends_at <= (now or datetime.utcnow()),
+                )
+            ).all()
+            db.session.rollback()
+        if item_ids:
+            self.store.close([str(item_id) for item_id in item_ids])
+        return self.flush()
+
+    def current_bid(self, item_id):
+        """The leading bid amount from the book, or None if it has no book."""
+        if not self.enabled:
+            return None
+        try:
+            top = self.store.top(str(item_id))
+        except redis.RedisError as e:
+            print(f"Auction book unavailable for item {item_id}: {e}")
+            return None
+        return top and top["amount"]
+
+    def history(self, item_id, limit=50):
+        """Newest bids first from the book, or None if it has no book."""
+        if not self.enabled:
+            return None
+        try:
+            return self.store.history(str(item_id), limit)
+        except redis.RedisError as e:
+            print(f"Auction book unavailable for item {item_id}: {e}")
+            return None
+
+    def sync_from_database(self) -> int:
+        """Rebuild the books of active auctions already inside the window."""
+        if not self.enabled:
+            return 0
+        item_ids = db.session.scalars(
+            select(Item.id).where(
+                Item.auction_status == AuctionStatus.ACTIVE,
+                Item.auction_ends_at <= datetime.utcnow() + self.window,
+            )
+        ).all()
+        return sum(1 for item_id in item_ids if self.open(item_id))
+
+    def flush(self) -> int:
+        """Write queued bids to Postgres, a batch per transaction; returns how many."""
+        if not self.enabled:
+            return 0
+        flushed = 0
+        while True:
+            bids = self.store.drain(self.flush_size)
+            if not bids:
+                return flushed
+            try:
+                self._write(bids)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.store.requeue(bids)
+                raise
+            try:
+                self.store.flushed(bids)
+            except redis.RedisError as e:
+                # Their holds stay counted twice, which only refuses bids
+                print(f"Could not release {len(bids)} flushed book holds: {e}")
+            flushed += len(bids)
+            if len(bids) < self.flush_size:
+                return flushed
+
+    def _write(self, bids):
+        """
+        Insert the bids and make each auction's highest one its reserved,
+        held bid, releasing the bid it replaces.
+        """
+        now = datetime.utcnow()
+        by_item = defaultdict(list)
+        for bid in bids:
+            by_item[bid["item_id"]].append(bid)
+
+        # Items first, then users, both in id order, like BidService
+        items = {
+            str(row.id): row
+            for row in db.session.execute(
+                select(Item.id, Item.auction_status, Item.auction_current_bid)
+                .where(Item.id.in_(list(by_item)))
+                .order_by(Item.id)
+                .with_for_update()
+            )
+        }
+        leaders, released = {}, defaultdict(float)
+        for item_id, item_bids in by_item.items():
+            item = items.get(item_id)
+            if item is None:
+                print(f"Dropping {len(item_bids)} book bids for missing item {item_id}")
+                continue
+            leader = max(item_bids, key=lambda bid: bid["amount"])
+            # A bid flushed out of order, or after settlement, only enters history
+            if item.auction_status == AuctionStatus.ACTIVE and (
+                item.auction_current_bid is None
+                or leader["amount"] > item.auction_current_bid
+            ):
+                leaders[item_id] = leader
+        if leaders:
+            for user_id, amount in db.session.execute(
+                update(Bid.__table__)
+                .where(
+                    Bid.item_id.in_(list(leaders)),
+                    Bid.status == BidStatus.RESERVED,
+                )
+                .values(status=BidStatus.RELEASED, status_updated_at=now)
+                .returning(Bid.user_id, Bid.amount)
+            ):
+                released[user_id] += amount
+
+        rows = [
+            {
+                "id": uuid.UUID(bid["id"]),
+                "amount": bid["amount"],
+                "item_id": uuid.UUID(bid["item_id"]),
+                "user_id": uuid.UUID(bid["user_id"]),
+                "status": (
+                    BidStatus.RESERVED
+                    if leaders.get(bid["item_id"]) is bid
+                    else BidStatus.RELEASED
+                ),
+                "created_at": datetime.utcfromtimestamp(bid["created_at"]),
+                "status_updated_at": now,
+                "expires_at": datetime.utcfromtimestamp(bid["created_at"]) + BID_EXPIRY,
+            }
+            for bid in bids
+            if bid["item_id"] in items
+        ]
+        if rows:
+            db.session.execute(insert(Bid.__table__), rows)
+        if not leaders:
+            return
+
+        held = defaultdict(float, released)
+        for leader in leaders.values():
+            held[uuid.UUID(leader["user_id"])] -= leader["amount"]
+        db.session.execute(
+            select(User.id)
+            .where(User.id.in_(list(held)))
+            .order_by(User.id)
+            .with_for_update()
+        )
+        for user_id, returned in held.items():
+            db.session.execute(
+                update(User.__table__)
+                .where(User.id == user_id)
+                .values(
+                    temp_balance_hold=func.greatest(
+                        func.coalesce(User.temp_balance_hold, 0) - returned, 0
+                    )
+                )
+            )
+        for item_id, leader in leaders.items():
+            db.session.execute(
+                update(Item.__table__)
+                .where(Item.id == item_id)
+                .values(
+                    auction_current_bid=leader["amount"],
+                    auction_current_bidder_id=leader["user_id"],
+                    updated_at=now,
+                )
+            )
+
+
+# Create a singleton instance of the AuctionBook. It is only used with a
+# Redis URL: an in-process book would not be shared between web workers.
+auction_book = AuctionBook(
+    store=(
+        RedisBookStore(config.AUCTION_BOOK_REDIS_URL)
+        if config.AUCTION_BOOK_REDIS_URL
+        else None
+    ),
+    window=config.AUCTION_BOOK_WINDOW,
+    flush_size=config.AUCTION_BOOK_FLUSH_SIZE,
+)
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from flask_socketio import SocketIO
+
+from app.config import config
+from app.extensions import socketio
+
+
+def item_room(item_id) -> str:
+    return f"item:{item_id}"
+
+
+def user_room(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class AuctionEvents:
+    """
+    Pushes auction updates to Socket.IO rooms, so watchers stop polling
+    ``/items/<id>``.
+
+    Everyone watching an item is in its room and gets ``bid`` and
+    ``auction_closed`` events; a signed-in user is also in their own room,
+    which gets ``outbid`` when someone takes their lead. Events go out
+    through the Redis message queue, so the web worker holding a client's
+    connection delivers them wherever they were emitted from: any web
+    worker, the auction dispatcher or a Celery worker.
+    """
+
+    def __init__(self, message_queue=None):
+        self.message_queue = message_queue
+        self._emitter = None
+
+    @property
+    def emitter(self):
+        if self._emitter is None:
+            # Write-only: this process publishes, the web workers deliver
+            self._emitter = (
+                SocketIO(message_queue=self.message_queue)
+                if self.message_queue
+                else socketio
+            )
+        return self._emitter
+
+    def _emit(self, event, data, room):
+        try:
+            self.emitter.emit(event, data, to=room)
+        except Exception as e:
+            # Watchers catch up from /items/<id>; never fail the bid over it
+            print(f"Error emitting {event} to {room}: {e}")
+
+    def bid_placed(self, item_id, user_id, result) -> None:
+        """Announce an accepted bid, and tell the bidder it replaced."""
+        self._emit(
+            "bid",
+            {
+                "item_id": str(item_id),
+                "bid_id": result.bid["id"],
+                "amount": result.bid["amount"],
+                "bidder_id": str(user_id),
+                "created_at": result.bid["created_at"],
+            },
+            item_room(item_id),
+        )
+        if result.outbid_user_id and result.outbid_user_id != str(user_id):
+            self._emit(
+                "outbid",
+                {"item_id": str(item_id), "amount": result.bid["amount"]},
+                user_room(result.outbid_user_id),
+            )
+
+    def auctions_closed(self, batch) -> None:
+        """Announce the outcome of each auction in a committed settlement batch."""
+        closed_at = datetime.utcnow().isoformat()
+        for auction in batch.auctions:
+            self._emit(
+                "auction_closed",
+                {
+                    "item_id": str(auction.item_id),
+                    "status": "sold" if auction.sold else "expired",
+                    "amount": float(auction.amount) if auction.sold else None,
+                    "winner_id": str(auction.winner_id) if auction.sold else None,
+                    "closed_at": closed_at,
+                },
+                item_room(auction.item_id),
+            )
+
+
+# Create a singleton instance of the AuctionEvents.
+auction_events = AuctionEvents(message_queue=config.SOCKETIO_MESSAGE_QUEUE)
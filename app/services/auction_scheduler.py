@@ -0,0 +1,209 @@
+import threading
+import time
+from datetime import datetime
+
+import redis
+
+from app.config import config
+from app.extensions import db
+from app.models.clothing_item import AuctionStatus, Item
+from app.services.auction_book import _epoch, auction_book
+from app.services.auction_service import auction_settlement
+
+
+class InMemoryCloseQueue:
+    """Process-local stand-in for ``RedisCloseQueue``, for tests and dev."""
+
+    def __init__(self):
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def add(self, member: str, score: float) -> None:
+        with self._lock:
+            self._scores[member] = score
+
+    def remove(self, member: str) -> None:
+        with self._lock:
+            self._scores.pop(member, None)
+
+    def pop_due(self, now: float, limit: int) -> list:
+        with self._lock:
+            due = sorted(
+                (score, member)
+                for member, score in self._scores.items()
+                if score <= now
+            )[:limit]
+            for _, member in due:
+                del self._scores[member]
+        return [member for _, member in due]
+
+    def next_due(self):
+        with self._lock:
+            return min(self._scores.values(), default=None)
+
+
+class RedisCloseQueue:
+    """Auction ids in a Redis sorted set, scored by end time (epoch seconds)."""
+
+    KEY = "auctions:closing"
+
+    # Take the due ids off the set atomically, so concurrent dispatchers
+    # never pop the same auction
+    POP_DUE_SCRIPT = """
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    if #due > 0 then
+        redis.call('ZREM', KEYS[1], unpack(due))
+    end
+    return due
+    """
+
+    def __init__(self, redis_url: str):
+        self._redis = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True,
+        )
+        self._pop_due = self._redis.register_script(self.POP_DUE_SCRIPT)
+
+    def add(self, member: str, score: float) -> None:
+        self._redis.zadd(self.KEY, {member: score})
+
+    def remove(self, member: str) -> None:
+        self._redis.zrem(self.KEY, member)
+
+    def pop_due(self, now: float, limit: int) -> list:
+        return self._pop_due(keys=[self.KEY], args=[now, limit])
+
+    def next_due(self):
+        head = self._redis.zrange(self.KEY, 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+
+class AuctionCloseScheduler:
+    """
+    Closes each auction about when it ends, instead of whenever a periodic
+    scan next runs.
+
+    Active auctions sit in a close queue scored by ``auction_ends_at``. The
+    dispatcher (``flask dispatch-auctions``) sleeps until the earliest end
+    time, but never longer than ``poll_interval``, then pops the due ids and
+    settles exactly those auctions. Postgres stays the source of truth: an
+    auction is only settled if it is still active and its (possibly moved)
+    end time has passed, so entries left behind by a reschedule or a cancel
+    are harmless. Popped auctions that were not settled are requeued at
+    their current end time, or retried shortly if a bid held their row lock.
+    Each dispatch first flushes the auction book's queued bids to Postgres.
+    The ``cleanup_expired_bids`` sweep remains as a backstop.
+    """
+
+    RETRY_DELAY = 1.0  # Seconds before retrying an auction whose row was locked
+
+    def __init__(self, queue, poll_interval=0.25, batch_size=500):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+    def schedule(self, item_id, ends_at: datetime) -> None:
+        """Register, or move, an auction's close time."""
+        try:
+            self.queue.add(str(item_id), _epoch(ends_at))
+        except redis.RedisError as e:
+            # The cleanup_expired_bids sweep will still close it, just later
+            print(f"Could not schedule auction close for item {item_id}: {e}")
+
+    def cancel(self, item_id) -> None:
+        try:
+            self.queue.remove(str(item_id))
+        except redis.RedisError as e:
+            print(f"Could not cancel auction close for item {item_id}: {e}")
+
+    def sync_from_database(self) -> int:
+        """Queue every active auction; returns how many."""
+        count = 0
+        rows = (
+            Item.query.with_entities(Item.id, Item.auction_ends_at)
+            .filter(Item.auction_status == AuctionStatus.ACTIVE)
+            .yield_per(5000)
+        )
+        for item_id, ends_at in rows:
+            self.queue.add(str(item_id), _epoch(ends_at))
+            count += 1
+        return count
+
+    def dispatch_due(self, now=None):
+        """
+        Settle the auctions whose close time has come, and commit.
+
+        Returns:
+            SettlementBatch or None: The auctions closed, None if none were due
+        """
+        now = now or datetime.utcnow()
+        auction_book.flush()
+        item_ids = self.queue.pop_due(_epoch(now), self.batch_size)
+        if not item_ids:
+            return None
+        try:
+            # Their books must take no more bids, and those taken must be in
+            # Postgres, before settling
+            auction_book.seal(item_ids)
+            batch = auction_settlement.settle_batch(now=now, item_ids=item_ids)
+            db.session.commit()
+        except Exception:
+            # Popped auctions would otherwise wait for the expiry sweep
+            db.session.rollback()
+            self._requeue(item_ids, now)
+            raise
+        for auction in batch.auctions:
+            auction_book.close(auction.item_id)
+
+        settled = {str(auction.item_id) for auction in batch.auctions}
+        unsettled = [item_id for item_id in item_ids if item_id not in settled]
+        if unsettled:
+            self._requeue(unsettled, now)
+        return batch
+
+    def run(self, on_settled=None, stop: threading.Event = None) -> None:
+        """Dispatch until ``stop`` is set; ``on_settled`` gets each batch."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                batch = self.dispatch_due()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Auction dispatch failed, retrying: {e}")
+                stop.wait(self.poll_interval)
+                continue
+
+            if batch is not None:
+                if batch and on_settled:
+                    on_settled(batch)
+                continue  # More may be due right away
+            stop.wait(self._idle_time())
+
+    def _idle_time(self) -> float:
+        next_due = self.queue.next_due()
+        if next_due is None:
+            return self.poll_interval
+        return min(max(next_due - time.time(), 0), self.poll_interval)
+
+    def _requeue(self, item_ids, now):
+        """Put popped but unsettled auctions that are still active back."""
+        rows = Item.query.with_entities(Item.id, Item.auction_ends_at).filter(
+            Item.id.in_(item_ids), Item.auction_status == AuctionStatus.ACTIVE
+        )
+        retry_at = _epoch(now) + self.RETRY_DELAY
+        for item_id, ends_at in rows:
+            self.queue.add(str(item_id), max(_epoch(ends_at), retry_at))
+
+
+# Create a singleton instance of the AuctionCloseScheduler. Without a Redis
+# URL the close queue lives in this process, which only suits tests and dev.
+auction_scheduler = AuctionCloseScheduler(
+    queue=(
+        RedisCloseQueue(config.AUCTION_SCHEDULER_REDIS_URL)
+        if config.AUCTION_SCHEDULER_REDIS_URL
+        else InMemoryCloseQueue()
+    ),
+    poll_interval=config.AUCTION_DISPATCH_POLL_INTERVAL,
+)
@@ -0,0 +1,282 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import (
+    DateTime,
+    bindparam,
+    case,
+    cast,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+
+from app.config import config
+from app.extensions import db
+from app.models.bid import Bid, BidStatus
+from app.models.clothing_item import AuctionStatus, Item
+from app.models.notification import Notification, NotificationType
+from app.models.user import User
+from app.services.outbox import outbox
+
+
+@dataclass
+class SettledAuction:
+    item_id: object
+    seller_id: object
+    title: str
+    winning_bid_id: object = None
+    winner_id: object = None
+    amount: float = None
+
+    @property
+    def sold(self):
+        return self.winning_bid_id is not None
+
+
+@dataclass
+class SettlementBatch:
+    auctions: list
+    notification_ids: list
+
+    def __len__(self):
+        return len(self.auctions)
+
+
+class AuctionSettlementService:
+    """
+    Closes expired auctions in batches, one SQL statement per batch.
+
+    Each batch locks up to ``batch_size`` due auctions with
+    ``FOR UPDATE SKIP LOCKED``, so any number of workers can settle in
+    parallel without waiting on each other or closing an auction twice.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def settle_batch(self, now=None, batch_size=None, item_ids=None):
+        """
+        Close one batch of expired auctions in the current transaction.
+        With ``item_ids``, only those auctions are considered (and still only
+        closed if they are active and have ended).
+
+        The highest reserved bid (earliest on a tie) of each auction wins and
+        is marked WON; the other reserved bids are RELEASED and their holds
+        returned to the bidders. Auctions without bids become EXPIRED. The
+        winner, seller and unsold-seller notifications (emailed with the next
+        digest), and the outbox events invoicing the winners, are inserted in
+        the same transaction. The caller commits.
+
+        Returns:
+            SettlementBatch: The auctions closed (none when nothing is due)
+            and the ids of the notifications created for them
+        """
+        now = now or datetime.utcnow()
+        settled = [
+            SettledAuction(*row)
+            for row in db.session.execute(
+                self._settle_statement(now, batch_size or self.batch_size, item_ids)
+            )
+        ]
+        notification_ids = []
+        if settled:
+            rows = self._notification_rows(settled, now)
+            unread = Counter(row["user_id"] for row in rows)
+            self._return_holds([auction.item_id for auction in settled], now, unread)
+            # Core insert: the ORM would split these rows into per-row
+            # statements wherever actor_id switches between None and a value
+            notifications = Notification.__table__
+            notification_ids = db.session.scalars(
+                insert(notifications).returning(notifications.c.id), rows
+            ).all()
+            users = User.__table__
+            db.session.execute(
+                update(users)
+                .where(users.c.id == bindparam("recipient_id"))
+                .values(
+                    unread_notifications=users.c.unread_notifications
+                    + bindparam("unread")
+                ),
+                [
+                    {"recipient_id": user_id, "unread": count}
+                    for user_id, count in sorted(unread.items())
+                ],
+            )
+            outbox.enqueue_many(
+                "app.tasks.generate_invoice_for_winning_bid",
+                [(str(a.winning_bid_id),) for a in settled if a.sold],
+                dedup_keys=[f"invoice:{a.winning_bid_id}" for a in settled if a.sold],
+            )
+        return SettlementBatch(settled, notification_ids)
+
+    def _settle_statement(self, now, batch_size, item_ids=None):
+        now = bindparam("now", now, type_=DateTime)
+        due = select(Item.id).where(
+            Item.auction_status == AuctionStatus.ACTIVE,
+            Item.auction_ends_at <= now,
+        )
+        if item_ids is not None:
+            due = due.where(Item.id.in_(item_ids))
+        due = (
+            due.order_by(Item.auction_ends_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("due")
+        )
+        # One row per due auction: its winning bid, or NULLs if nobody bid
+        outcomes = (
+            select(
+                due.c.id,
+                Bid.id.label("bid_id"),
+                Bid.user_id.label("winner_id"),
+                Bid.amount,
+            )
+            .select_from(
+                due.outerjoin(
+                    Bid,
+                    (Bid.item_id == due.c.id) & (Bid.status == BidStatus.RESERVED),
+                )
+            )
+            .distinct(due.c.id)
+            .order_by(due.c.id, Bid.amount.desc().nulls_last(), Bid.created_at, Bid.id)
+            .cte("outcomes")
+        )
+
+        bids = Bid.__table__
+        settled_bids = (
+            update(bids)
+            .where(
+                bids.c.item_id == outcomes.c.id,
+                bids.c.status == BidStatus.RESERVED,
+            )
+            .values(
+                status=cast(
+                    case(
+                        (bids.c.id == outcomes.c.bid_id, BidStatus.WON.name),
+                        else_=BidStatus.RELEASED.name,
+                    ),
+                    bids.c.status.type,
+                ),
+                status_updated_at=now,
+            )
+            .returning(bids.c.id)
+            .cte("settled_bids")
+        )
+
+        # A Core (not ORM) UPDATE, so RETURNING can include the CTE's columns
+        items = Item.__table__
+        return (
+            update(items)
+            .where(items.c.id == outcomes.c.id)
+            .values(
+                auction_status=cast(
+                    case(
+                        (outcomes.c.bid_id.is_(None), AuctionStatus.EXPIRED.name),
+                        else_=AuctionStatus.SOLD.name,
+                    ),
+                    items.c.auction_status.type,
+                ),
+                auction_current_bidder_id=outcomes.c.winner_id,
+                auction_current_bid=func.coalesce(
+                    outcomes.c.amount, items.c.auction_current_bid
+                ),
+                updated_at=now,
+            )
+            .returning(
+                items.c.id,
+                items.c.user_id,
+                items.c.title,
+                outcomes.c.bid_id,
+                outcomes.c.winner_id,
+                outcomes.c.amount,
+            )
+            .add_cte(settled_bids)
+        )
+
+    def _return_holds(self, item_ids, now, notified=()):
+        """
+        Give the losing bidders of these auctions their held amounts back.
+        The ``notified`` users are locked along with them.
+        """
+        released = (
+            select(Bid.user_id, func.sum(Bid.amount).label("amount"))
+            .where(
+                Bid.item_id.in_(item_ids),
+                Bid.status == BidStatus.RELEASED,
+                Bid.status_updated_at == now,
+            )
+            .group_by(Bid.user_id)
+            .subquery()
+        )
+        # Lock the bidders (and the users the batch notifies) in id order
+        # first: batches settling in parallel often share them, and would
+        # deadlock locking them in any order
+        db.session.execute(
+            select(User.id)
+            .where(
+                or_(
+                    User.id.in_(select(released.c.user_id)),
+                    User.id.in_(list(notified)),
+                )
+            )
+            .order_by(User.id)
+            .with_for_update()
+        )
+        db.session.execute(
+            update(User)
+            .where(User.id == released.c.user_id)
+            .values(
+                temp_balance_hold=func.greatest(
+                    User.temp_balance_hold - released.c.amount, 0
+                ),
+                updated_at=now,
+            )
+        )
+
+    def _notification_rows(self, settled, now):
+        rows = []
+        for auction in settled:
+            if auction.sold:
+                amount = float(auction.amount)
+                rows.append(
+                    {
+                        "user_id": auction.winner_id,
+                        "type": NotificationType.AUCTION_WON,
+                        "item_id": auction.item_id,
+                        "notification_data": {"winning_amount": amount},
+                    }
+                )
+                rows.append(
+                    {
+                        "user_id": auction.seller_id,
+                        "type": NotificationType.AUCTION_SOLD,
+                        "item_id": auction.item_id,
+                        "actor_id": auction.winner_id,
+                        "notification_data": {"amount": amount},
+                    }
+                )
+            else:
+                rows.append(
+                    {
+                        "user_id": auction.seller_id,
+                        "type": NotificationType.AUCTION_EXPIRED,
+                        "item_id": auction.item_id,
+                        "notification_data": None,
+                    }
+                )
+        for row in rows:
+            row.setdefault("actor_id", None)
+            row["is_read"] = False
+            row["email_pending"] = True
+            row["created_at"] = now
+        return rows
+
+
+# Create a singleton instance of the AuctionSettlementService.
+auction_settlement = AuctionSettlementService(
+    batch_size=config.AUCTION_SETTLEMENT_BATCH_SIZE
+)
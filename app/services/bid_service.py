@@ -0,0 +1,184 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from app.extensions import db
+from app.models.bid import Bid, BidStatus
+from app.models.clothing_item import AuctionStatus, Item
+from app.models.user import User
+
+# How long a reserved bid stays valid
+BID_EXPIRY = timedelta(hours=24)
+
+
+@dataclass
+class BidResult:
+    # "accepted", "outbid", "insufficient_balance", "not_active", "not_found",
+    # or "closing" when the auction is in its final window (see place_bid)
+    status: str
+    bid: dict = None
+    current_bid: float = None  # The price to beat, when not accepted
+    outbid_user_id: str = None  # The previous leader, when accepted
+
+    @property
+    def accepted(self):
+        return self.status == "accepted"
+
+
+class BidService:
+    """
+    Places bids without read-then-write races.
+
+    The item row is claimed with one conditional UPDATE that only matches
+    while the auction is open and the new amount beats the current bid, so
+    of any number of concurrent bids at a price level exactly one wins and
+    the rest get an "outbid" result. In the same transaction the previous
+    leading bid is released and its hold returned, and the new bidder's
+    amount is held only if their free balance covers it; otherwise the
+    whole bid rolls back.
+
+    Row locks are always taken item first, then users in id order, so bids
+    on different items by overlapping bidders cannot deadlock.
+    """
+
+    def place_bid(
+        self, user_id, item_id, amount: float, closes_after=None
+    ) -> BidResult:
+        """
+        Place a bid and commit; returns the outcome.
+
+        With ``closes_after``, only auctions ending after that moment accept
+        the bid; auctions ending sooner (but not yet ended) return "closing".
+        The auction book uses this to take over an auction's final minutes
+        without a bid slipping into Postgres behind it.
+        """
+        now = datetime.utcnow()
+        try:
+            claimed = db.session.execute(
+                update(Item.__table__)
+                .where(
+                    Item.id == item_id,
+                    Item.auction_status == AuctionStatus.ACTIVE,
+                    Item.auction_ends_at > max(now, closes_after or now),
+                    or_(
+                        Item.auction_current_bid < amount,
+                        and_(
+                            Item.auction_current_bid.is_(None),
+                            Item.auction_start_price <= amount,
+                        ),
+                    ),
+                )
+                .values(
+                    auction_current_bid=amount,
+                    auction_current_bidder_id=user_id,
+                    updated_at=now,
+                )
+                .returning(Item.id)
+            ).first()
+            if claimed is None:
+                db.session.rollback()
+                return self._rejection(item_id, now, closes_after)
+
+            released = db.session.execute(
+                update(Bid.__table__)
+                .where(Bid.item_id == item_id, Bid.status == BidStatus.RESERVED)
+                .values(status=BidStatus.RELEASED, status_updated_at=now)
+                .returning(Bid.user_id, Bid.amount)
+            ).all()
+            returned = {}
+            outbid_user_id = None
+            for bidder_id, held in released:
+                outbid_user_id = str(bidder_id)
+                returned[bidder_id] = returned.get(bidder_id, 0) + held
+
+            self._lock_users({user_id, *returned})
+            for bidder_id, held in returned.items():
+                db.session.execute(
+                    update(User.__table__)
+                    .where(User.id == bidder_id)
+                    .values(
+                        temp_balance_hold=func.greatest(
+                            func.coalesce(User.temp_balance_hold, 0) - held, 0
+                        )
+                    )
+                )
+
+            held = db.session.execute(
+                update(User.__table__)
+                .where(
+                    User.id == user_id,
+                    User.balance - func.coalesce(User.temp_balance_hold, 0) >= amount,
+                )
+                .values(
+                    temp_balance_hold=func.coalesce(User.temp_balance_hold, 0) + amount
+                )
+                .returning(User.id)
+            ).first()
+            if held is None:
+                db.session.rollback()
+                return BidResult("insufficient_balance")
+
+            bid = db.session.execute(
+                insert(Bid.__table__)
+                .values(
+                    amount=amount,
+                    item_id=item_id,
+                    user_id=user_id,
+                    status=BidStatus.RESERVED,
+                    created_at=now,
+                    status_updated_at=now,
+                    expires_at=now + BID_EXPIRY,
+                )
+                .returning(Bid.id, Bid.created_at, Bid.expires_at)
+            ).one()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return BidResult(
+            "accepted",
+            bid={
+                "id": str(bid.id),
+                "amount": amount,
+                "status": BidStatus.RESERVED.value,
+                "expires_at": bid.expires_at.isoformat(),
+                "created_at": bid.created_at.isoformat(),
+            },
+            current_bid=amount,
+            outbid_user_id=outbid_user_id,
+        )
+
+    def _lock_users(self, user_ids):
+        db.session.execute(
+            select(User.id)
+            .where(User.id.in_(list(user_ids)))
+            .order_by(User.id)
+            .with_for_update()
+        )
+
+    def _rejection(self, item_id, now, closes_after=None) -> BidResult:
+        """Why the conditional UPDATE matched nothing."""
+        item = db.session.execute(
+            select(
+                Item.auction_status,
+                Item.auction_ends_at,
+                Item.auction_current_bid,
+                Item.auction_start_price,
+            ).where(Item.id == item_id)
+        ).first()
+        if item is None:
+            return BidResult("not_found")
+        if item.auction_status != AuctionStatus.ACTIVE or item.auction_ends_at <= now:
+            return BidResult("not_active")
+        if closes_after is not None and item.auction_ends_at <= closes_after:
+            return BidResult("closing")
+        current = item.auction_current_bid
+        if current is None:
+            current = item.auction_start_price
+        return BidResult("outbid", current_bid=float(current))
+
+
+# Create a singleton instance of the BidService.
+bid_service = BidService()
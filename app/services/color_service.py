@@ -0,0 +1,141 @@
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from app.config import config
+from app.utils.color import nearest_color_name, rgb_to_hex
+
+
+class ColorService:
+    """
+    Dominant-color extraction on the CPU, replacing the Gemini round-trip
+    previously used for ``Item.dominant_colors``.
+
+    Images are downsampled, the background is optionally masked out using
+    the image border as a reference, and pixels are clustered with k-means.
+    """
+
+    def __init__(
+        self,
+        max_colors: int = 5,
+        sample_size: int = 96,
+        min_share: float = 0.08,
+        mask_background: bool = True,
+    ):
+        self.max_colors = max_colors
+        self.sample_size = sample_size
+        self.min_share = min_share
+        self.mask_background = mask_background
+
+    def extract_colors(self, image_bytes: bytes) -> List[Dict]:
+        """
+        Extract the dominant colors of an image.
+
+        Args:
+            image_bytes (bytes): The encoded image.
+
+        Returns:
+            List[Dict]: ``{"hex", "name", "share"}`` dicts, largest share first.
+        """
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        image.thumbnail((self.sample_size, self.sample_size), Image.Resampling.BOX)
+        pixels = np.asarray(image, dtype=np.float64)
+
+        if self.mask_background:
+            foreground = self._foreground_mask(pixels)
+            # Fall back to the whole image if the mask ate (nearly) everything
+            if foreground.mean() > 0.1:
+                pixels = pixels[foreground]
+        pixels = pixels.reshape(-1, 3)
+
+        centers, counts = _kmeans(pixels, min(self.max_colors, len(pixels)))
+        shares = counts / counts.sum()
+
+        palette = []
+        for index in np.argsort(-shares):
+            if shares[index] < self.min_share:
+                continue
+            hex_code = rgb_to_hex(centers[index])
+            if any(entry["hex"] == hex_code for entry in palette):
+                continue
+            palette.append(
+                {
+                    "hex": hex_code,
+                    "name": nearest_color_name(centers[index]),
+                    "share": round(float(shares[index]), 3),
+                }
+            )
+        return palette
+
+    def extract_colors_batch(
+        self, images: List[bytes], workers: int = None
+    ) -> List[List[Dict]]:
+        """
+        Extract colors for many images in parallel across processes.
+        Images that fail to decode get an empty palette.
+        """
+        workers = workers or config.COLOR_EXTRACTION_WORKERS
+        if workers <= 1 or len(images) <= 1:
+            return [_safe_extract(self, data) for data in images]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(
+                pool.map(_safe_extract, [self] * len(images), images, chunksize=8)
+            )
+
+    def _foreground_mask(self, pixels):
+        """Pixels that differ clearly from the median border color"""
+        border = np.concatenate(
+            [pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]], axis=0
+        )
+        background = np.median(border, axis=0)
+        # Only mask when the border is a fairly uniform backdrop
+        if np.median(np.linalg.norm(border - background, axis=1)) > 20:
+            return np.ones(pixels.shape[:2], dtype=bool)
+        return np.linalg.norm(pixels - background, axis=2) > 30
+
+
+def _safe_extract(service, data):
+    try:
+        return service.extract_colors(data)
+    except Exception as e:
+        print(f"Error extracting colors: {e}")
+        return []
+
+
+def _kmeans(pixels, k, iterations=12, seed=0):
+    """Plain k-means with k-means++ seeding; returns (centers, counts)"""
+    rng = np.random.default_rng(seed)
+    centers = [pixels[rng.integers(len(pixels))]]
+    for _ in range(1, k):
+        distances = np.min(
+            np.linalg.norm(pixels[:, None, :] - np.array(centers)[None], axis=2), axis=1
+        )
+        total = (distances**2).sum()
+        if total == 0:
+            break
+        centers.append(pixels[rng.choice(len(pixels), p=distances**2 / total)])
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        labels = np.argmin(
+            np.linalg.norm(pixels[:, None, :] - centers[None], axis=2), axis=1
+        )
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        moved = sums[counts > 0] / counts[counts > 0, None]
+        if np.allclose(moved, centers[counts > 0]):
+            break
+        centers[counts > 0] = moved
+
+    labels = np.argmin(
+        np.linalg.norm(pixels[:, None, :] - centers[None], axis=2), axis=1
+    )
+    return centers, np.bincount(labels, minlength=len(centers)).astype(np.float64)
+
+
+# Create a singleton instance of the ColorService.
+color_service = ColorService()
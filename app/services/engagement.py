@@ -0,0 +1,174 @@
+import threading
+import uuid
+from collections import Counter
+
+import redis
+from sqlalchemy import Integer, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.config import config
+from app.extensions import db
+from app.models.clothing_item import Item
+from app.models.item_like import ItemLike
+from app.services.trending import trending
+
+
+class InMemoryEngagementStore:
+    """Process-local stand-in for ``RedisEngagementStore``, for tests and dev."""
+
+    def __init__(self):
+        self._deltas = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, member: str, delta: int) -> None:
+        with self._lock:
+            self._deltas[member] += delta
+
+    def pop(self) -> dict:
+        with self._lock:
+            deltas, self._deltas = self._deltas, Counter()
+        return dict(deltas)
+
+
+class RedisEngagementStore:
+    """Pending counter deltas in one Redis hash, ``<item id>:<counter>`` fields."""
+
+    KEY = "engagement:pending"
+
+    # Read and clear the hash in one step, so an increment landing mid-flush
+    # waits for the next one rather than being lost
+    POP_SCRIPT = """
+    local deltas = redis.call('HGETALL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    return deltas
+    """
+
+    def __init__(self, redis_url: str):
+        self._redis = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True,
+        )
+        self._pop = self._redis.register_script(self.POP_SCRIPT)
+
+    def incr(self, member: str, delta: int) -> None:
+        self._redis.hincrby(self.KEY, member, delta)
+
+    def pop(self) -> dict:
+        flat = self._pop(keys=[self.KEY])
+        return {member: int(delta) for member, delta in zip(flat[::2], flat[1::2])}
+
+
+class EngagementCounters:
+    """
+    Per-item view, like and watcher counts.
+
+    Requests only bump a counter in Redis; ``flush`` (the
+    ``flush_engagement_counters`` beat task) sums what built up since the last
+    flush and adds it into the ``items`` columns in batched ``UPDATE ... FROM
+    (VALUES ...)`` statements, one row per item however often it was seen. So
+    the counts serialize with the item at no extra cost, a few seconds behind.
+
+    Views and likes also count towards the trending score. Watchers go up and
+    down with live Socket.IO watchers, so a server that dies with clients
+    connected leaves its watchers counted.
+    """
+
+    COUNTERS = ("views", "likes", "watchers")
+
+    # Increments that also count towards trending, and as which engagement
+    TRENDING_KINDS = {"views": "view", "likes": "like"}
+
+    def __init__(self, store, flush_size=1000):
+        self.store = store
+        self.flush_size = flush_size
+
+    def incr(self, item_id, counter: str, delta: int = 1) -> None:
+        """Add ``delta`` to one of an item's ``COUNTERS``."""
+        if counter not in self.COUNTERS:
+            raise ValueError(f"Unknown engagement counter {counter!r}")
+        try:
+            self.store.incr(f"{item_id}:{counter}", delta)
+        except redis.RedisError as e:
+            # A lost view only skews a count; never fail the request
+            print(f"Could not count {counter} for item {item_id}: {e}")
+        if delta > 0 and counter in self.TRENDING_KINDS:
+            trending.record(item_id, self.TRENDING_KINDS[counter])
+
+    def flush(self) -> int:
+        """Add the pending deltas into the items; returns how many items changed."""
+        rows = {}
+        for member, delta in self.store.pop().items():
+            item_id, counter = member.rsplit(":", 1)
+            row = rows.setdefault(uuid.UUID(item_id), dict.fromkeys(self.COUNTERS, 0))
+            row[counter] += delta
+        # Id order, so concurrent flushes and bids lock rows in the same order
+        batch = sorted(
+            (item_id, *row.values())
+            for item_id, row in rows.items()
+            if any(row.values())
+        )
+
+        for offset in range(0, len(batch), self.flush_size):
+            try:
+                self._write(batch[offset : offset + self.flush_size])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Hand back what was not written for the next flush
+                for item_id, *deltas in batch[offset:]:
+                    for counter, delta in zip(self.COUNTERS, deltas):
+                        if delta:
+                            self.store.incr(f"{item_id}:{counter}", delta)
+                raise
+        return len(batch)
+
+    def _write(self, rows):
+        items = Item.__table__
+        deltas = values(
+            column("id", UUID(as_uuid=True)),
+            *(column(counter, Integer) for counter in self.COUNTERS),
+            name="deltas",
+        ).data(rows)
+        counts = {
+            # Unlikes and unwatches can overtake what they undo
+            f"{counter}_count": func.greatest(
+                items.c[f"{counter}_count"] + deltas.c[counter], 0
+            )
+            for counter in self.COUNTERS
+        }
+        db.session.execute(
+            update(items).where(items.c.id == deltas.c.id)
+            # Counts are not edits; keep the onupdate off updated_at
+            .values(**counts, updated_at=items.c.updated_at)
+        )
+
+    def recount_likes(self) -> int:
+        """Set every item's like count from item_likes; returns how many changed."""
+        likes = (
+            select(func.count())
+            .where(ItemLike.item_id == Item.id)
+            .correlate(Item)
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            update(Item)
+            .where(Item.likes_count != likes)
+            .values(likes_count=likes, updated_at=Item.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+# Create a singleton instance of the EngagementCounters. Without a Redis URL the
+# pending deltas live in this process, which only suits tests and dev.
+engagement = EngagementCounters(
+    store=(
+        RedisEngagementStore(config.ENGAGEMENT_REDIS_URL)
+        if config.ENGAGEMENT_REDIS_URL
+        else InMemoryEngagementStore()
+    ),
+    flush_size=config.ENGAGEMENT_FLUSH_SIZE,
+)
@@ -0,0 +1,210 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import redis
+
+from app.config import config
+from app.utils.image_cache import image_cache
+
+# Bump a prompt's version whenever its wording or output parsing changes;
+# cached responses for older versions then simply stop matching.
+PROMPT_VERSIONS = {
+    "generate_tags": 1,
+    "generate_colors": 1,
+    "get_clothing_style": 1,
+    "get_clothing_vibe": 1,
+    "segment_image_for_clothing": 1,
+    "detect_objects_in_image": 1,
+    "analyze_item_image": 2,
+}
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of model responses keyed by
+    (image content hash, prompt name, prompt version, model name).
+
+    Lookups go local disk first, then Redis; a Redis hit is copied to disk.
+    Both tiers expire entries after ``ttl`` seconds, and the disk tier evicts
+    least recently used entries beyond ``max_entries``. Redis errors are
+    treated as misses so the cache never takes the AI pipeline down.
+    """
+
+    def __init__(self, redis_url: Optional[str], path: str, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._redis = (
+            redis.Redis.from_url(
+                redis_url, socket_connect_timeout=0.5, socket_timeout=0.5
+            )
+            if redis_url
+            else None
+        )
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"disk_hits": 0, "redis_hits": 0, "misses": 0, "writes": 0}
+
+    def key(self, content_hash: str, prompt: str, model: str) -> str:
+        return f"llm:{prompt}:v{PROMPT_VERSIONS[prompt]}:{model}:{content_hash}"
+
+    def get(self, key: str):
+        value = self._disk_get(key)
+        if value is not None:
+            self._count("disk_hits")
+            return value
+
+        value = self._redis_get(key)
+        if value is not None:
+            self._count("redis_hits")
+            self._disk_set(key, value)
+            return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._count("writes")
+        self._disk_set(key, value)
+        self._redis_set(key, value)
+
+    def hit_rate(self) -> float:
+        hits = self.stats["disk_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self.stats[counter] += 1
+        if self._redis is not None:
+            try:
+                self._redis.hincrby("llm:stats", counter, 1)
+            except redis.RedisError:
+                pass
+
+    # --- Redis tier ---------------------------------------------------------
+
+    def _redis_get(self, key):
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(key)
+        except redis.RedisError:
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def _redis_set(self, key, value):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(key, json.dumps(value), ex=self.ttl)
+        except redis.RedisError:
+            pass
+
+    # --- Disk tier ----------------------------------------------------------
+
+    def _db(self):
+        # sqlite connections can't be shared across threads or forked workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key):
+        now = time.time()
+        try:
+            db = self._db()
+            row = db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def _disk_set(self, key, value):
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        except sqlite3.Error:
+            pass
+
+
+def cached_image_response(prompt: str, model_attr: str) -> Callable:
+    """
+    Cache an ``AIService`` method whose first argument is an image URL or raw
+    image bytes. URLs are resolved to their content hash through the local
+    image cache, so the same picture under a new URL still hits.
+
+    Empty results are not cached, since the AI methods return ``[]`` on error.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, image, *args, **kwargs):
+            try:
+                if isinstance(image, bytes):
+                    content_hash = hashlib.sha256(image).hexdigest()
+                else:
+                    content_hash = image_cache.digest(image)
+            except Exception as e:
+                print(f"Could not hash image for response cache, skipping it: {e}")
+                return method(self, image, *args, **kwargs)
+
+            key = llm_cache.key(content_hash, prompt, getattr(self, model_attr))
+            cached = llm_cache.get(key)
+            if cached is not None:
+                return cached
+
+            result = method(self, image, *args, **kwargs)
+            if result and (not isinstance(result, dict) or any(result.values())):
+                llm_cache.set(key, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+# Create a singleton instance of the LLMResponseCache.
+llm_cache = LLMResponseCache(
+    redis_url=config.LLM_CACHE_REDIS_URL,
+    path=config.LLM_CACHE_PATH,
+    ttl=config.LLM_CACHE_TTL,
+    max_entries=config.LLM_CACHE_MAX_ENTRIES,
+)
@@ -1,35 +1,68 @@
 import logging
+import smtplib
 import uuid
-from datetime import datetime
-from flask import current_app, render_template
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
 from flask_mail import Message
+from sqlalchemy import func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
 
 from app.config import config
-from app.extensions import db, mail, celery
+from app.extensions import db, mail
 from app.models.notification import Notification, NotificationType
 from app.models.user import User
 from app.models.clothing_item import Item
-
-
-# Define the task within the same file
-@celery.task
-def send_notification_email_task(notification_id: str):
-    """
-    Celery task to send an email for a notification.
-    """
-    notification = Notification.query.get(notification_id)
-    if not notification:
-        return False
-
-    # Add your email sending logic here
-    return True
+from app.services.outbox import outbox
+
+EPOCH = datetime(1970, 1, 1)
+
+# Subject and template for each notification type that is emailed
+EMAIL_TEMPLATES = {
+    NotificationType.BID_RECEIVED: (
+        "New Bid on Your Item: {title}",
+        "bid_notification",
+    ),
+    NotificationType.BID_OUTBID: (
+        "You've Been Outbid on: {title}",
+        "outbid_notification",
+    ),
+    NotificationType.AUCTION_WON: (
+        "Congratulations! You Won the Auction for: {title}",
+        "auction_won",
+    ),
+    NotificationType.AUCTION_EXPIRED: (
+        "Your Auction for {title} Ended Unsold",
+        "auction_expired",
+    ),
+    NotificationType.SIZE_RESTOCK: (
+        "New Item in Your Saved Size: {size_value}",
+        "size_restock",
+    ),
+}
+
+
+def _item_context(item, seller):
+    """The item fields the email templates use."""
+    return {
+        "id": str(item.id),
+        "title": item.title,
+        "image_url": item.image_url,
+        "price": item.price,
+        "starting_price": item.auction_start_price,
+        "end_date": item.auction_ends_at,
+        "seller": {"username": seller.username if seller else None},
+    }
 
 
 class NotificationService:
-    def __init__(self):
+    def __init__(self, coalesce_window=900, digest_batch_size=1000):
         """Initialize the notification service."""
         # Flask-Mail is initialized via app.extensions, so no direct initialization here.
-        pass
+        # Compiled email templates by name; Flask would re-check them per render
+        self._templates = {}
+        self.coalesce_window = coalesce_window  # Seconds; 0 never merges
+        self.digest_batch_size = digest_batch_size
 
     def send_notification(
         self, user_email: str, subject: str, template_name: str, **kwargs
@@ -48,25 +81,7 @@ class NotificationService:
             bool: True if the email was successfully sent, False otherwise.
         """
         try:
-            # Add app URL to template context (assuming APP_BASE_URL in config)
-            kwargs["app_url"] = current_app.config.get(
-                "APP_BASE_URL", "https://fitcheck.app"
-            )
-            kwargs["app_name"] = current_app.config.get("APP_NAME", "FitCheck")
-
-            # Render the HTML body of the email using a Jinja2 template
-            html_body = render_template(f"emails/{template_name}.html", **kwargs)
-            # Create a plain text version as a fallback (optional, but good practice)
-            # You might have corresponding .txt templates or strip HTML for this.
-            text_body = f"Subject: {subject}\n\n{html_body}"  # Simplified fallback
-
-            msg = Message(
-                subject=subject,
-                recipients=[user_email],
-                html=html_body,
-                body=text_body,  # Plain text body as fallback
-                sender=current_app.config["MAIL_DEFAULT_SENDER"],
-            )
+            msg = self._message(user_email, subject, template_name, kwargs)
 
             current_app.logger.info(
                 f"Attempting to send email to {user_email} with subject: '{subject}' using template: '{template_name}'"
@@ -84,6 +99,234 @@ class NotificationService:
             )
             return False
 
+    def send_notification_emails(self, notification_ids) -> int:
+        """
+        Send the emails for a batch of stored notifications, one per
+        recipient (a digest when they have several).
+
+        Args:
+            notification_ids (iterable): Notification UUIDs, or their strings.
+
+        Returns:
+            int: The number of emails sent.
+        """
+        ids = {uuid.UUID(str(notification_id)) for notification_id in notification_ids}
+        if not ids:
+            return 0
+        notifications = Notification.query.filter(Notification.id.in_(ids)).all()
+        if len(notifications) < len(ids):
+            current_app.logger.warning(
+                f"{len(ids) - len(notifications)} of {len(ids)} notifications not found; skipping their emails."
+            )
+        return self._send_emails(notifications, [])
+
+    def send_digests(self) -> int:
+        """
+        Email every recipient with pending notifications one digest of them.
+
+        Recipients are claimed a batch at a time with all of their pending
+        notifications, so nobody gets two digests in one run. Their user rows
+        are locked (``SKIP LOCKED``, so runs can overlap, and ``NO KEY
+        UPDATE``, so new notifications for them are not held up) and the
+        claim committed before sending, so bids merging into those rows never
+        wait on SMTP. A row that merges another event after its claim is
+        pending again, for the next digest. The notifications whose emails
+        did not go out are released to be retried.
+
+        Returns:
+            int: The number of emails sent.
+        """
+        notifications = Notification.__table__
+        users = User.__table__
+        sent = 0
+        while True:
+            recipients = (
+                db.session.execute(
+                    select(users.c.id)
+                    .where(
+                        users.c.id.in_(
+                            select(notifications.c.user_id).where(
+                                notifications.c.email_pending
+                            )
+                        )
+                    )
+                    .limit(self.digest_batch_size)
+                    .with_for_update(skip_locked=True, key_share=True)
+                )
+                .scalars()
+                .all()
+            )
+            claimed = (
+                db.session.execute(
+                    update(notifications)
+                    .where(
+                        notifications.c.email_pending,
+                        notifications.c.user_id.in_(recipients),
+                    )
+                    .values(email_pending=False)
+                    .returning(notifications)
+                ).all()
+                if recipients
+                else []
+            )
+            db.session.commit()
+            if not recipients:
+                return sent
+
+            handled = []
+            try:
+                sent += self._send_emails(claimed, handled)
+            finally:
+                unsent = {row.id for row in claimed}.difference(handled)
+                if unsent:
+                    db.session.execute(
+                        update(notifications)
+                        .where(notifications.c.id.in_(unsent))
+                        .values(email_pending=True)
+                    )
+                    db.session.commit()
+            if len(recipients) < self.digest_batch_size:
+                return sent
+
+    def _send_emails(self, notifications, handled) -> int:
+        """
+        Email each recipient their notifications: the type's own email for a
+        single one, a digest for several.
+
+        The items are loaded with one query, and the recipients, actors and
+        sellers with one more, however many notifications there are. The
+        messages go out over a single SMTP connection, which Flask-Mail
+        reopens every ``MAIL_MAX_EMAILS`` messages. A message the server
+        refuses is logged and skipped; losing the connection raises. The ids
+        of the notifications dealt with (emailed, refused, or not emailable)
+        are appended to ``handled`` as it goes.
+        """
+        item_ids = {n.item_id for n in notifications if n.item_id}
+        items = {
+            item.id: item
+            for item in (
+                Item.query.with_entities(
+                    Item.id,
+                    Item.user_id,
+                    Item.title,
+                    Item.image_url,
+                    Item.price,
+                    Item.auction_start_price,
+                    Item.auction_ends_at,
+                )
+                .filter(Item.id.in_(item_ids))
+                .all()
+                if item_ids
+                else ()
+            )
+        }
+        user_ids = {n.user_id for n in notifications}
+        user_ids.update(n.actor_id for n in notifications if n.actor_id)
+        user_ids.update(item.user_id for item in items.values())
+        users = {
+            user.id: user
+            for user in User.query.with_entities(User.id, User.username, User.email)
+            .filter(User.id.in_(user_ids))
+            .all()
+        }
+
+        by_recipient = defaultdict(list)
+        for notification in notifications:
+            by_recipient[notification.user_id].append(notification)
+
+        messages = []
+        for user_id, received in by_recipient.items():
+            recipient = users.get(user_id)
+            emailed = [n for n in received if n.type in EMAIL_TEMPLATES]
+            if recipient is None or not recipient.email or not emailed:
+                handled.extend(n.id for n in received)
+                continue
+            entries = [self._email_entry(n, items, users) for n in emailed]
+            if len(entries) == 1:
+                subject, template_name, context = entries[0]
+            else:
+                subject = f"{len(entries)} updates on your {current_app.config.get('APP_NAME', 'FitCheck')} activity"
+                template_name = "notification_digest"
+                context = {
+                    "entries": [
+                        dict(context, subject=entry_subject)
+                        for entry_subject, _, context in entries
+                    ]
+                }
+            context["recipient_username"] = recipient.username
+            messages.append(
+                (
+                    [n.id for n in received],
+                    self._message(recipient.email, subject, template_name, context),
+                )
+            )
+
+        sent = 0
+        with mail.connect() as connection:
+            for notification_ids, msg in messages:
+                try:
+                    connection.send(msg)
+                    sent += 1
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                    current_app.logger.error(
+                        f"Email to {msg.recipients[0]} for notifications {notification_ids} refused: {e}"
+                    )
+                handled.extend(notification_ids)
+        return sent
+
+    def _email_entry(self, notification, items, users):
+        """Subject, template and template context of one notification's email."""
+        subject, template_name = EMAIL_TEMPLATES[notification.type]
+        item = items.get(notification.item_id)
+        actor = users.get(notification.actor_id)
+        metadata = notification.notification_data or {}
+        subject = subject.format(
+            title=item.title if item else "An Item",
+            size_value=metadata.get("size_value", "N/A"),
+        )
+        if notification.count > 1:
+            subject = f"{subject} ({notification.count} updates)"
+        context = {
+            "notification_id": str(notification.id),
+            "notification_type": notification.type.value,
+            "count": notification.count,
+            "metadata": metadata,
+            "actor": actor and {"id": str(actor.id), "username": actor.username},
+            "item": item and _item_context(item, users.get(item.user_id)),
+        }
+        return subject, template_name, context
+
+    def _message(self, user_email, subject, template_name, context) -> Message:
+        # Add app URL to template context (assuming APP_BASE_URL in config)
+        context["app_url"] = current_app.config.get(
+            "APP_BASE_URL", "https://fitcheck.app"
+        )
+        context["app_name"] = current_app.config.get("APP_NAME", "FitCheck")
+
+        # Render the HTML body of the email using a Jinja2 template
+        html_body = self._template(template_name).render(**context)
+        # Create a plain text version as a fallback (optional, but good practice)
+        # You might have corresponding .txt templates or strip HTML for this.
+        text_body = f"Subject: {subject}\n\n{html_body}"  # Simplified fallback
+
+        return Message(
+            subject=subject,
+            recipients=[user_email],
+            html=html_body,
+            body=text_body,  # Plain text body as fallback
+            sender=current_app.config["MAIL_DEFAULT_SENDER"],
+        )
+
+    def _template(self, template_name):
+        """The compiled email template, loaded once per process."""
+        template = self._templates.get(template_name)
+        if template is None:
+            template = current_app.jinja_env.get_template(
+                f"emails/{template_name}.html"
+            )
+            self._templates[template_name] = template
+        return template
+
     def _create_notification_record(
         self,
         user_id: uuid.UUID,
@@ -91,38 +334,228 @@ class NotificationService:
         item_id: uuid.UUID = None,
         actor_id: uuid.UUID = None,
         notification_data: dict = None,
-    ) -> Notification:
+        commit: bool = True,
+    ) -> uuid.UUID:
         """
-        Creates and stores a new notification record in the database.
-        Then, dispatches a Celery task to send the corresponding email.
+        Records a notification, merging it into the recipient's notification
+        of the same type and item from the current coalescing window if there
+        is one: that row counts one more event, takes this one's actor, data
+        and time, and becomes unread and pending email again. The email goes
+        out with the recipient's next digest. The recipient's unread counter
+        goes up, in the same transaction, when the notification is new or
+        merges into a read one.
 
         Args:
             user_id (uuid.UUID): The ID of the user who will receive the notification.
             notification_type (NotificationType): The type of notification.
-            item_id (uuid.UUID, optional): The ID of the item related to the notification. Defaults to None.
+            item_id (uuid.UUID, optional): The ID of the item related to the notification. Notifications without an item never merge. Defaults to None.
             actor_id (uuid.UUID, optional): The ID of the user who triggered the notification. Defaults to None.
-            metadata (dict, optional): Additional JSON metadata for the notification. Defaults to None.
+            notification_data (dict, optional): Additional JSON data for the notification. Defaults to None.
+            commit (bool, optional): Commit now; pass False to commit with the caller's change. Defaults to True.
 
         Returns:
-            Notification: The newly created Notification object.
+            uuid.UUID: The ID of the notification recorded or merged into.
         """
-        notification = Notification(
+        now = datetime.utcnow()
+        window_start = self._window_start(now) if item_id else None
+        notifications = Notification.__table__
+        was_read = None
+        if window_start is not None:
+            # Locked so the upsert below sees the same row; missing if the
+            # upsert inserts, or if a concurrent one inserted it (and counted it)
+            was_read = db.session.scalar(
+                select(notifications.c.is_read)
+                .where(
+                    notifications.c.user_id == user_id,
+                    notifications.c.type == notification_type,
+                    notifications.c.item_id == item_id,
+                    notifications.c.window_start == window_start,
+                )
+                .with_for_update()
+            )
+        statement = insert(notifications).values(
+            id=uuid.uuid4(),
             user_id=user_id,
             type=notification_type,
             item_id=item_id,
             actor_id=actor_id,
             notification_data=notification_data,
+            count=1,
+            window_start=window_start,
+            is_read=False,
+            email_pending=True,
+            created_at=now,
         )
-        db.session.add(notification)
-        db.session.commit()  # Commit the notification record first
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                notifications.c.user_id,
+                notifications.c.type,
+                notifications.c.item_id,
+                notifications.c.window_start,
+            ],
+            set_={
+                "count": notifications.c.count + 1,
+                "actor_id": statement.excluded.actor_id,
+                "notification_data": statement.excluded.notification_data,
+                "is_read": False,
+                "email_pending": True,
+                "created_at": statement.excluded.created_at,
+            },
+        )
+        notification_id, inserted = db.session.execute(
+            statement.returning(notifications.c.id, literal_column("xmax = 0"))
+        ).one()
+        if inserted or was_read:
+            db.session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(unread_notifications=User.unread_notifications + 1)
+            )
+        if commit:
+            db.session.commit()
         current_app.logger.info(
-            f"Created notification record {notification.id} for user {user_id}, type {notification_type.value}"
+            f"Recorded notification {notification_id} for user {user_id}, type {notification_type.value}"
+        )
+
+        return notification_id
+
+    def recount_unread(self) -> int:
+        """
+        Set every user's unread counter from their notification rows, for the
+        backfill when the counter is introduced or to repair drift. Rows
+        changing while it runs may leave those users off by the difference.
+
+        Returns:
+            int: The number of users whose counter changed.
+        """
+        unread = (
+            select(func.count())
+            .where(
+                Notification.user_id == User.id,
+                Notification.is_read.is_(False),
+            )
+            .scalar_subquery()
+        )
+        result = db.session.execute(
+            update(User)
+            .where(User.unread_notifications != unread)
+            .values(unread_notifications=unread)
         )
+        db.session.commit()
+        return result.rowcount
 
-        # Dispatch a Celery task to send the email associated with this notification
-        send_notification_email_task.delay(str(notification.id))
+    def _window_start(self, now):
+        """Start of the coalescing window ``now`` falls in; None when disabled."""
+        if not self.coalesce_window:
+            return None
+        seconds = int((now - EPOCH).total_seconds())
+        return EPOCH + timedelta(seconds=seconds - seconds % self.coalesce_window)
 
-        return notification
+    def send_bid_notifications(
+        self,
+        item_id: uuid.UUID,
+        bidder_id: uuid.UUID,
+        amount: float,
+        outbid_user_id: uuid.UUID = None,
+    ):
+        """
+        Queues the notifications for an accepted bid: the seller's, and the
+        outbid leader's. The outbox relay merges queued bids into
+        ``record_bid_notifications_task`` calls, so the request never waits
+        on the recipients' notification rows. Called once the bid has
+        committed, so a failure here is logged rather than raised.
+        """
+        try:
+            outbox.enqueue(
+                "app.tasks.record_bid_notifications_task",
+                [
+                    [
+                        str(item_id),
+                        str(bidder_id),
+                        float(amount),
+                        str(outbid_user_id) if outbid_user_id else None,
+                    ]
+                ],
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error queueing bid notifications for item {item_id}: {e}")
+
+    def record_bid_notifications(self, bids) -> int:
+        """
+        Records the notifications for a batch of accepted bids in one
+        transaction, in bid order for each recipient.
+
+        Args:
+            bids (iterable): (item_id, bidder_id, amount, outbid_user_id) per bid.
+
+        Returns:
+            int: The number of notifications recorded or merged.
+        """
+        bids = [
+            (
+                uuid.UUID(str(item_id)),
+                uuid.UUID(str(bidder_id)),
+                float(amount),
+                uuid.UUID(str(outbid_user_id)) if outbid_user_id else None,
+            )
+            for item_id, bidder_id, amount, outbid_user_id in bids
+        ]
+        sellers = dict(
+            db.session.execute(
+                select(Item.id, Item.user_id).where(
+                    Item.id.in_({item_id for item_id, *_ in bids})
+                )
+            ).all()
+        )
+        notifications = []
+        for item_id, bidder_id, amount, outbid_user_id in bids:
+            seller_id = sellers.get(item_id)
+            if seller_id and seller_id != bidder_id:
+                notifications.append(
+                    (
+                        seller_id,
+                        NotificationType.BID_RECEIVED,
+                        item_id,
+                        bidder_id,
+                        {"amount": amount},
+                    )
+                )
+            if outbid_user_id and outbid_user_id != bidder_id:
+                notifications.append(
+                    (
+                        outbid_user_id,
+                        NotificationType.BID_OUTBID,
+                        item_id,
+                        bidder_id,
+                        {"new_highest_bid": amount},
+                    )
+                )
+        # In recipient order, so concurrent batches lock their rows alike;
+        # the sort is stable, so each row still ends on its latest bid
+        notifications.sort(key=lambda n: (str(n[0]), n[1].value, str(n[2])))
+        try:
+            for (
+                recipient_id,
+                notification_type,
+                item_id,
+                actor_id,
+                data,
+            ) in notifications:
+                self._create_notification_record(
+                    user_id=recipient_id,
+                    notification_type=notification_type,
+                    item_id=item_id,
+                    actor_id=actor_id,
+                    notification_data=data,
+                    commit=False,
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(notifications)
 
     # --- Public methods to trigger notifications, which now use the DB-first approach ---
 
@@ -145,7 +578,7 @@ class NotificationService:
             notification_type=NotificationType.BID_RECEIVED,
             item_id=item_id,
             actor_id=bidder_id,
-            metadata={
+            notification_data={
                 "amount": float(amount)
             },  # Ensure amount is a basic type for JSON
         )
@@ -168,7 +601,7 @@ class NotificationService:
             notification_type=NotificationType.BID_OUTBID,
             item_id=item_id,
             actor_id=new_bidder_id,
-            metadata={"new_highest_bid": float(new_highest_bid)},
+            notification_data={"new_highest_bid": float(new_highest_bid)},
         )
 
     def send_auction_won_notification(
@@ -184,7 +617,7 @@ class NotificationService:
             user_id=winner_id,
             notification_type=NotificationType.AUCTION_WON,
             item_id=item_id,
-            metadata={"winning_amount": float(winning_amount)},
+            notification_data={"winning_amount": float(winning_amount)},
         )
 
     def send_auction_expired_notification(
@@ -216,7 +649,7 @@ class NotificationService:
             user_id=user_id,
             notification_type=NotificationType.SIZE_RESTOCK,
             item_id=item_id,
-            metadata={"size_value": size_value},
+            notification_data={"size_value": size_value},
         )
 
     def send_outfit_like_notification(
@@ -235,7 +668,7 @@ class NotificationService:
             # For simplicity, using item_id for outfit_id. Consider a separate outfit_id column in Notification
             item_id=outfit_id,
             actor_id=liker_id,
-            metadata={"liker_id": str(liker_id)},
+            notification_data={"liker_id": str(liker_id)},
         )
 
     # --- Methods that send direct emails (not tied to the Notification model, for now) ---
@@ -311,4 +744,7 @@ class NotificationService:
 
 
 # Create a singleton instance of the NotificationService
-notification_service = NotificationService()
+notification_service = NotificationService(
+    coalesce_window=config.NOTIFICATION_COALESCE_WINDOW,
+    digest_batch_size=config.NOTIFICATION_DIGEST_BATCH_SIZE,
+)
@@ -0,0 +1,186 @@
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import config
+from app.extensions import celery, db
+from app.models.outbox import OutboxEvent
+
+
+def _task_name(task):
+    return getattr(task, "name", task)
+
+
+class Outbox:
+    """
+    Transactional outbox for Celery tasks.
+
+    ``enqueue`` writes the task into ``outbox_events`` inside the caller's
+    transaction instead of publishing it, so the task is dispatched if and
+    only if the change that called for it commits, and request handlers never
+    wait on the broker. ``flask relay-outbox`` drains the table: it locks a
+    batch (``SKIP LOCKED``, so relays can run side by side), publishes it over
+    one broker connection, deletes it and commits. Delivery is at least once;
+    a relay that dies between publishing and committing republishes.
+
+    Events with a ``dedup_key`` collapse while pending: enqueueing the same
+    key again returns the queued event's task id.
+
+    Tasks in ``merge_sizes`` take any number of arguments; their pending
+    events are merged into one call with all of them, up to that many events
+    a call, which runs under the first event's task id.
+    """
+
+    def __init__(
+        self, batch_size=500, poll_interval=0.2, chunk_sizes=None, merge_sizes=None
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # Tasks published many-per-message, as Celery chunks of this size
+        self.chunk_sizes = chunk_sizes or {}
+        # Tasks called once for many events, with their arguments concatenated
+        self.merge_sizes = merge_sizes or {}
+
+    def enqueue(self, task, args=(), kwargs=None, dedup_key=None):
+        """
+        Queue a task in the current transaction; the caller commits.
+
+        Args:
+            task: The Celery task, or its registered name
+            args (sequence): JSON-serializable positional arguments
+            kwargs (dict, optional): JSON-serializable keyword arguments
+            dedup_key (str, optional): Collapse with a pending event of this key
+
+        Returns:
+            str: The id the Celery task will run under
+        """
+        events = OutboxEvent.__table__
+        statement = insert(events).values(
+            task=_task_name(task),
+            args=list(args),
+            kwargs=kwargs or {},
+            task_id=uuid.uuid4(),
+            dedup_key=dedup_key,
+            created_at=datetime.utcnow(),
+        )
+        if dedup_key is not None:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[events.c.dedup_key]
+            )
+        task_id = db.session.execute(statement.returning(events.c.task_id)).scalar()
+        if task_id is None:
+            task_id = db.session.scalar(
+                select(events.c.task_id).where(events.c.dedup_key == dedup_key)
+            )
+        return str(task_id) if task_id else None
+
+    def enqueue_many(self, task, args_list, dedup_keys=None) -> None:
+        """Queue one task per argument tuple, in one statement."""
+        if not args_list:
+            return
+        events = OutboxEvent.__table__
+        now = datetime.utcnow()
+        dedup_keys = dedup_keys or [None] * len(args_list)
+        db.session.execute(
+            insert(events).on_conflict_do_nothing(index_elements=[events.c.dedup_key]),
+            [
+                {
+                    "task": _task_name(task),
+                    "args": list(args),
+                    "kwargs": {},
+                    "task_id": uuid.uuid4(),
+                    "dedup_key": dedup_key,
+                    "created_at": now,
+                }
+                for args, dedup_key in zip(args_list, dedup_keys)
+            ],
+        )
+
+    def relay_batch(self) -> int:
+        """Publish and delete one batch of events; returns how many."""
+        events = OutboxEvent.__table__
+        try:
+            batch = db.session.execute(
+                select(events)
+                .order_by(events.c.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not batch:
+                db.session.rollback()
+                return 0
+            self._publish(batch)
+            db.session.execute(
+                delete(events).where(events.c.id.in_([event.id for event in batch]))
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(batch)
+
+    def _publish(self, batch):
+        by_task = defaultdict(list)
+        for event in batch:
+            by_task[event.task].append(event)
+
+        with celery.producer_or_acquire() as producer:
+            for name, events in by_task.items():
+                merge_size = self.merge_sizes.get(name)
+                if merge_size and not any(e.kwargs for e in events):
+                    for offset in range(0, len(events), merge_size):
+                        merged = events[offset : offset + merge_size]
+                        celery.send_task(
+                            name,
+                            args=[arg for event in merged for arg in event.args],
+                            task_id=str(merged[0].task_id),
+                            producer=producer,
+                        )
+                    continue
+                chunk_size = self.chunk_sizes.get(name)
+                if chunk_size and len(events) > 1 and not any(e.kwargs for e in events):
+                    celery.tasks[name].chunks(
+                        [event.args for event in events], chunk_size
+                    ).apply_async(producer=producer)
+                    continue
+                for event in events:
+                    celery.send_task(
+                        name,
+                        args=event.args,
+                        kwargs=event.kwargs,
+                        task_id=str(event.task_id),
+                        producer=producer,
+                    )
+
+    def run(self, stop: threading.Event = None) -> None:
+        """Relay until ``stop`` is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                relayed = self.relay_batch()
+            except Exception as e:
+                # The batch stays in the table and is retried
+                print(f"Outbox relay failed, retrying: {e}")
+                stop.wait(self.poll_interval)
+                continue
+            if relayed < self.batch_size:
+                stop.wait(self.poll_interval)
+
+
+# Create a singleton instance of the Outbox. Settlement queues an email per
+# notification and an invoice per sold auction; invoices go out 100 a message,
+# and emails 100 a call, to share an SMTP connection (MAIL_MAX_EMAILS). Bid
+# notifications are recorded 100 bids a call, in one transaction.
+outbox = Outbox(
+    batch_size=config.OUTBOX_BATCH_SIZE,
+    poll_interval=config.OUTBOX_POLL_INTERVAL,
+    chunk_sizes={"app.tasks.generate_invoice_for_winning_bid": 100},
+    merge_sizes={
+        "app.tasks.send_notification_email_task": 100,
+        "app.tasks.record_bid_notifications_task": 100,
+    },
+)
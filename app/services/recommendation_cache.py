@@ -0,0 +1,271 @@
+import json
+import threading
+import time
+from collections import Counter
+
+import redis
+
+from app.config import config
+from app.extensions import db
+from app.services.outbox import outbox
+from app.services.recommendation_service import RecommendationEngine
+
+
+class InMemoryRecommendationStore:
+    """Process-local stand-in for ``RedisRecommendationStore``, for tests and dev."""
+
+    def __init__(self):
+        self._entries = {}  # key: (expires_at, raw entry)
+        self._versions = Counter()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: str, key: str, seen_at: float = None):
+        with self._lock:
+            if seen_at is not None:
+                self._active[user_id] = seen_at
+            expires_at, raw = self._entries.get(key, (0, None))
+            return self._versions[user_id], raw if expires_at > time.time() else None
+
+    def save(self, key: str, raw: str, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, raw)
+
+    def bump(self, user_id: str) -> None:
+        with self._lock:
+            self._versions[user_id] += 1
+
+    def active_users(self, since: float) -> list:
+        with self._lock:
+            self._active = {
+                user_id: seen for user_id, seen in self._active.items() if seen >= since
+            }
+            return list(self._active)
+
+
+class RedisRecommendationStore:
+    """
+    Cached recommendations as JSON strings, next to a wardrobe version per
+    user and a sorted set of when each user last asked.
+    """
+
+    ACTIVE_KEY = "rec:active"
+
+    def __init__(self, redis_url: str):
+        self._redis = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True,
+        )
+
+    @staticmethod
+    def _version_key(user_id):
+        return f"rec:version:{user_id}"
+
+    def lookup(self, user_id: str, key: str, seen_at: float = None):
+        # One round trip: the version, the entry, and marking the user active
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get(self._version_key(user_id))
+        pipe.get(key)
+        if seen_at is not None:
+            pipe.zadd(self.ACTIVE_KEY, {user_id: seen_at})
+        version, raw = pipe.execute()[:2]
+        return int(version or 0), raw
+
+    def save(self, key: str, raw: str, ttl: int) -> None:
+        self._redis.set(key, raw, ex=ttl)
+
+    def bump(self, user_id: str) -> None:
+        self._redis.incr(self._version_key(user_id))
+
+    def active_users(self, since: float) -> list:
+        self._redis.zremrangebyscore(self.ACTIVE_KEY, "-inf", f"({since}")
+        return self._redis.zrange(self.ACTIVE_KEY, 0, -1)
+
+
+class RecommendationCache:
+    """
+    Outfit recommendations per (user, occasion, weather), computed ahead of
+    the request.
+
+    Every night ``queue_precompute`` (the ``precompute_recommendations`` beat
+    task) spreads ``precompute`` tasks over the users who asked in the last
+    ``active_for`` seconds, which fill the cache for each of their contexts
+    from one load of their wardrobe. A request then returns the cached
+    outfit; one older than ``fresh_for`` is still returned, and a refresh is
+    queued through the outbox. Entries expire outright after ``ttl``.
+
+    Creating, updating or deleting an item bumps its owner's wardrobe
+    version (``invalidate``, after the commit). Entries remember the version
+    they were computed from, so all of that user's outfits stop matching at
+    once and the next request computes afresh.
+    """
+
+    # Users per precompute task
+    PRECOMPUTE_CHUNK = 50
+
+    # Every context precomputed for a user: occasions by weathers
+    CONTEXTS = [
+        (occasion, weather)
+        for occasion in (None, *RecommendationEngine.OCCASIONS)
+        for weather in (None, *RecommendationEngine.WEATHERS)
+    ]
+
+    def __init__(self, store, fresh_for=21600, ttl=172800, active_for=1209600):
+        self.store = store
+        self.fresh_for = fresh_for
+        self.ttl = ttl
+        self.active_for = active_for
+
+    @staticmethod
+    def context(occasion=None, weather=None):
+        """The cached context a request maps to; unknown values filter nothing."""
+        return (
+            occasion if occasion in RecommendationEngine.OCCASIONS else None,
+            weather if weather in RecommendationEngine.WEATHERS else None,
+        )
+
+    @staticmethod
+    def key(user_id, occasion=None, weather=None) -> str:
+        return f"rec:{user_id}:{occasion or ''}:{weather or ''}"
+
+    def get(self, user_id, occasion=None, weather=None) -> dict:
+        """The recommendation for a context, from the cache when it holds one."""
+        user_id = str(user_id)
+        occasion, weather = self.context(occasion, weather)
+        now = time.time()
+        try:
+            version, raw = self.store.lookup(
+                user_id, self.key(user_id, occasion, weather), seen_at=now
+            )
+        except redis.RedisError as e:
+            print(f"Recommendation cache unavailable, computing inline: {e}")
+            return RecommendationEngine.recommend_outfit(user_id, occasion, weather)
+
+        entry = json.loads(raw) if raw else None
+        if entry is None or entry["version"] != version:
+            return self.refresh(user_id, occasion, weather)
+        if now - entry["computed_at"] > self.fresh_for:
+            self._queue_refresh(user_id, occasion, weather)
+        return entry["recommendation"]
+
+    def refresh(self, user_id, occasion=None, weather=None, if_stale=False) -> dict:
+        """
+        Compute a context's recommendation and cache it. With ``if_stale``,
+        return None instead when the cached one is fresh and current.
+        """
+        context = (occasion, weather)
+        return self._refresh(str(user_id), [context], if_stale)[context]
+
+    def _refresh(self, user_id, contexts, if_stale):
+        """Refresh several contexts of a user from one load of their wardrobe."""
+        now = time.time()
+        try:
+            # Read the versions before the wardrobe: an edit committed in
+            # between then leaves these entries already stale, never wrongly fresh
+            found = {
+                context: self.store.lookup(user_id, self.key(user_id, *context))
+                for context in contexts
+            }
+        except redis.RedisError as e:
+            print(f"Recommendation cache unavailable, not caching: {e}")
+            return RecommendationEngine.recommend_outfits(user_id, contexts)
+
+        results = dict.fromkeys(contexts)
+        stale = [
+            context
+            for context, (version, raw) in found.items()
+            if not (if_stale and raw and self._is_fresh(json.loads(raw), version, now))
+        ]
+        if not stale:
+            return results
+
+        for context, recommendation in RecommendationEngine.recommend_outfits(
+            user_id, stale
+        ).items():
+            results[context] = recommendation
+            if "error" in recommendation:
+                continue
+            entry = {
+                "recommendation": recommendation,
+                "version": found[context][0],
+                "computed_at": now,
+            }
+            try:
+                # Items carry Decimal prices; str() them as jsonify does
+                raw = json.dumps(entry, default=str)
+                self.store.save(self.key(user_id, *context), raw, self.ttl)
+            except redis.RedisError as e:
+                print(f"Could not cache recommendation for user {user_id}: {e}")
+        return results
+
+    def _is_fresh(self, entry, version, now):
+        return (
+            entry["version"] == version and now - entry["computed_at"] <= self.fresh_for
+        )
+
+    def invalidate(self, user_id) -> None:
+        """Mark every cached recommendation of a user stale; call after commit."""
+        try:
+            self.store.bump(str(user_id))
+        except redis.RedisError as e:
+            # Entries are still refreshed once they pass fresh_for
+            print(f"Could not invalidate recommendations for user {user_id}: {e}")
+
+    def queue_precompute(self) -> int:
+        """Queue precompute tasks covering every active user; returns how many users."""
+        user_ids = self.store.active_users(time.time() - self.active_for)
+        outbox.enqueue_many(
+            "app.tasks.precompute_recommendations_task",
+            [
+                user_ids[offset : offset + self.PRECOMPUTE_CHUNK]
+                for offset in range(0, len(user_ids), self.PRECOMPUTE_CHUNK)
+            ],
+        )
+        db.session.commit()
+        return len(user_ids)
+
+    def precompute(self, user_ids) -> int:
+        """Refresh every stale context of these users; returns how many are cached."""
+        cached = 0
+        for user_id in user_ids:
+            try:
+                results = self._refresh(str(user_id), self.CONTEXTS, if_stale=True)
+            except Exception as e:
+                print(f"Could not precompute recommendations for {user_id}: {e}")
+                db.session.rollback()
+                continue
+            # None: still fresh from a request
+            cached += sum(
+                result is None or "error" not in result for result in results.values()
+            )
+        return cached
+
+    def _queue_refresh(self, user_id, occasion, weather):
+        key = self.key(user_id, occasion, weather)
+        try:
+            outbox.enqueue(
+                "app.tasks.refresh_recommendation_task",
+                [user_id, occasion, weather],
+                dedup_key=f"refresh_recommendation:{key}",
+            )
+            db.session.commit()
+        except Exception as e:
+            # The stale outfit is still served; the next request tries again
+            db.session.rollback()
+            print(f"Could not queue a recommendation refresh for {user_id}: {e}")
+
+
+# Create a singleton instance of the RecommendationCache. Without a Redis URL the
+# cache lives in this process, which only suits tests and dev.
+recommendation_cache = RecommendationCache(
+    store=(
+        RedisRecommendationStore(config.RECOMMENDATION_CACHE_REDIS_URL)
+        if config.RECOMMENDATION_CACHE_REDIS_URL
+        else InMemoryRecommendationStore()
+    ),
+    fresh_for=config.RECOMMENDATION_FRESH_FOR,
+    ttl=config.RECOMMENDATION_CACHE_TTL,
+    active_for=config.RECOMMENDATION_ACTIVE_DAYS * 86400,
+)
@@ -1,165 +1,619 @@
-from datetime import datetime, timedelta
-import random
-from sqlalchemy import func
-from app.models.clothing_item import Item
-from app.models.user import User
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import (
+    Float,
+    Integer,
+    String,
+    case,
+    cast,
+    false,
+    func,
+    select,
+    true,
+    type_coerce,
+)
+from sqlalchemy.dialects.postgresql import array
+
 from app.extensions import db
+from app.models.clothing_item import AuctionStatus, Item, item_load_options
+from app.models.user import User
+from app.utils.color import NAMED_COLORS, nearest_color_indices
 
 
-class RecommendationEngine:
-    @staticmethod
-    def recommend_outfit(user_id, occasion=None, weather=None):
-        """Generate personalized outfit recommendations"""
-        user = User.query.get(user_id)
-        if not user:
-            return {"error": "User not found"}
-
-        # Get user's wardrobe with size filtering
-        wardrobe_items = (
-            db.session.query(Item)
-            .filter(
-                Item.user_id == user_id,
-                Item.is_clean == True,  # Only clean items
-                # Item.season == get_current_season(),  # Seasonal filtering
+def _spellings(names):
+    """Category names with their plurals, as sellers type either."""
+    forms = set(names)
+    for name in names:
+        if name.endswith(("ss", "ch", "sh", "x")):
+            forms.add(name + "es")
+        elif not name.endswith("s"):
+            forms.add(name + "s")
+    return sorted(forms)
+
+
+# Outfit slots and the categories that fill them; the position is the slot code
+SLOT_CATEGORIES = {
+    "top": _spellings(
+        [
+            "top",
+            "t-shirt",
+            "tee",
+            "shirt",
+            "blouse",
+            "sweater",
+            "hoodie",
+            "sweatshirt",
+            "cardigan",
+            "tank top",
+            "polo",
+            "jumper",
+            "knitwear",
+        ]
+    ),
+    "bottom": _spellings(
+        [
+            "bottom",
+            "jeans",
+            "pants",
+            "trousers",
+            "shorts",
+            "skirt",
+            "leggings",
+            "chinos",
+            "joggers",
+        ]
+    ),
+    "one_piece": _spellings(["dress", "jumpsuit", "romper", "overalls"]),
+    "outerwear": _spellings(
+        [
+            "outerwear",
+            "jacket",
+            "coat",
+            "blazer",
+            "parka",
+            "raincoat",
+            "trench coat",
+            "puffer",
+            "vest",
+        ]
+    ),
+    "shoes": _spellings(
+        [
+            "shoe",
+            "shoes",
+            "sneaker",
+            "boot",
+            "heel",
+            "sandal",
+            "loafer",
+            "trainer",
+            "flats",
+            "footwear",
+        ]
+    ),
+    "accessories": _spellings(
+        [
+            "accessory",
+            "accessories",
+            "bag",
+            "hat",
+            "cap",
+            "belt",
+            "scarf",
+            "watch",
+            "jewelry",
+            "sunglasses",
+            "gloves",
+        ]
+    ),
+}
+SLOTS = list(SLOT_CATEGORIES)
+
+# Terms in an item's category, tags, style or vibe that tell how it wears
+FORMAL_TERMS = [
+    "formal",
+    "business",
+    "elegant",
+    "tailored",
+    "office",
+    "evening",
+    "suit",
+    "blazer",
+    "classic",
+]
+CASUAL_TERMS = [
+    "casual",
+    "streetwear",
+    "sporty",
+    "relaxed",
+    "athleisure",
+    "loungewear",
+    "everyday",
+    "hoodie",
+    "sneakers",
+]
+WARM_TERMS = [
+    "wool",
+    "knit",
+    "knitwear",
+    "fleece",
+    "down",
+    "puffer",
+    "sweater",
+    "coat",
+    "parka",
+    "winter",
+    "thermal",
+    "cashmere",
+]
+LIGHT_TERMS = ["linen", "summer", "shorts", "tank top", "sandals", "lightweight"]
+WATERPROOF_TERMS = [
+    "waterproof",
+    "water-resistant",
+    "water resistant",
+    "rain",
+    "raincoat",
+    "gore-tex",
+]
+
+# Colors that go with anything, as a bitmask over NAMED_COLORS
+_COLOR_NAMES = list(NAMED_COLORS)
+NEUTRAL_COLORS = sum(
+    1 << _COLOR_NAMES.index(name)
+    for name in (
+        "black",
+        "charcoal",
+        "grey",
+        "light grey",
+        "white",
+        "cream",
+        "beige",
+        "khaki",
+        "camel",
+        "navy",
+        "denim",
+    )
+)
+
+
+# Wear terms Postgres checks for, each setting one bit of an item's flags
+WEAR_TERMS = (FORMAL_TERMS, CASUAL_TERMS, WARM_TERMS, LIGHT_TERMS, WATERPROOF_TERMS)
+
+# Elements of a float8[] in Postgres's binary array format
+_FLOAT8_ELEMENTS = np.dtype([("length", ">i4"), ("value", ">f8")])
+
+
+class Wardrobe:
+    """
+    A user's items as parallel NumPy arrays, one position per item, so
+    context filters and scores run as array operations instead of per-item
+    Python.
+
+    Attributes:
+        ids: Item ids, as strings.
+        slots: Index into SLOTS, or -1 when the category fills no slot.
+        colors: Bitmask of the NAMED_COLORS nearest the dominant colors.
+        formality: 1 (casual) to 5 (formal).
+        warmth: 1 (light) to 4 (warm).
+        water_resistant: Booleans.
+        last_worn: Unix time, NaN for never.
+    """
+
+    def __init__(
+        self, ids, slots, colors, formality, warmth, water_resistant, last_worn
+    ):
+        self.ids = ids
+        self.slots = slots
+        self.colors = colors
+        self.formality = formality
+        self.warmth = warmth
+        self.water_resistant = water_resistant
+        self.last_worn = last_worn
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, user_id):
+        """
+        Load in one query. Postgres works out the slots and wear flags and
+        hands back plain text and numbers, which convert far faster than
+        UUIDs, arrays and numerics would.
+        """
+        items = Item.__table__
+        terms_type = items.c.tags.type
+        category = func.lower(items.c.category)
+        # The lowercased category and every term of an item, worked out once
+        # per row; OFFSET 0 stops Postgres inlining them into each use
+        words = (
+            select(
+                category.label("category"),
+                type_coerce(
+                    cast(array([category]), terms_type)
+                    + items.c.tags
+                    + items.c.style
+                    + items.c.vibe,
+                    terms_type,
+                ).label("terms"),
             )
-            .all()
+            .correlate(items)
+            .offset(0)
+            .lateral()
+        )
+        rows = db.session.execute(
+            select(
+                cast(items.c.id, String),
+                case(
+                    *(
+                        (words.c.category.in_(names), code)
+                        for code, names in enumerate(SLOT_CATEGORIES.values())
+                    ),
+                    else_=-1,
+                ),
+                func.array_to_string(items.c.dominant_colors, ""),
+                sum(
+                    cast(func.coalesce(words.c.terms.overlap(terms), false()), Integer)
+                    * (1 << bit)
+                    for bit, terms in enumerate(WEAR_TERMS)
+                ),
+                cast(func.extract("epoch", items.c.last_worn_at), Float),
+            )
+            .select_from(items.join(words, true()))
+            .where(
+                items.c.user_id == user_id,
+                items.c.auction_status != AuctionStatus.SOLD,
+            )
+        ).all()
+
+        ids, slots, colors, flags, last_worn = zip(*rows) if rows else [()] * 5
+        formal, casual, warm, light, waterproof = (
+            (np.array(flags, dtype=np.int64) >> bit) & 1
+            for bit in range(len(WEAR_TERMS))
+        )
+        return cls(
+            ids=np.array(ids, dtype=object),
+            slots=np.array(slots, dtype=np.int8),
+            colors=cls._color_masks(colors),
+            formality=3 + 2 * formal - 2 * casual,
+            warmth=2 + 2 * warm - light,
+            water_resistant=waterproof.astype(bool),
+            last_worn=np.array(last_worn, dtype=np.float64),  # None becomes NaN
         )
 
-        if not wardrobe_items:
-            return {"error": "No items in wardrobe"}
+    @staticmethod
+    def _color_masks(colors):
+        """
+        OR the color names nearest each item's dominant colors (given as
+        concatenated '#rrggbb' codes) into one bitmask per item.
+        """
+        colors = [codes or "" for codes in colors]
+        lengths = np.array([len(codes) // 7 for codes in colors], dtype=np.int64)
+        masks = np.zeros(len(colors), dtype=np.int64)
+        joined = "".join(colors)
+        if joined:
+            rgb = np.frombuffer(
+                bytes.fromhex(joined.replace("#", "")), dtype=np.uint8
+            ).reshape(-1, 3)
+            # Wardrobes repeat colors, so only look up each distinct one
+            packed = rgb.astype(np.int64) @ np.array([1 << 16, 1 << 8, 1])
+            unique, inverse = np.unique(packed, return_inverse=True)
+            nearest = nearest_color_indices(unique[:, None] >> [16, 8, 0] & 0xFF)
+            bits = np.left_shift(1, nearest[inverse])
+            has_colors = lengths > 0
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[has_colors]
+            masks[has_colors] = np.bitwise_or.reduceat(bits, starts)
+        return masks
 
-        # Apply recommendation strategy
-        if occasion or weather:
-            return RecommendationEngine._contextual_recommendation(
-                wardrobe_items, user, occasion, weather
+    def embeddings(self, indices):
+        """
+        Unit-length embeddings of the items at ``indices``, one row each and
+        zeros where an item has none. Only these items are read, so the cost
+        follows the number of candidates rather than the wardrobe size.
+        """
+        items = Item.__table__
+        ids = self.ids[indices]
+        rows = db.session.execute(
+            select(
+                cast(items.c.id, String),
+                # Postgres's binary array format reads straight into NumPy,
+                # where text or Python floats would take far longer to parse
+                func.array_send(items.c.embedding),
+            ).where(
+                items.c.id.in_(ids.tolist()), func.cardinality(items.c.embedding) > 0
             )
-        return RecommendationEngine._smart_baseline_recommendation(wardrobe_items, user)
+        ).all()
+        found = {}
+        for item_id, data in rows:
+            # Header: dimensions, has-nulls flag, element type, then the
+            # length and lower bound of each dimension
+            dimensions, has_nulls = np.frombuffer(data, ">i4", count=2)
+            if dimensions == 1 and not has_nulls:
+                elements = np.frombuffer(data, _FLOAT8_ELEMENTS, offset=20)
+                found[item_id] = elements["value"]
+
+        dim = max((len(vector) for vector in found.values()), default=0)
+        vectors = np.zeros((len(ids), dim), dtype=np.float32)
+        for row, item_id in enumerate(ids):
+            vector = found.get(item_id)
+            # Left out if made by an older embedding model of another size
+            if vector is not None and len(vector) == dim:
+                vectors[row] = vector
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+class RecommendationEngine:
+    # Context filters over a Wardrobe; other occasions and weathers filter nothing
+    CONTEXT_RULES = {
+        "formal": lambda w: w.formality >= 4,
+        "casual": lambda w: w.formality <= 2,
+        "rainy": lambda w: w.water_resistant,
+        "cold": lambda w: w.warmth >= 3,
+    }
+    OCCASIONS = ("formal", "casual")
+    WEATHERS = ("rainy", "cold")
+
+    # Weathers that call for a layer on top
+    OUTERWEAR_WEATHERS = ("rainy", "cold")
+
+    # Slots an outfit is built from, in search order: separates or a one piece
+    TEMPLATES = (("top", "bottom", "shoes"), ("one_piece", "shoes"))
+
+    # Accessories added to an outfit
+    ACCESSORIES = 2
+
+    # Best candidates per slot kept for the outfit search
+    SHORTLIST = 32
+
+    # Partial outfits kept after each step of the beam search
+    BEAM_WIDTH = 8
+
+    # Share of a pair's compatibility that comes from their embeddings
+    EMBEDDING_WEIGHT = 0.5
+
+    # Items worn more recently than this score lower
+    RECENTLY_WORN = 7 * 86400
 
     @staticmethod
-    def _contextual_recommendation(items, user, occasion, weather):
-        """Recommend based on occasion/weather"""
-        filtered = [
-            item
-            for item in items
-            if RecommendationEngine._matches_context(item, occasion, weather)
+    def recommend_outfit(user_id, occasion=None, weather=None):
+        """Generate personalized outfit recommendations"""
+        return RecommendationEngine.recommend_outfits(user_id, [(occasion, weather)])[
+            (occasion, weather)
         ]
 
-        if not filtered:
-            filtered = items  # Fallback to all items
+    @staticmethod
+    def recommend_outfits(user_id, contexts):
+        """
+        Recommend an outfit for each ``(occasion, weather)`` in ``contexts``,
+        loading the wardrobe once. Returns a dict keyed by context.
+        """
+        if not db.session.query(User.id).filter_by(id=user_id).first():
+            return {context: {"error": "User not found"} for context in contexts}
 
-        return RecommendationEngine._smart_baseline_recommendation(filtered, user)
+        wardrobe = Wardrobe.load(user_id)
+        if not len(wardrobe):
+            return {context: {"error": "No items in wardrobe"} for context in contexts}
 
-    @staticmethod
-    def _matches_context(item, occasion, weather):
-        """Check if item matches usage context"""
-        rules = {
-            "formal": lambda x: x.formality_rating >= 4,
-            "casual": lambda x: x.formality_rating <= 2,
-            "rainy": lambda x: x.water_resistant,
-            "cold": lambda x: x.warmth_rating >= 3,
-        }
+        engine = RecommendationEngine
+        palette = engine._extract_color_preferences(wardrobe)
+        scores = engine._item_scores(wardrobe, palette, datetime.utcnow().timestamp())
+        shortlists = {}
+        for occasion, weather in contexts:
+            mask = engine._context_mask(wardrobe, occasion, weather)
+            shortlists[(occasion, weather)] = {
+                slot: engine._shortlist(wardrobe, scores, mask, slot) for slot in SLOTS
+            }
 
-        checks = []
-        if occasion:
-            checks.append(rules.get(occasion, lambda x: True))
-        if weather:
-            checks.append(rules.get(weather, lambda x: True))
+        # Embeddings of every shortlisted item, in one query
+        pooled = np.unique(
+            np.concatenate(
+                [np.concatenate(list(slots.values())) for slots in shortlists.values()]
+            )
+        )
+        embeddings = wardrobe.embeddings(pooled)
 
-        return all(check(item) for check in checks)
+        def embeddings_of(indices):
+            return embeddings[np.searchsorted(pooled, indices)]
 
-    @staticmethod
-    def _smart_baseline_recommendation(items, user):
-        """Core recommendation logic"""
-        # Group by category using actual item types
-        categorized = {
-            "tops": [],
-            "bottoms": [],
-            "outerwear": [],
-            "accessories": [],
-            "shoes": [],
-        }
+        picks, confidences = {}, {}
+        for context, shortlist in shortlists.items():
+            picks[context], confidences[context] = engine._pick_outfit(
+                wardrobe, scores, shortlist, embeddings_of, weather=context[1]
+            )
 
-        # for item in items:
-        #     if item.category in categorized:
-        #         categorized[item.category].append(item)
-        #     elif item.item_type:  # Fallback to type detection
-        #         detected = detect_category(item)
-        #         if detected in categorized:
-        #             categorized[detected].append(item)
-
-        # Apply color coordination
-        color_palette = RecommendationEngine._extract_color_preferences(user, items)
-
-        # Select items
-        selection = {
-            "top": RecommendationEngine._select_item(
-                categorized["tops"], color_palette
-            ),
-            "bottom": RecommendationEngine._select_item(
-                categorized["bottoms"], color_palette
-            ),
-            "shoes": RecommendationEngine._select_item(
-                categorized["shoes"], color_palette
-            ),
-            "accessories": RecommendationEngine._select_accessories(
-                categorized["accessories"], color_palette
-            ),
+        # Serialize every chosen item with one query
+        chosen = {
+            wardrobe.ids[index]
+            for pick in picks.values()
+            for value in pick.values()
+            for index in (value if isinstance(value, list) else [value])
+            if index is not None
+        }
+        items = {
+            str(item.id): item
+            for item in Item.query.options(item_load_options("detail"))
+            .filter(Item.id.in_(chosen))
+            .all()
         }
 
-        # Add metadata
+        def serialize(index):
+            return items[wardrobe.ids[index]].to_dict() if index is not None else None
+
+        generated_at = datetime.utcnow().isoformat()
         return {
-            "outfit": {k: v.to_dict() if v else None for k, v in selection.items()},
-            "confidence": random.uniform(0.7, 0.9),  # Mock confidence score
-            "color_palette": color_palette,
-            "generated_at": datetime.utcnow().isoformat(),
+            context: {
+                "outfit": {
+                    slot: (
+                        [serialize(index) for index in value]
+                        if isinstance(value, list)
+                        else serialize(value)
+                    )
+                    for slot, value in pick.items()
+                },
+                "confidence": confidences[context],
+                "color_palette": [
+                    NAMED_COLORS[_COLOR_NAMES[bit]] for bit in palette["order"]
+                ],
+                "generated_at": generated_at,
+            }
+            for context, pick in picks.items()
         }
 
     @staticmethod
-    def _extract_color_preferences(user, items):
-        """Determine user's preferred color schemes"""
-        # Simple implementation - extend with AI later
-        color_counts = {}
-        for item in items:
-            for color in item.colors:
-                color_counts[color] = color_counts.get(color, 0) + 1
-
-        return sorted(color_counts.keys(), key=lambda x: -color_counts[x])[:3]
+    def _extract_color_preferences(wardrobe):
+        """The user's three most worn colors, as positions and as a bitmask."""
+        counts = (wardrobe.colors[:, None] >> np.arange(len(_COLOR_NAMES))) & 1
+        counts = counts.sum(axis=0)
+        order = [
+            int(bit) for bit in np.argsort(-counts, kind="stable")[:3] if counts[bit]
+        ]
+        return {"order": order, "mask": sum(1 << bit for bit in order)}
 
     @staticmethod
-    def _select_item(candidates, color_palette):
-        """Select best matching item from category"""
-        if not candidates:
-            return None
-
-        # Simple scoring - enhance with embeddings later
-        scored = []
-        for item in candidates:
-            score = 0
-            if any(c in color_palette for c in item.colors):
-                score += 2
-            if item.last_worn < datetime.utcnow() - timedelta(days=7):
-                score += 1
-            scored.append((score, item))
+    def _context_mask(wardrobe, occasion, weather):
+        mask = np.ones(len(wardrobe), dtype=bool)
+        for context in (occasion, weather):
+            rule = RecommendationEngine.CONTEXT_RULES.get(context)
+            if rule:
+                mask &= rule(wardrobe)
+        return mask
 
+    @staticmethod
+    def _item_scores(wardrobe, palette, now):
+        """Per-item score: palette colors, then how long since it was worn."""
+        unworn_for = np.where(
+            np.isnan(wardrobe.last_worn), np.inf, now - wardrobe.last_worn
+        )
         return (
-            max(scored, key=lambda x: x[0])[1] if scored else random.choice(candidates)
+            2.0 * ((wardrobe.colors & palette["mask"]) != 0)
+            + 1.0 * (unworn_for > RecommendationEngine.RECENTLY_WORN)
+            # Tie-break towards the longest unworn, over about a month
+            + 0.1 * np.minimum(unworn_for / (30 * 86400), 1.0)
         )
 
     @staticmethod
-    def _select_accessories(candidates, color_palette):
-        """Select 1-2 accessories"""
-        if not candidates:
-            return []
+    def _compatibility(wardrobe, candidates, embeddings):
+        """
+        Compatibility of every pair of ``candidates`` (item positions, with
+        their embeddings as rows), from -1 to 1.
 
-        accessories = [
-            acc for acc in candidates if any(c in color_palette for c in acc.colors)
-        ][:2]
+        Colors give 1 when they go together (a shared color, or a neutral on
+        either side), less a penalty for mismatched formality. This is
+        blended with how much more alike the two look than is usual for their
+        slots, as pieces in one visual style go together: the z-score of
+        their embeddings' cosine similarity among the candidates for those
+        slots, squashed by tanh. Pairs missing an embedding count as usual
+        (0), so having one neither helps nor hurts an item.
+        """
+        colors = wardrobe.colors[candidates]
+        neutral = ((colors & NEUTRAL_COLORS) != 0) | (colors == 0)
+        shared = (colors[:, None] & colors[None, :]) != 0
+        harmony = shared | neutral[:, None] | neutral[None, :]
+        formality = wardrobe.formality[candidates]
+        clash = np.abs(formality[:, None] - formality[None, :])
+        matching = harmony - clash / 4.0
 
-        return (
-            accessories
-            if accessories
-            else random.sample(candidates, min(2, len(candidates)))
+        has_embedding = embeddings.any(axis=1)
+        both = has_embedding[:, None] & has_embedding[None, :]
+
+        # Every pair's similarity in one product, then standardized per pair
+        # of slots: garments of different kinds never look much alike
+        similarity = embeddings @ embeddings.T
+        slots = wardrobe.slots[candidates].astype(np.int64)
+        blocks = slots[:, None] * len(SLOTS) + slots[None, :]
+        count, total, squares = (
+            np.bincount(
+                blocks[both], weights=weights, minlength=len(SLOTS) ** 2
+            ).astype(np.float64)
+            for weights in (None, similarity[both], similarity[both] ** 2)
         )
+        mean = total / np.maximum(count, 1)
+        std = np.sqrt(np.maximum(squares / np.maximum(count, 1) - mean**2, 0))
+        z = (similarity - mean[blocks]) / np.where(std > 1e-6, std, np.inf)[blocks]
+        looks = np.where(both, np.tanh(z), 0.0)
+
+        weight = RecommendationEngine.EMBEDDING_WEIGHT
+        return (1 - weight) * matching + weight * looks
+
+    @staticmethod
+    def _shortlist(wardrobe, scores, mask, slot):
+        """Best candidates for a slot in context; the whole slot if none fit."""
+        in_slot = wardrobe.slots == SLOTS.index(slot)
+        candidates = np.flatnonzero(in_slot & mask)
+        if not len(candidates):
+            candidates = np.flatnonzero(in_slot)
+        limit = RecommendationEngine.SHORTLIST
+        if len(candidates) > limit:
+            best = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[best]
+        return candidates
+
+    @staticmethod
+    def _pick_outfit(wardrobe, scores, shortlist, embeddings_of, weather=None):
+        """
+        Beam search for the outfit with the best item scores plus pairwise
+        compatibility. Each template's slots, then the outerwear and the
+        accessories, are filled in turn: every step extends the best
+        BEAM_WIDTH partial outfits by each candidate for the slot and keeps
+        the best BEAM_WIDTH, so the work is bounded by the shortlists
+        whatever the wardrobe size.
+
+        Returns the outfit, as item positions per slot, and its confidence:
+        the mean compatibility of its pairs, from 0 to 1.
+        """
+        engine = RecommendationEngine
+        # Every shortlisted item in one pool, compared with each other once
+        pool = np.concatenate([shortlist[slot] for slot in SLOTS])
+        bounds = np.cumsum([0] + [len(shortlist[slot]) for slot in SLOTS])
+        compatibility = engine._compatibility(wardrobe, pool, embeddings_of(pool))
+        gains = scores[pool]
+
+        extras = ["outerwear"] if weather in engine.OUTERWEAR_WEATHERS else []
+        extras += ["accessories"] * engine.ACCESSORIES
+
+        best, best_mean = np.zeros(0, dtype=np.int64), -np.inf
+        for template in engine.TEMPLATES:
+            # A template needs one of its garments; shoes alone are no outfit
+            if not any(len(shortlist[slot]) for slot in template[:-1]):
+                continue
+            beam, totals = np.zeros((1, 0), dtype=np.int64), np.zeros(1)
+            for slot in (*template, *extras):
+                code = SLOTS.index(slot)
+                candidates = np.arange(bounds[code], bounds[code + 1])
+                # Each extension: the item's score plus its compatibility
+                # with every item already in that partial outfit
+                worn_with = compatibility[beam[:, :, None], candidates].sum(axis=1)
+                step = gains[candidates] + worn_with
+                step[(beam[:, :, None] == candidates).any(axis=1)] = -np.inf
+                extended = totals[:, None] + step
+                keep = min(engine.BEAM_WIDTH, int(np.isfinite(extended).sum()))
+                if not keep:
+                    continue  # Slot empty, or every candidate already worn
+                flat = np.argpartition(-extended, keep - 1, axis=None)[:keep]
+                rows, columns = np.unravel_index(flat, extended.shape)
+                beam = np.column_stack([beam[rows], candidates[columns]])
+                totals = extended[rows, columns]
+
+            # Outfits differ in size, so compare them per item and pair
+            size = beam.shape[1]
+            means = totals / (size + size * (size - 1) / 2)
+            top = int(np.argmax(means))
+            if means[top] > best_mean:
+                best, best_mean = beam[top], means[top]
+
+        pairs = compatibility[np.ix_(best, best)][np.triu_indices(len(best), 1)]
+        confidence = float((1 + pairs.mean()) / 2) if len(pairs) else 0.0
+
+        outfit = dict.fromkeys(["top", "bottom", "one_piece", "outerwear", "shoes"])
+        outfit["accessories"] = []
+        for index in pool[best]:
+            slot = SLOTS[wardrobe.slots[index]]
+            if slot == "accessories":
+                outfit[slot].append(int(index))
+            else:
+                outfit[slot] = int(index)
+        return outfit, confidence
 
 
 recommendation_engine = RecommendationEngine()
@@ -1,9 +1,38 @@
-from app.models.clothing_item import Item
+import re
+
+from app.config import config
+from app.models.clothing_item import (
+    COLOR_INDEX_MAX_COLORS,
+    Item,
+    color_index_values,
+    search_vector_expression,
+)
 from app.extensions import db
-from sqlalchemy import or_
+from app.utils.color import cells_within, hex_to_lab
+from app.utils.pagination import keyset_paginate
+from sqlalchemy import (
+    Float,
+    Numeric,
+    String,
+    bindparam,
+    case,
+    cast,
+    func,
+    or_,
+    select,
+    true,
+)
+from sqlalchemy.dialects import postgresql
+
+# Characters that carry meaning in to_tsquery syntax and must not reach it raw
+_TSQUERY_TERM_RE = re.compile(r"[\w-]+", re.UNICODE)
+HEX_COLOR_RE = re.compile(r"^#[0-9a-fA-F]{6}$")
 
 
 class SearchService:
+    def __init__(self, mode=None):
+        self.mode = mode or config.SEARCH_MODE
+
     def search_items(
         self,
         query="",
@@ -12,6 +41,7 @@ class SearchService:
         order="desc",
         page=1,
         per_page=20,
+        load_options=(),
     ):
         """
         Search for clothing items with filters and sorting
@@ -19,31 +49,84 @@ class SearchService:
         Args:
             query (str): Search query string
             filters (dict): Dictionary of filters to apply
-            sort (str): Field to sort by (e.g., price, created_at)
+            sort (str): Field to sort by (e.g., price, created_at, relevance).
+                With a ``color_tolerance`` filter, relevance ranks by color distance
             order (str): Sort order (asc or desc)
             page (int): Page number
             per_page (int): Results per page
+            load_options: Query options limiting the loaded columns
 
         Returns:
             Pagination object containing the search results
         """
-        # Start with base query
+        base_query = self._filtered_query(query, filters).options(*load_options)
+        sort_keys = self._sort_keys(query, filters, sort, order)
+        base_query = base_query.order_by(
+            *(key.desc() if descending else key.asc() for key, descending in sort_keys)
+        )
+
+        # Apply pagination
+        return base_query.paginate(page=page, per_page=per_page)
+
+    def search_items_page(
+        self,
+        query="",
+        filters=None,
+        sort="created_at",
+        order="desc",
+        cursor=None,
+        per_page=20,
+        with_total=False,
+        load_options=(),
+    ):
+        """
+        Keyset-paginated variant of ``search_items``
+
+        Args:
+            cursor (str): ``next_cursor`` of the previous page, if any
+            with_total (bool): Include an estimated total
+
+        Returns:
+            KeysetPage containing the search results
+        """
+        return keyset_paginate(
+            self._filtered_query(query, filters).options(*load_options),
+            self._sort_keys(query, filters, sort, order),
+            cursor=cursor,
+            per_page=per_page,
+            with_total=with_total,
+        )
+
+    def _sort_keys(self, query, filters, sort, order):
+        """``(expression, descending)`` pairs for a sort, ending with Item.id"""
+        if sort == "relevance":
+            keys = []
+            distance = self._color_distance(filters)
+            if distance is not None:
+                keys.append((distance, False))
+            rank = self._relevance(query)
+            if rank is not None:
+                keys.append((rank, True))
+            # Newest first breaks ties, or orders everything if nothing ranks
+            keys.append((Item.created_at, True))
+            keys.append((Item.id, True))
+            return keys
+
+        descending = order.lower() == "desc"
+        return [(getattr(Item, sort), descending), (Item.id, descending)]
+
+    def _filtered_query(self, query="", filters=None):
+        """Public items matching the text query and the exact-match filters"""
         base_query = Item.query.filter(Item.is_public == True)
 
         # Apply text search if query is provided
         if query:
-            search_terms = query.split()
-            search_conditions = []
-            for term in search_terms:
-                search_conditions.append(
-                    or_(
-                        Item.name.ilike(f"%{term}%"),
-                        Item.description.ilike(f"%{term}%"),
-                        Item.brand.ilike(f"%{term}%"),
-                        Item.category.ilike(f"%{term}%"),
-                    )
-                )
-            base_query = base_query.filter(or_(*search_conditions))
+            if self.mode == "fulltext":
+                tsquery = self._build_tsquery(query)
+                if tsquery is not None:
+                    base_query = base_query.filter(Item.search_vector.op("@@")(tsquery))
+            else:
+                base_query = base_query.filter(self._ilike_condition(query))
 
         # Apply filters
         if filters:
@@ -52,93 +135,289 @@ class SearchService:
                     base_query = base_query.filter(Item.price >= value)
                 elif field == "max_price":
                     base_query = base_query.filter(Item.price <= value)
+                elif field == "color":
+                    if "color_tolerance" in filters:
+                        base_query = base_query.filter(
+                            *self._color_conditions(value, filters["color_tolerance"])
+                        )
+                    else:
+                        base_query = base_query.filter(Item.dominant_colors.any(value))
+                elif field == "color_tolerance":
+                    continue
                 else:
                     # Other filters use exact match
                     base_query = base_query.filter(getattr(Item, field) == value)
 
-        # Apply sorting
-        sort_field = getattr(Item, sort)
-        if order.lower() == "desc":
-            sort_field = sort_field.desc()
-        else:
-            sort_field = sort_field.asc()
-        base_query = base_query.order_by(sort_field)
+        return base_query
 
-        # Apply pagination
-        return base_query.paginate(page=page, per_page=per_page)
+    def _build_tsquery(self, query):
+        """
+        Turn free text into a prefix-matching tsquery, e.g. "red nik" becomes
+        ``red:* | nik:*``. Returns None if the query has no searchable terms.
+        """
+        terms = _TSQUERY_TERM_RE.findall(query.lower())
+        terms = [term.strip("-") for term in terms if term.strip("-")]
+        if not terms:
+            return None
+        return func.to_tsquery(
+            config.SEARCH_TEXT_CONFIG, " | ".join(f"{term}:*" for term in terms)
+        )
 
-    def get_facets(self, query="", filters=None):
+    def _relevance(self, query):
+        """ts_rank expression for the query, or None when ranking is not possible"""
+        if not query or self.mode != "fulltext":
+            return None
+        tsquery = self._build_tsquery(query)
+        if tsquery is None:
+            return None
+        # ts_rank is a float4, which psycopg2 reads back rounded; as a double
+        # it round-trips exactly through pagination cursors
+        return cast(func.ts_rank(Item.search_vector, tsquery), Float)
+
+    def _color_conditions(self, color, tolerance):
+        """
+        Filters for items with a dominant color within ``tolerance`` (CIE76
+        delta E) of ``color``. The GIN-indexed grid cells narrow the candidates,
+        and the exact distance is only computed for those.
+        """
+        if not HEX_COLOR_RE.match(color):
+            raise ValueError(f"color must be a hex code like #223355, got {color!r}")
+        tolerance = min(max(float(tolerance), 0.0), config.COLOR_MAX_TOLERANCE)
+        cells = cells_within(hex_to_lab(color), tolerance, config.COLOR_GRID_SIZE)
+        return (
+            Item.color_cells.overlap(cast(cells, postgresql.ARRAY(db.Integer))),
+            self._distance_to(color) <= tolerance,
+        )
+
+    def _color_distance(self, filters):
+        """Distance expression for a color similarity filter, or None"""
+        if not filters or "color" not in filters or "color_tolerance" not in filters:
+            return None
+        return self._distance_to(filters["color"])
+
+    def _distance_to(self, color):
+        """SQL expression: smallest delta E between ``color`` and an item's colors"""
+        lab = [float(value) for value in hex_to_lab(color)]
+        # Inline LEAST over the fixed number of indexed colors; out-of-range
+        # array subscripts are NULL, which LEAST ignores
+        distances = []
+        for position in range(COLOR_INDEX_MAX_COLORS):
+            squared = [
+                func.power(
+                    Item.color_lab[3 * position + axis + 1]
+                    - bindparam(None, lab[axis]),
+                    2,
+                )
+                for axis in range(3)
+            ]
+            distances.append(func.sqrt(squared[0] + squared[1] + squared[2]))
+        return func.least(*distances)
+
+    def _ilike_condition(self, query):
+        """Legacy substring match, kept for SEARCH_MODE=ilike and benchmarking"""
+        search_conditions = []
+        for term in query.split():
+            search_conditions.append(
+                or_(
+                    Item.title.ilike(f"%{term}%"),
+                    Item.description.ilike(f"%{term}%"),
+                    Item.brand.ilike(f"%{term}%"),
+                    Item.category.ilike(f"%{term}%"),
+                )
+            )
+        return or_(*search_conditions)
+
+    def get_facets(self, query="", filters=None, limit=None):
         """
         Get available facets for the current search results
 
+        All facets are counted in a single GROUPING SETS pass over the
+        filtered result set, so they always agree with the search results.
+
         Args:
             query (str): Search query string
             filters (dict): Dictionary of filters to apply
+            limit (int): Only return the top ``limit`` values per facet
+                (price ranges are never truncated)
 
         Returns:
             dict: Dictionary containing facet counts
         """
-        # Start with base query
-        base_query = Item.query.filter(Item.is_public == True)
+        matched = (
+            self._filtered_query(query, filters)
+            .with_entities(
+                Item.category,
+                Item.brand,
+                Item.size_value,
+                Item.condition,
+                Item.price,
+                Item.dominant_colors,
+            )
+            .subquery()
+        )
 
-        # Apply text search if query is provided
-        if query:
-            search_terms = query.split()
-            search_conditions = []
-            for term in search_terms:
-                search_conditions.append(
-                    or_(
-                        Item.name.ilike(f"%{term}%"),
-                        Item.description.ilike(f"%{term}%"),
-                        Item.brand.ilike(f"%{term}%"),
-                        Item.category.ilike(f"%{term}%"),
+        # One row per (item, color); items without colors keep a single row
+        colors = (
+            func.unnest(matched.c.dominant_colors)
+            .table_valued("color", with_ordinality="position")
+            .render_derived(name="colors")
+            .lateral()
+        )
+        price_bucket = func.width_bucket(
+            matched.c.price,
+            cast(
+                postgresql.array(config.SEARCH_PRICE_BUCKETS),
+                postgresql.ARRAY(Numeric),
+            ),
+        )
+        facet_columns = {
+            "categories": matched.c.category,
+            "brands": matched.c.brand,
+            "colors": colors.c.color,
+            "sizes": matched.c.size_value,
+            "conditions": matched.c.condition,
+            "price_ranges": price_bucket,
+        }
+
+        # Count each item once, except in the colors facet where one item
+        # legitimately contributes to several values
+        item_count = func.count().filter(
+            or_(colors.c.position.is_(None), colors.c.position == 1)
+        )
+        is_group = {
+            name: func.grouping(col) == 0 for name, col in facet_columns.items()
+        }
+        counts = (
+            select(
+                case(*((is_group[name], name) for name in facet_columns)).label(
+                    "facet"
+                ),
+                case(
+                    *(
+                        (is_group[name], cast(col, String))
+                        for name, col in facet_columns.items()
                     )
-                )
-            base_query = base_query.filter(or_(*search_conditions))
+                ).label("value"),
+                case(
+                    (is_group["colors"], func.count(colors.c.color)),
+                    else_=item_count,
+                ).label("count"),
+            )
+            .select_from(matched.outerjoin(colors, true()))
+            .group_by(func.grouping_sets(*facet_columns.values()))
+            .subquery()
+        )
 
-        # Apply filters
-        if filters:
-            for field, value in filters.items():
-                if field == "min_price":
-                    base_query = base_query.filter(Item.price >= value)
-                elif field == "max_price":
-                    base_query = base_query.filter(Item.price <= value)
-                else:
-                    # Other filters use exact match
-                    base_query = base_query.filter(getattr(Item, field) == value)
+        ranked = select(
+            counts.c.facet,
+            counts.c.value,
+            counts.c["count"],
+            func.row_number()
+            .over(
+                partition_by=counts.c.facet,
+                order_by=(counts.c["count"].desc(), counts.c.value),
+            )
+            .label("rank"),
+        ).where(counts.c.value.isnot(None), counts.c["count"] > 0)
+        ranked = ranked.subquery()
 
-        # Get facet counts
-        facets = {
-            "categories": db.session.query(Item.category, db.func.count(Item.id))
-            .filter(Item.category.isnot(None))
-            .group_by(Item.category)
-            .all(),
-            "brands": db.session.query(Item.brand, db.func.count(Item.id))
-            .filter(Item.brand.isnot(None))
-            .group_by(Item.brand)
-            .all(),
-            "colors": db.session.query(Item.color, db.func.count(Item.id))
-            .filter(Item.color.isnot(None))
-            .group_by(Item.color)
-            .all(),
-            "sizes": db.session.query(Item.size, db.func.count(Item.id))
-            .filter(Item.size.isnot(None))
-            .group_by(Item.size)
-            .all(),
-            "conditions": db.session.query(Item.condition, db.func.count(Item.id))
-            .filter(Item.condition.isnot(None))
-            .group_by(Item.condition)
-            .all(),
-        }
+        statement = select(ranked.c.facet, ranked.c.value, ranked.c["count"])
+        if limit:
+            statement = statement.where(
+                or_(ranked.c.facet == "price_ranges", ranked.c.rank <= limit)
+            )
+        statement = statement.order_by(ranked.c.facet, ranked.c.rank)
 
-        # Convert to dictionary format
-        return {
-            "categories": [{"name": c[0], "count": c[1]} for c in facets["categories"]],
-            "brands": [{"name": b[0], "count": b[1]} for b in facets["brands"]],
-            "colors": [{"name": c[0], "count": c[1]} for c in facets["colors"]],
-            "sizes": [{"name": s[0], "count": s[1]} for s in facets["sizes"]],
-            "conditions": [{"name": c[0], "count": c[1]} for c in facets["conditions"]],
-        }
+        facets = {name: [] for name in facet_columns}
+        for facet, value, count in db.session.execute(statement):
+            if facet == "price_ranges":
+                facets[facet].append(dict(self._price_range(int(value)), count=count))
+            else:
+                facets[facet].append({"name": value, "count": count})
+
+        facets["price_ranges"].sort(key=lambda bucket: bucket["min"] or 0)
+        return facets
+
+    def _price_range(self, bucket):
+        """Bounds for a width_bucket() index over SEARCH_PRICE_BUCKETS"""
+        bounds = config.SEARCH_PRICE_BUCKETS
+        low = bounds[bucket - 1] if bucket > 0 else None
+        high = bounds[bucket] if bucket < len(bounds) else None
+        if low is None:
+            name = f"<{high}"
+        elif high is None:
+            name = f"{low}+"
+        else:
+            name = f"{low}-{high}"
+        return {"name": name, "min": low, "max": high}
+
+    def reindex_color_index(self, batch_size=10000):
+        """
+        Backfill ``items.color_lab``/``color_cells`` for rows written before
+        they existed, or after COLOR_GRID_SIZE changed. Returns the number of
+        rows updated.
+        """
+        updated, last_id = 0, None
+        while True:
+            batch = db.session.query(Item.id, Item.dominant_colors).filter(
+                Item.dominant_colors.isnot(None)
+            )
+            if last_id is not None:
+                batch = batch.filter(Item.id > last_id)
+            rows = batch.order_by(Item.id).limit(batch_size).all()
+            if not rows:
+                return updated
+
+            values = []
+            for item_id, dominant_colors in rows:
+                color_lab, color_cells = color_index_values(dominant_colors)
+                values.append(
+                    {"_id": item_id, "color_lab": color_lab, "color_cells": color_cells}
+                )
+            db.session.execute(
+                Item.__table__.update()
+                .where(Item.id == bindparam("_id"))
+                .values(
+                    color_lab=bindparam("color_lab"),
+                    color_cells=bindparam("color_cells"),
+                ),
+                values,
+            )
+            db.session.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+
+    def reindex_search_vectors(self, batch_size=10000):
+        """
+        Backfill ``items.search_vector`` for rows written before it existed.
+
+        Runs set-based UPDATEs in batches of ``batch_size`` rows and returns
+        the number of rows updated.
+        """
+        expression = search_vector_expression(
+            title=Item.title,
+            brand=Item.brand,
+            category=Item.category,
+            description=Item.description,
+            tags=func.array_to_string(Item.tags, " "),
+        )
+        updated = 0
+        while True:
+            batch = (
+                db.session.query(Item.id)
+                .filter(Item.search_vector.is_(None))
+                .limit(batch_size)
+                .subquery()
+            )
+            result = db.session.execute(
+                Item.__table__.update()
+                .where(Item.id.in_(db.select(batch.c.id)))
+                .values(search_vector=expression)
+            )
+            db.session.commit()
+            updated += result.rowcount
+            if result.rowcount < batch_size:
+                return updated
 
 
 # Create singleton instance
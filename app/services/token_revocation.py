@@ -0,0 +1,269 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import redis
+from flask import current_app
+
+from app.config import config
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing over one blake2b)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class TokenRevocationCache:
+    """
+    Answers "is this JWT revoked?" without a database round-trip for the
+    common case of a live token.
+
+    Each worker process keeps a Bloom filter of revoked JTIs. A miss in the
+    filter means the token is definitely not revoked. A hit is confirmed
+    against a Redis sorted set of JTIs scored by token expiry, and against
+    Postgres (``TokenBlocklist``, the authoritative store) when Redis has no
+    entry or is unavailable.
+
+    Revocations are published on a Redis channel, and a subscriber thread per
+    worker adds them to its filter. The filter is rebuilt from Redis every
+    ``rebuild_interval`` seconds, and after a lost subscription, so expired
+    JTIs drop out and missed messages are recovered. Until a worker's filter
+    has been built, every check goes to the authoritative store. If the Redis
+    set is missing (first deploy, flushed Redis) it is seeded from Postgres.
+    """
+
+    REVOKED_KEY = "jwt:revoked"
+    CHANNEL = "jwt:revoked"
+    REVOKE_ATTEMPTS = 3
+
+    def __init__(self, redis_url, capacity, error_rate, rebuild_interval):
+        self.redis_url = redis_url
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self._redis = (
+            redis.Redis.from_url(
+                redis_url, socket_connect_timeout=0.5, socket_timeout=0.5
+            )
+            if redis_url
+            else None
+        )
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._built_at = 0.0
+        self._pid = None
+        # Revocations received lately, replayed into a freshly built filter
+        self._recent = deque(maxlen=10000)
+        self.stats = {
+            "checks": 0,
+            "bloom_negatives": 0,  # answered locally: not revoked
+            "confirmed_revoked": 0,
+            "false_positives": 0,  # filter said maybe, store said no
+            "unfiltered_checks": 0,  # no filter yet, asked the store
+        }
+
+    # --- Public API ---------------------------------------------------------
+
+    def is_revoked(self, jti: str) -> bool:
+        self._ensure_started()
+        bloom = self._bloom
+        self._count("checks")
+
+        if bloom is not None and jti not in bloom:
+            self._count("bloom_negatives")
+            return False
+
+        revoked = self._lookup(jti)
+        if bloom is None:
+            self._count("unfiltered_checks")
+        elif revoked:
+            self._count("confirmed_revoked")
+        else:
+            self._count("false_positives")
+        return revoked
+
+    def revoke(self, jti: str, expires_at: datetime) -> None:
+        """
+        Record a revocation in Redis and tell every worker about it. The
+        caller stores the ``TokenBlocklist`` row, and commits it only once
+        this returns: other workers' filters never learn of a revocation
+        Redis did not take, so after ``REVOKE_ATTEMPTS`` tries the
+        ``redis.RedisError`` is raised for the logout to fail.
+        """
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        if self._redis is None:
+            return
+        for attempt in range(1, self.REVOKE_ATTEMPTS + 1):
+            try:
+                pipe = self._redis.pipeline()
+                pipe.zadd(self.REVOKED_KEY, {jti: expires_at.timestamp()})
+                pipe.publish(self.CHANNEL, jti)
+                pipe.execute()
+                return
+            except redis.RedisError as e:
+                print(f"Could not publish token revocation {jti}: {e}")
+                if attempt == self.REVOKE_ATTEMPTS:
+                    raise
+                time.sleep(0.05 * attempt)
+
+    def purge_expired(self) -> int:
+        """Drop expired JTIs from the Redis store; returns how many went."""
+        if self._redis is None:
+            return 0
+        try:
+            return self._redis.zremrangebyscore(self.REVOKED_KEY, "-inf", time.time())
+        except redis.RedisError:
+            return 0
+
+    def metrics(self) -> dict:
+        stats = dict(self.stats)
+        filtered = stats["checks"] - stats["unfiltered_checks"]
+        negatives = stats["bloom_negatives"] + stats["false_positives"]
+        stats["hit_rate"] = stats["bloom_negatives"] / filtered if filtered else 0.0
+        stats["false_positive_rate"] = (
+            stats["false_positives"] / negatives if negatives else 0.0
+        )
+        stats["filter_entries"] = self._bloom.count if self._bloom else 0
+        return stats
+
+    # --- Authoritative lookups ----------------------------------------------
+
+    def _lookup(self, jti):
+        if self._redis is not None:
+            try:
+                expires = self._redis.zscore(self.REVOKED_KEY, jti)
+                if expires is not None:
+                    return expires > time.time()
+            except redis.RedisError:
+                pass
+        # Not in Redis: a false positive, or a revocation Redis lost
+        return self._lookup_database(jti)
+
+    def _lookup_database(self, jti):
+        from app.models.token_blocklist import TokenBlocklist
+
+        return TokenBlocklist.query.filter_by(jti=jti).scalar() is not None
+
+    # --- Filter maintenance -------------------------------------------------
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._bloom = None
+                    if self._redis is not None:
+                        threading.Thread(
+                            target=self._subscribe,
+                            args=(current_app._get_current_object(),),
+                            name="jwt-revocations",
+                            daemon=True,
+                        ).start()
+        elif self._bloom is not None and (
+            time.monotonic() - self._built_at > self.rebuild_interval
+        ):
+            self._built_at = time.monotonic()
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        """Build a fresh filter from the unexpired JTIs in Redis."""
+        try:
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            for jti, _ in self._redis.zscan_iter(self.REVOKED_KEY, count=5000):
+                bloom.add(jti.decode())
+            # Before swapping in, so no check sees the filter without them
+            for jti in list(self._recent):
+                bloom.add(jti)
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+        except redis.RedisError as e:
+            print(f"Could not rebuild token revocation filter: {e}")
+            self._bloom = None
+
+    def _seed_from_database(self, app):
+        """Copy unexpired TokenBlocklist rows into Redis if the set is missing."""
+        from app.models.token_blocklist import TokenBlocklist
+
+        if self._redis.exists(self.REVOKED_KEY):
+            return
+        with app.app_context():
+            rows = TokenBlocklist.query.with_entities(
+                TokenBlocklist.jti, TokenBlocklist.expires_at
+            ).filter(TokenBlocklist.expires_at > datetime.utcnow())
+            batch = {}
+            for jti, expires_at in rows.yield_per(5000):
+                batch[jti] = expires_at.timestamp()
+                if len(batch) == 5000:
+                    self._redis.zadd(self.REVOKED_KEY, batch)
+                    batch = {}
+            if batch:
+                self._redis.zadd(self.REVOKED_KEY, batch)
+
+    def _subscribe(self, app):
+        # A dedicated connection without a read timeout, since listen() blocks
+        client = redis.Redis.from_url(
+            self.redis_url, socket_connect_timeout=0.5, health_check_interval=30
+        )
+        delay = 1
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.CHANNEL)
+                # Subscribe first, then build, so nothing falls in between
+                self._seed_from_database(app)
+                self.purge_expired()
+                self._rebuild()
+                delay = 1
+                for message in pubsub.listen():
+                    jti = message["data"].decode()
+                    self._recent.append(jti)
+                    bloom = self._bloom
+                    if bloom is not None:
+                        bloom.add(jti)
+            except Exception as e:
+                print(f"Token revocation subscription lost, retrying: {e}")
+            finally:
+                self._bloom = None
+                pubsub.close()
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def _count(self, counter):
+        self.stats[counter] += 1
+
+
+# Create a singleton instance of the TokenRevocationCache.
+token_revocation = TokenRevocationCache(
+    redis_url=config.TOKEN_REVOCATION_REDIS_URL,
+    capacity=config.TOKEN_REVOCATION_BLOOM_CAPACITY,
+    error_rate=config.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+    rebuild_interval=config.TOKEN_REVOCATION_REBUILD_INTERVAL,
+)
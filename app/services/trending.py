@@ -0,0 +1,240 @@
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+from sqlalchemy import Float, column, func, update, values
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.config import config
+from app.extensions import db
+from app.models.clothing_item import Item
+
+
+def _log2_add(a: float, b: float) -> float:
+    """log2(2**a + 2**b), computed without leaving log space."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+class InMemoryTrendingStore:
+    """Process-local stand-in for ``RedisTrendingStore``, for tests and dev."""
+
+    def __init__(self):
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def add(self, member: str, score: float) -> None:
+        with self._lock:
+            current = self._scores.get(member)
+            self._scores[member] = (
+                score if current is None else _log2_add(current, score)
+            )
+
+    def pop(self, limit: int) -> dict:
+        with self._lock:
+            members = list(self._scores)[:limit]
+            return {member: self._scores.pop(member) for member in members}
+
+
+class RedisTrendingStore:
+    """Pending score increments in a Redis sorted set, in log space."""
+
+    KEY = "trending:pending"
+
+    # Merge an increment into a member's pending score: scores are log2 of
+    # the decayed sum, so adding happens in log space
+    ADD_SCRIPT = """
+    local score = tonumber(ARGV[2])
+    local current = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if current then
+        current = tonumber(current)
+        local high, low = math.max(current, score), math.min(current, score)
+        score = high + math.log(1 + 2 ^ (low - high)) / math.log(2)
+    end
+    redis.call('ZADD', KEYS[1], score, ARGV[1])
+    """
+
+    def __init__(self, redis_url: str):
+        self._redis = redis.Redis.from_url(
+            redis_url,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+            decode_responses=True,
+        )
+        self._add = self._redis.register_script(self.ADD_SCRIPT)
+
+    def add(self, member: str, score: float) -> None:
+        self._add(keys=[self.KEY], args=[member, score])
+
+    def pop(self, limit: int) -> dict:
+        # ZPOPMAX takes them off atomically, so concurrent flushes never
+        # write the same increment twice
+        return dict(self._redis.zpopmax(self.KEY, limit))
+
+
+class TrendingService:
+    """
+    Time-decayed popularity for the trending feed.
+
+    Each bid, like or view adds its weight to the item's score, and every
+    contribution halves in value each ``half_life`` seconds. Rather than
+    decaying stored scores, new contributions are scaled up: a weight ``w``
+    at time ``t`` counts ``w * 2 ** (t / half_life)``, kept as its log2
+    (``log2(w) + t / half_life``) so it never overflows. Scores then stay
+    comparable across items however long ago they were last updated, and
+    ranking by them ranks by current decayed popularity.
+
+    Increments are merged in a Redis sorted set and ``flush`` (the
+    ``flush_trending_scores`` beat task) adds them into the indexed
+    ``items.trending_score`` column in batched ``UPDATE ... FROM (VALUES
+    ...)`` statements. ``page`` serves the first ``top_k`` places of the feed
+    from a per-process cache refreshed every ``cache_ttl`` seconds.
+    """
+
+    # Relative weight of each kind of engagement
+    WEIGHTS = {"view": 1.0, "like": 4.0, "bid": 10.0}
+
+    # The feed's order, descending; ix_items_public_trending serves it
+    ORDER_BY = (Item.trending_score, Item.created_at, Item.id)
+
+    # Serialized pages cached per process; the rest are evicted LRU
+    MAX_CACHED_PAGES = 64
+
+    def __init__(
+        self, store, half_life=21600, flush_size=1000, top_k=200, cache_ttl=30
+    ):
+        self.store = store
+        self.half_life = half_life
+        self.flush_size = flush_size
+        self.top_k = top_k
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._top = None  # (item ids in trending order, public item count)
+        self._pages = OrderedDict()
+        self._expires_at = 0.0
+
+    def record(self, item_id, kind: str, now: float = None) -> None:
+        """Count one engagement of ``kind`` (see ``WEIGHTS``) with an item."""
+        now = time.time() if now is None else now
+        score = math.log2(self.WEIGHTS[kind]) + now / self.half_life
+        try:
+            self.store.add(str(item_id), score)
+        except redis.RedisError as e:
+            # A lost view or bid only nudges the ranking; never fail the request
+            print(f"Could not record {kind} for trending item {item_id}: {e}")
+
+    def flush(self) -> int:
+        """Add the pending increments into ``items.trending_score``; returns how many items."""
+        flushed = 0
+        while True:
+            scores = self.store.pop(self.flush_size)
+            if not scores:
+                return flushed
+            try:
+                self._write(scores)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for member, score in scores.items():
+                    self.store.add(member, score)
+                raise
+            flushed += len(scores)
+            if len(scores) < self.flush_size:
+                return flushed
+
+    def _write(self, scores):
+        items = Item.__table__
+        deltas = values(
+            column("id", UUID(as_uuid=True)), column("score", Float), name="deltas"
+        ).data(sorted((uuid.UUID(member), score) for member, score in scores.items()))
+        high = func.greatest(items.c.trending_score, deltas.c.score)
+        low = func.least(items.c.trending_score, deltas.c.score)
+        db.session.execute(
+            update(items)
+            .where(items.c.id == deltas.c.id)
+            .values(
+                # log2(2^a + 2^b); past 2^-60 the smaller side is noise, and
+                # Postgres raises on float underflow
+                trending_score=high
+                + func.ln(1 + func.power(2.0, func.greatest(low - high, -60)))
+                / math.log(2),
+                # Popularity is not an edit; keep the onupdate off updated_at
+                updated_at=items.c.updated_at,
+            )
+        )
+
+    def page(self, projection, page: int, per_page: int):
+        """
+        One page of the feed, serialized as the paginated listing is, while
+        it lies within the top ``top_k``; None past them.
+        """
+        if page < 1 or per_page < 1 or page * per_page > self.top_k:
+            return None
+        key = (projection.projection, tuple(projection.fields or ()), page, per_page)
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._top = None
+                self._pages.clear()
+            cached = self._pages.get(key)
+            if cached is not None:
+                self._pages.move_to_end(key)
+                return cached
+
+        top, total = self._top_items()
+        ids = top[(page - 1) * per_page : page * per_page]
+        if not ids and page > 1:
+            return None  # Out of range: let the listing answer 404
+        items = {
+            item.id: item
+            for item in Item.query.options(projection.load_options)
+            .filter(Item.id.in_(ids))
+            .all()
+        }
+        result = {
+            "items": [projection.serialize(items[i]) for i in ids if i in items],
+            "total": total,
+            "pages": math.ceil(total / per_page),
+            "current_page": page,
+        }
+        with self._lock:
+            self._pages[key] = result
+            while len(self._pages) > self.MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        return result
+
+    def _top_items(self):
+        with self._lock:
+            top = self._top
+        if top is None:
+            query = Item.query.filter_by(is_public=True)
+            top = (
+                [
+                    item_id
+                    for (item_id,) in query.with_entities(Item.id)
+                    .order_by(*(key.desc() for key in self.ORDER_BY))
+                    .limit(self.top_k)
+                ],
+                query.count(),
+            )
+            with self._lock:
+                self._top = top
+                self._expires_at = time.monotonic() + self.cache_ttl
+        return top
+
+
+# Create a singleton instance of the TrendingService. Without a Redis URL the
+# pending increments live in this process, which only suits tests and dev.
+trending = TrendingService(
+    store=(
+        RedisTrendingStore(config.TRENDING_REDIS_URL)
+        if config.TRENDING_REDIS_URL
+        else InMemoryTrendingStore()
+    ),
+    half_life=config.TRENDING_HALF_LIFE,
+    flush_size=config.TRENDING_FLUSH_SIZE,
+    top_k=config.TRENDING_TOP_K,
+    cache_ttl=config.TRENDING_CACHE_TTL,
+)
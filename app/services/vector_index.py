@@ -0,0 +1,361 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import config
+
+
+class VectorIndex:
+    """
+    On-disk nearest-neighbour index over item embeddings, shared by every
+    process on the host through memory-mapped files.
+
+    Layout under ``path``::
+
+        CURRENT            name of the live generation directory
+        gen-<n>/meta.json  dimension, mode and segment sizes
+        gen-<n>/base.bin   immutable records, grouped by IVF list
+        gen-<n>/centroids.npy, gen-<n>/offsets.npy  (IVF mode only)
+        gen-<n>/journal.bin  append-only adds and tombstones since the build
+
+    A record is ``(id, deleted, vector)``; the newest record for an id wins,
+    so re-adding an item replaces it and a tombstone hides it. Readers check
+    CURRENT and the journal size on every query to pick up rebuilds and
+    appends from other processes.
+    Vectors are L2-normalised on write, so scores are cosine similarities.
+    """
+
+    def __init__(self, path: str, mode: str = "ivf", nprobe: int = 8):
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+        self._generation = None
+        self._journal_size = -1
+        self._meta = None
+
+    # --- Writes -------------------------------------------------------------
+
+    def add(self, item_id, vector: Iterable[float]) -> None:
+        """Add or replace the vector for ``item_id``."""
+        vector = np.asarray(vector, dtype=np.float32)
+        self._append(item_id, vector, deleted=False)
+
+    def delete(self, item_id) -> None:
+        """Tombstone ``item_id``; it stops matching immediately."""
+        self._append(item_id, None, deleted=True)
+
+    def build(self, rows: Iterable[Tuple[uuid.UUID, List[float]]]) -> int:
+        """
+        Write a fresh generation from ``(item_id, embedding)`` rows and make
+        it live. Journal records written while the build was running are
+        carried over, so concurrent adds and deletes are not lost.
+
+        Returns:
+            int: Number of vectors in the new base segment.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        previous = self._current_generation()
+        carried_from = self._journal_bytes(previous)
+
+        ids, vectors = [], []
+        for item_id, embedding in rows:
+            if embedding:
+                ids.append(_id_bytes(item_id))
+                vectors.append(np.asarray(embedding, dtype=np.float32))
+
+        dim = len(vectors[0]) if vectors else self._dimension(previous)
+        if dim is None:
+            raise ValueError("Cannot build an empty vector index of unknown size")
+
+        records = np.zeros(len(ids), dtype=_record_dtype(dim))
+        if ids:
+            records["id"] = ids
+            records["vector"] = _normalize(np.vstack(vectors))
+
+        generation = f"gen-{time.time_ns()}"
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        meta = {"dim": dim, "mode": self.mode, "count": len(records)}
+
+        if self.mode == "ivf" and len(records):
+            nlist = max(1, min(config.VECTOR_INDEX_NLIST, int(np.sqrt(len(records)))))
+            centroids = _kmeans(records["vector"], nlist)
+            assignments = _assign(records["vector"], centroids)
+            order = np.argsort(assignments, kind="stable")
+            records = records[order]
+            offsets = np.zeros(nlist + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+            np.save(os.path.join(directory, "centroids.npy"), centroids)
+            np.save(os.path.join(directory, "offsets.npy"), offsets)
+            meta["nlist"] = nlist
+        else:
+            meta["mode"] = "flat"
+
+        records.tofile(os.path.join(directory, "base.bin"))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        with self._lock():
+            journal = os.path.join(directory, "journal.bin")
+            with open(journal, "wb") as out:
+                if previous:
+                    with open(
+                        os.path.join(self.path, previous, "journal.bin"), "rb"
+                    ) as f:
+                        f.seek(carried_from)
+                        shutil.copyfileobj(f, out)
+            self._write_current(generation)
+
+        if previous:
+            shutil.rmtree(os.path.join(self.path, previous), ignore_errors=True)
+        return len(records)
+
+    # --- Reads --------------------------------------------------------------
+
+    def search(
+        self, vector: Iterable[float], k: int = 10, exclude=()
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the ``k`` most similar live vectors.
+
+        Args:
+            vector: Query embedding.
+            k (int): Number of results.
+            exclude: Item ids to leave out of the results (e.g. the query item).
+
+        Returns:
+            List[Tuple[str, float]]: ``(item_id, cosine similarity)`` pairs,
+            best first.
+        """
+        if not self._refresh():
+            return []
+
+        query = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        if query.shape[0] != self._meta["dim"]:
+            raise ValueError(
+                f"Query has {query.shape[0]} dimensions, index has {self._meta['dim']}"
+            )
+
+        candidates = [self._search_base(query)]
+        live = self._journal[self._journal_live]
+        candidates.append((live["id"], live["vector"] @ query))
+
+        ids = np.concatenate([c[0] for c in candidates])
+        scores = np.concatenate([c[1] for c in candidates])
+        if exclude:
+            keep = ~np.isin(ids, np.array([_id_bytes(i) for i in exclude], dtype="V16"))
+            ids, scores = ids[keep], scores[keep]
+        if not len(ids):
+            return []
+
+        top = min(k, len(ids))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(str(uuid.UUID(bytes=bytes(ids[i]))), float(scores[i])) for i in best]
+
+    def __len__(self) -> int:
+        if not self._refresh():
+            return 0
+        return int(self._base_live.sum() + self._journal_live.sum())
+
+    def _search_base(self, query):
+        base = self._base
+        if self._meta["mode"] == "ivf" and len(base):
+            nprobe = min(self.nprobe, len(self._centroids))
+            lists = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.concatenate(
+                [np.arange(self._offsets[l], self._offsets[l + 1]) for l in lists]
+            )
+            rows = rows[self._base_live[rows]]
+        else:
+            rows = np.flatnonzero(self._base_live)
+        return base["id"][rows], base["vector"][rows] @ query
+
+    def _refresh(self) -> bool:
+        """Re-map files if another process rebuilt or appended. False if empty."""
+        for _ in range(3):
+            generation = self._current_generation()
+            if generation is None:
+                return False
+            try:
+                self._load(generation)
+                return True
+            except FileNotFoundError:
+                # A rebuild swapped generations under us; read CURRENT again
+                self._generation = None
+        raise RuntimeError(f"Vector index at {self.path} keeps changing, giving up")
+
+    def _load(self, generation):
+        directory = os.path.join(self.path, generation)
+        if generation != self._generation:
+            with open(os.path.join(directory, "meta.json")) as f:
+                self._meta = json.load(f)
+            dtype = _record_dtype(self._meta["dim"])
+            self._base = _memmap(os.path.join(directory, "base.bin"), dtype)
+            if self._meta["mode"] == "ivf":
+                self._centroids = np.load(os.path.join(directory, "centroids.npy"))
+                self._offsets = np.load(os.path.join(directory, "offsets.npy"))
+            self._generation = generation
+            self._journal_size = -1
+
+        journal_path = os.path.join(directory, "journal.bin")
+        journal_size = os.stat(journal_path).st_size
+        if journal_size != self._journal_size:
+            journal = _memmap(journal_path, _record_dtype(self._meta["dim"]))
+            # The newest record for each id wins
+            _, first = np.unique(journal["id"][::-1], return_index=True)
+            newest = np.zeros(len(journal), dtype=bool)
+            newest[len(journal) - 1 - first] = True
+
+            self._journal = journal
+            self._journal_live = newest & ~journal["deleted"]
+            self._base_live = ~np.isin(self._base["id"], journal["id"])
+            self._journal_size = journal_size
+
+    # --- Storage helpers ----------------------------------------------------
+
+    def _append(self, item_id, vector, deleted):
+        with self._lock():
+            generation = self._current_generation()
+            if generation is None:
+                if vector is None:
+                    return
+                # First write on an empty index: start an empty generation
+                generation = self._create_empty_generation(len(vector))
+            dim = self._dimension(generation)
+            record = np.zeros(1, dtype=_record_dtype(dim))
+            record["id"] = _id_bytes(item_id)
+            record["deleted"] = deleted
+            if vector is not None:
+                if len(vector) != dim:
+                    raise ValueError(
+                        f"Vector has {len(vector)} dimensions, index has {dim}"
+                    )
+                record["vector"] = _normalize(vector[None, :])
+            with open(os.path.join(self.path, generation, "journal.bin"), "ab") as f:
+                f.write(record.tobytes())
+
+    def _create_empty_generation(self, dim):
+        generation = f"gen-{time.time_ns()}"
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"dim": dim, "mode": "flat", "count": 0}, f)
+        open(os.path.join(directory, "base.bin"), "wb").close()
+        open(os.path.join(directory, "journal.bin"), "wb").close()
+        self._write_current(generation)
+        return generation
+
+    def _current_generation(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_current(self, generation):
+        tmp = os.path.join(self.path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(generation)
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+
+    def _dimension(self, generation) -> Optional[int]:
+        if generation is None:
+            return None
+        with open(os.path.join(self.path, generation, "meta.json")) as f:
+            return json.load(f)["dim"]
+
+    def _journal_bytes(self, generation) -> int:
+        if generation is None:
+            return 0
+        try:
+            return os.stat(os.path.join(self.path, generation, "journal.bin")).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        return _FileLock(os.path.join(self.path, "LOCK"))
+
+
+class _FileLock:
+    """Exclusive flock, serialising writers across processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def _record_dtype(dim):
+    # Raw bytes for the id: "S16" would drop the trailing NULs a UUID can end in
+    return np.dtype([("id", "V16"), ("deleted", "?"), ("vector", "<f4", (dim,))])
+
+
+def _id_bytes(item_id) -> bytes:
+    if not isinstance(item_id, uuid.UUID):
+        item_id = uuid.UUID(str(item_id))
+    return item_id.bytes
+
+
+def _memmap(path, dtype):
+    """Read-only map of the complete records in ``path`` (may be empty)"""
+    count = os.stat(path).st_size // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _assign(vectors, centroids, chunk=65536):
+    """Nearest centroid for every vector, in bounded-memory chunks"""
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        out[start : start + chunk] = np.argmax(
+            vectors[start : start + chunk] @ centroids.T, axis=1
+        )
+    return out
+
+
+def _kmeans(vectors, nlist, iterations=10, sample=50000, seed=0):
+    """Spherical k-means on a sample of the vectors; returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+        filled = counts > 0
+        # Empty lists keep their previous centroid
+        centroids[filled] = sums[filled] / counts[filled, None]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+# Create a singleton instance of the VectorIndex.
+vector_index = VectorIndex(
+    config.VECTOR_INDEX_PATH,
+    mode=config.VECTOR_INDEX_MODE,
+    nprobe=config.VECTOR_INDEX_NPROBE,
+)
@@ -2,21 +2,30 @@ import io
 import uuid
 from datetime import datetime, timedelta
 
+import requests
+from celery.exceptions import Retry
 from flask import current_app
 from PIL import Image
 
 from .extensions import celery, db
 from .models.bid import Bid, BidStatus
-from .models.clothing_item import AuctionStatus, Item
+from .models.clothing_item import Item
 from .models.token_blocklist import TokenBlocklist
 from .models.user import User
 from .services.ai_service import ai_service
+from .services.auction_book import auction_book
+from .services.auction_events import auction_events
+from .services.auction_service import auction_settlement
+from .services.color_service import color_service
+from .services.engagement import engagement
 from .services.LN_service import lightning_service
-from .services.notification_service import (
-    Notification,
-    NotificationType,
-    notification_service,
-)
+from .services.notification_service import notification_service
+from .services.recommendation_cache import recommendation_cache
+from .services.token_revocation import token_revocation
+from .services.trending import trending
+from .services.vector_index import vector_index
+from .utils.color import names_to_hex
+from .utils.image_cache import image_cache, prepare_for_model
 from .utils.image_handler import image_handler
 
 
@@ -52,41 +61,27 @@ def process_uploaded_image(image_data, item_id):
 
 
 @celery.task
-def cleanup_expired_bids():
-    """Clean up expired bids and notify winners"""
-    # Get items with expired bidding
-    expired_items = Item.query.filter(
-        Item.auction_ends_at < datetime.utcnow(), Item.auction_status == "active"
-    ).all()
-
-    for item in expired_items:
-        # Get highest bid
-        highest_bid = (
-            Bid.query.filter_by(item_id=item.id).order_by(Bid.amount.desc()).first()
-        )
-
-        if highest_bid:
-            # Update item status
-            item.auction_status = AuctionStatus.SOLD
-            item.auction_current_bidder_id = highest_bid.user_id
-            item.save()
-
-            # Notify winner and seller
-            notification_service.send_notification(
-                highest_bid.user_id,
-                "You won the auction!",
-                f"You won the auction for {item.title} with a bid of ${highest_bid.amount:.2f}",
-            )
+def cleanup_expired_bids(batch_size=None):
+    """
+    Settle every expired auction: pick winners, release the losing bids and
+    notify both sides. Runs batch by batch, committing each; several copies
+    can run at once since each batch skips auctions another worker locked.
+    Auctions are normally closed on time by ``flask dispatch-auctions``;
+    this sweep catches any the dispatcher missed.
+    """
+    auction_book.seal()
+    closed = 0
+    while True:
+        batch = auction_settlement.settle_batch(batch_size=batch_size)
+        db.session.commit()
+        if not batch:
+            break
+        closed += len(batch)
+        for auction in batch.auctions:
+            auction_book.close(auction.item_id)
+        auction_events.auctions_closed(batch)
 
-            notification_service.send_notification(
-                item.user_id,
-                "Your item was sold!",
-                f"Your item {item.title} was sold for ${highest_bid.amount:.2f}",
-            )
-        else:
-            # No bids, mark as expired
-            item.auction_status = AuctionStatus.EXPIRED
-            item.save()
+    return f"Settled {closed} expired auctions"
 
 
 @celery.task
@@ -101,6 +96,7 @@ def cleanup_expired_tokens():
         db.session.delete(token)
 
     db.session.commit()
+    token_revocation.purge_expired()
 
     return f"Cleaned up {len(expired_tokens)} expired tokens"
 
@@ -124,12 +120,16 @@ def generate_invoice_for_winning_bid(self, bid_id: str) -> None:
             )
             return
 
-        if bid.status != BidStatus.PENDING:
+        if bid.status != BidStatus.WON:
             current_app.logger.warning(
-                f"Bid {bid_id} is not in PENDING status ({bid.status.value}). Skipping invoice generation."
+                f"Bid {bid_id} is not in WON status ({bid.status.value}). Skipping invoice generation."
             )
             return
 
+        if bid.encoded_invoice:
+            current_app.logger.info(f"Bid {bid_id} already has an invoice.")
+            return
+
         item = Item.query.get(bid.item_id)
         if not item:
             current_app.logger.error(
@@ -145,7 +145,7 @@ def generate_invoice_for_winning_bid(self, bid_id: str) -> None:
             return
 
         # Ensure lightning_service is initialized
-        if not lightning_service._client:
+        if not lightning_service._payment_service:
             current_app.logger.error("LightsparkService not initialized. Retrying...")
             raise self.retry(countdown=60)  # Retry after 1 minute
 
@@ -156,35 +156,23 @@ def generate_invoice_for_winning_bid(self, bid_id: str) -> None:
 
         encoded_invoice = lightning_service.create_invoice(
             amount_sats=float(bid.amount),
-            memo=memo,
-            expiry_secs=invoice_expiry_secs,
+            customer_email=bidder.email,
+            description=memo,
+            expires_at=f"{invoice_expiry_secs // 3600}h",
         )
 
         if encoded_invoice:
             bid.encoded_invoice = encoded_invoice
-            bid.status = BidStatus.INVOICE_GENERATED
-            bid.updated_at = datetime.utcnow()
+            bid.invoice_expiry = datetime.utcnow() + timedelta(
+                seconds=invoice_expiry_secs
+            )
             db.session.commit()
             current_app.logger.info(
                 f"Invoice generated for bid {bid_id}. Encoded invoice: {encoded_invoice}"
             )
-
-            # Notify the winning bidder that an invoice has been generated for them to pay
-            notification_service.send_auction_won_notification(
-                item_id=bid.item_id,
-                winner_id=bid.user_id,
-                winning_amount=float(bid.amount),
-            )
-            # You might also send the encoded_invoice directly to them via email/in-app message
-            # For example, by updating the send_auction_won_notification to accept an invoice string
-            # or creating a new specific notification type like "invoice_for_winning_bid"
+            # The winner was already notified when the auction was settled
 
         else:
-            bid.status = (
-                BidStatus.FAILED_PAYMENT
-            )  # Or a more specific status like INVOICE_GENERATION_FAILED
-            bid.updated_at = datetime.utcnow()
-            db.session.commit()
             current_app.logger.error(f"Failed to generate invoice for bid {bid_id}.")
             # Notify admin or relevant user about the failure
             # Consider retrying this task if it's a transient Lightspark error
@@ -251,7 +239,7 @@ def handle_seller_payout(
 def generate_item_embedding_task(item_id: str) -> None:
     """
     Celery task to asynchronously generate and store an embedding for a specific item.
-    It also adds this embedding to the FAISS vector store for similarity searches.
+    It also adds this embedding to the vector index for similarity searches.
 
     Args:
         item_id (str): The unique ID of the item to process.
@@ -271,10 +259,10 @@ def generate_item_embedding_task(item_id: str) -> None:
             item.embedding = embedding
             db.session.commit()
             print(f"Embedding for item {item_id} successfully stored in DB.")
+            # Outfit compatibility reads the embedding
+            recommendation_cache.invalidate(item.user_id)
 
-            # Add the embedding to the FAISS index for quick similarity lookups.
-            # We convert the list embedding to a NumPy array for FAISS compatibility if necessary,
-            # though LangChain's FAISS wrapper handles this.
+            # Add the embedding to the vector index for quick similarity lookups.
             ai_service.add_to_index(embedding, str(item.id))
         else:
             print(f"Failed to generate embedding for item {item_id}.")
@@ -287,186 +275,169 @@ def generate_item_embedding_task(item_id: str) -> None:
 
 
 @celery.task
-def generate_item_tags_colors_style_task(item_id: str) -> None:
+def rebuild_vector_index_task() -> int:
+    """
+    Celery task to rebuild the vector index from the embeddings stored in Postgres.
+    Compacts away tombstones and retrains the IVF lists.
+
+    Returns:
+        int: The number of vectors in the rebuilt index.
+    """
+    rows = (
+        db.session.query(Item.id, Item.embedding)
+        .filter(Item.embedding.isnot(None))
+        .yield_per(10000)
+    )
+    count = vector_index.build(rows)
+    print(f"Rebuilt vector index with {count} vectors.")
+    return count
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60)
+def enrich_item_task(self, item_id: str) -> None:
     """
-    Celery task to asynchronously generate and store tags, dominant colors,
-    and clothing style for a specific item based on its image.
+    Celery task running the whole AI enrichment stage for an item in one pass.
+
+    The image is downloaded and decoded once (and kept in the local image cache),
+    dominant colors are extracted locally, a single structured Gemini request
+    returns tags, style, vibe and detected objects, the embedding is made from
+    the same prepared image, and everything is written back in one commit.
 
     Args:
         item_id (str): The unique ID of the item to process.
     """
     try:
-        print(f"Starting tags, colors, and style generation for item {item_id}...")
+        print(f"Starting AI enrichment for item {item_id}...")
         item = Item.query.get(item_id)
-        if not item:
-            print(f"Item {item_id} not found for tag/color/style generation. Skipping.")
+        if not item or not item.image_url:
+            print(f"Item {item_id} not found or has no image for enrichment. Skipping.")
             return
 
-        # Generate tags, colors, and style using the AI service.
-        tags = ai_service.generate_tags(item.image_url)
-        colors = ai_service.generate_colors(item.image_url)
-        style = ai_service.get_clothing_style(item.image_url)
+        try:
+            image_bytes = image_cache.fetch(item.image_url)
+        except requests.RequestException as e:
+            print(f"Failed to download image for item {item_id}: {e}")
+            raise self.retry(exc=e)
+
+        try:
+            palette = color_service.extract_colors(image_bytes)
+        except Exception as e:
+            print(f"Local color extraction failed for item {item_id}: {e}")
+            palette = []
+        if palette:
+            dominant_colors = [color["hex"] for color in palette]
+        else:
+            dominant_colors = names_to_hex(
+                ai_service.generate_colors_with_llm(item.image_url)
+            )
+
+        model_image, mime_type = prepare_for_model(image_bytes)
+        analysis = ai_service.analyze_item_image(model_image, mime_type)
+        embedding = ai_service.generate_embedding(
+            image_bytes=model_image, mime_type=mime_type
+        )
 
-        # Update the item in the database with the generated data.
-        item.tags = tags
-        item.colors = colors
-        item.style = style
+        item.dominant_colors = dominant_colors
+        # An empty analysis means Gemini failed; keep the item's current one
+        if any(analysis.values()):
+            # Keep the seller's own tags first, then add the generated ones
+            tags = list(dict.fromkeys((item.tags or []) + analysis["tags"]))
+            item.tags = [tag[:50] for tag in tags]
+            item.style = [term[:50] for term in analysis["style"]]
+            item.vibe = [term[:50] for term in analysis["vibe"]]
+            item.detected_objects = [obj[:50] for obj in analysis["objects"]]
+        else:
+            print(f"No image analysis for item {item_id}; keeping the previous one")
+        if embedding:
+            item.embedding = embedding
 
         db.session.commit()
-        print(f"Successfully generated and stored data for item {item_id}:")
-        print(f"  Tags: {tags}")
-        print(f"  Colors: {colors}")
-        print(f"  Style: {style}")
+        recommendation_cache.invalidate(item.user_id)
+        print(f"Successfully enriched item {item_id}: {analysis}")
+
+        if embedding:
+            ai_service.add_to_index(embedding, str(item.id))
+    except Retry:
+        raise
     except Exception as e:
-        print(
-            f"Error in Celery task generate_item_tags_colors_style_task for item {item_id}: {e}"
-        )
+        print(f"Error in Celery task enrich_item_task for item {item_id}: {e}")
         db.session.rollback()  # Rollback any changes in case of an error
 
 
 @celery.task
-def send_notification_email_task(notification_id: str) -> None:
+def send_notification_email_task(*notification_ids: str) -> None:
     """
-    Celery task to process a stored Notification record and send an email using Flask-Mail.
+    Celery task to send the emails for stored Notification records using Flask-Mail.
+
+    Notification email now goes out with send_notification_digests; this
+    drains the per-notification email events queued in the outbox before
+    that, which the relay merges into batches sent over one SMTP connection.
 
     Args:
-        notification_id (str): The UUID string of the Notification record to process.
+        *notification_ids (str): The UUID strings of the Notification records to process.
     """
     try:
+        sent = notification_service.send_notification_emails(notification_ids)
         current_app.logger.info(
-            f"Celery task: Starting email sending for notification ID {notification_id}..."
+            f"Celery task: Sent {sent} emails for {len(notification_ids)} notifications."
         )
-        # Retrieve the notification from the database
-        notification = Notification.query.get(uuid.UUID(notification_id))
-        if not notification:
-            current_app.logger.warning(
-                f"Celery task: Notification {notification_id} not found. Skipping email sending."
-            )
-            return
+    except Exception as e:
+        current_app.logger.critical(
+            f"Celery task: Unhandled error in send_notification_email_task for notifications {notification_ids}: {e}",
+            exc_info=True,
+        )
+        db.session.rollback()  # Ensure session is rolled back if an error occurs
 
-        # Fetch the recipient user's email
-        recipient_user = User.query.get(notification.user_id)
-        if not recipient_user or not recipient_user.email:
-            current_app.logger.warning(
-                f"Celery task: Recipient user {notification.user_id} not found or has no email. Skipping email sending for notification {notification_id}."
-            )
-            return
 
-        user_email = recipient_user.email
-        subject = "FitCheck Notification"  # Default subject
-        template_name = "default_notification"  # Default template
-        template_kwargs = {
-            "notification_type": notification.type.value,
-            "metadata": notification.metadata,
-            "notification_id": str(notification.id),
-        }
-
-        # Fetch related item details if available
-        item_title = None
-        item_image_url = None
-        if notification.item_id:
-            item = Item.query.get(notification.item_id)
-            if item:
-                item_title = item.title
-                item_image_url = item.image_url
-                template_kwargs["item"] = (
-                    item.to_dict()
-                )  # Pass item details to template
-                template_kwargs["item_title"] = item_title
-                template_kwargs["item_image_url"] = item_image_url
-            else:
-                current_app.logger.warning(
-                    f"Celery task: Item {notification.item_id} not found for notification {notification.id}. Preview will be limited."
-                )
-
-        # Fetch related actor details if available
-        actor_username = None
-        if notification.actor_id:
-            actor_user = User.query.get(notification.actor_id)
-            if actor_user:
-                actor_username = actor_user.username
-                template_kwargs["actor"] = (
-                    actor_user.to_dict()
-                )  # Pass actor details to template
-                template_kwargs["actor_username"] = actor_username
-            else:
-                current_app.logger.warning(
-                    f"Celery task: Actor user {notification.actor_id} not found for notification {notification.id}. Preview will be limited."
-                )
-
-        # Determine subject and template based on notification type
-        if notification.type == NotificationType.BID_RECEIVED:
-            subject = f"New Bid on Your Item: {item_title or 'Auction Item'}"
-            template_name = "bid_received_notification"
-            template_kwargs["amount"] = notification.metadata.get("amount")
-            template_kwargs["bidder_username"] = (
-                actor_username if actor_username else "Someone"
-            )
+@celery.task
+def record_bid_notifications_task(*bids):
+    """
+    Record the notifications for accepted bids, which ``create_bid`` queues
+    in the outbox and the relay merges into batches.
 
-        elif notification.type == NotificationType.BID_OUTBID:
-            subject = f"You've Been Outbid on: {item_title or 'Auction Item'}"
-            template_name = "bid_outbid_notification"
-            template_kwargs["new_highest_bid"] = notification.metadata.get(
-                "new_highest_bid"
-            )
-            template_kwargs["new_bidder_username"] = (
-                actor_username if actor_username else "Someone"
-            )
+    Args:
+        *bids (list): [item_id, bidder_id, amount, outbid_user_id] per bid.
+    """
+    count = notification_service.record_bid_notifications(bids)
+    return f"Recorded {count} notifications for {len(bids)} bids"
 
-        elif notification.type == NotificationType.AUCTION_WON:
-            subject = (
-                f"Congratulations! You Won the Auction for: {item_title or 'An Item'}"
-            )
-            template_name = "auction_won_notification"
-            template_kwargs["winning_amount"] = notification.metadata.get(
-                "winning_amount"
-            )
 
-        elif notification.type == NotificationType.AUCTION_EXPIRED:
-            subject = f"Your Auction for {item_title or 'An Item'} Ended Unsold"
-            template_name = "auction_expired_notification"
+@celery.task
+def send_notification_digests():
+    """Email each recipient a digest of their pending notifications."""
+    sent = notification_service.send_digests()
+    return f"Sent {sent} notification digests"
 
-        elif notification.type == NotificationType.SIZE_RESTOCK:
-            subject = f"New Item in Your Saved Size: {notification.metadata.get('size_value', 'N/A')}"
-            template_name = "size_restock_notification"
-            template_kwargs["size_value"] = notification.metadata.get("size_value")
 
-        elif notification.type == NotificationType.OUTFIT_LIKED:
-            subject = f"Your Outfit Got a New Like!"
-            template_name = "outfit_liked_notification"
-            template_kwargs["liker_username"] = (
-                actor_username if actor_username else "Someone"
-            )
-            template_kwargs["outfit_id"] = str(
-                notification.item_id
-            )  # Using item_id for outfit_id
-
-        # Pass recipient's username if available, useful for personalizing greetings
-        if recipient_user.username:
-            template_kwargs["recipient_username"] = recipient_user.username
-
-        # Send the email using the service's internal method
-        success = notification_service.send_notification(
-            user_email=user_email,
-            subject=subject,
-            template_name=template_name,
-            **template_kwargs,
-        )
+@celery.task
+def flush_trending_scores():
+    """Add the buffered engagement into the items' trending scores."""
+    count = trending.flush()
+    return f"Flushed trending scores for {count} items"
 
-        if success:
-            current_app.logger.info(
-                f"Celery task: Email for notification {notification_id} successfully sent."
-            )
-            # Optionally, you could mark the notification as 'email_sent' in the DB here
-        else:
-            current_app.logger.error(
-                f"Celery task: Failed to send email for notification {notification_id}."
-            )
 
-    except Exception as e:
-        current_app.logger.critical(
-            f"Celery task: Unhandled error in send_notification_email_task for notification {notification_id}: {e}",
-            exc_info=True,
-        )
-        # In a real application, you'd implement retry mechanisms or move to a dead-letter queue.
-        db.session.rollback()  # Ensure session is rolled back if an error occurs
+@celery.task
+def flush_engagement_counters():
+    """Add the buffered view, like and watcher counts into the items."""
+    count = engagement.flush()
+    return f"Flushed engagement counters for {count} items"
+
+
+@celery.task
+def precompute_recommendations():
+    """Queue the nightly recommendation precompute for active users."""
+    count = recommendation_cache.queue_precompute()
+    return f"Queued recommendation precompute for {count} users"
+
+
+@celery.task
+def precompute_recommendations_task(*user_ids):
+    """Cache every context's recommendation for these users."""
+    count = recommendation_cache.precompute(user_ids)
+    return f"Precomputed {count} recommendations"
+
+
+@celery.task
+def refresh_recommendation_task(user_id, occasion=None, weather=None):
+    """Recompute a stale cached recommendation, unless another refresh beat us."""
+    recommendation_cache.refresh(user_id, occasion, weather, if_stale=True)
@@ -0,0 +1,140 @@
+import numpy as np
+
+# Fixed vocabulary used for human-readable color names (tags, agent answers)
+NAMED_COLORS = {
+    "black": "#000000",
+    "charcoal": "#36454f",
+    "grey": "#808080",
+    "light grey": "#d3d3d3",
+    "white": "#ffffff",
+    "cream": "#f5f0e1",
+    "beige": "#d9c8a9",
+    "khaki": "#b8a77a",
+    "camel": "#b5824f",
+    "brown": "#6b4226",
+    "burgundy": "#800020",
+    "red": "#c8102e",
+    "coral": "#ff7f50",
+    "orange": "#f28c28",
+    "mustard": "#d4a017",
+    "yellow": "#f7d917",
+    "olive": "#708238",
+    "green": "#2e8b57",
+    "mint": "#98d8c8",
+    "teal": "#008080",
+    "light blue": "#a7c7e7",
+    "blue": "#1f5fbf",
+    "denim": "#3b5b92",
+    "navy": "#1f2a44",
+    "purple": "#6a3d9a",
+    "lavender": "#b9a7d9",
+    "pink": "#f4a6c0",
+    "magenta": "#c2185b",
+}
+
+
+def hex_to_rgb(hex_code):
+    """'#1f2a44' -> array([31, 42, 68])"""
+    hex_code = hex_code.lstrip("#")
+    return np.array([int(hex_code[i : i + 2], 16) for i in (0, 2, 4)])
+
+
+def rgb_to_hex(rgb):
+    r, g, b = (int(round(min(max(c, 0), 255))) for c in rgb)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def rgb_to_lab(rgb):
+    """
+    Convert sRGB values in 0-255 (shape (..., 3)) to CIELAB (D65).
+    Vectorised, so whole images or palettes convert in one call.
+    """
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = linear @ np.array(
+        [
+            [0.4124564, 0.2126729, 0.0193339],
+            [0.3575761, 0.7151522, 0.1191920],
+            [0.1804375, 0.0721750, 0.9503041],
+        ]
+    )
+    xyz = xyz / np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack(
+        [
+            116 * f[..., 1] - 16,
+            500 * (f[..., 0] - f[..., 1]),
+            200 * (f[..., 1] - f[..., 2]),
+        ],
+        axis=-1,
+    )
+
+
+def hex_to_lab(hex_code):
+    return rgb_to_lab(hex_to_rgb(hex_code))
+
+
+_NAMES = list(NAMED_COLORS)
+_NAMED_LAB = rgb_to_lab(np.array([hex_to_rgb(NAMED_COLORS[n]) for n in _NAMES]))
+
+
+def nearest_color_name(rgb):
+    """Closest vocabulary name to an sRGB color, by CIE76 distance"""
+    distances = np.linalg.norm(_NAMED_LAB - rgb_to_lab(rgb), axis=1)
+    return _NAMES[int(np.argmin(distances))]
+
+
+def nearest_color_indices(rgb):
+    """
+    Positions in NAMED_COLORS of the closest name to each sRGB color
+    (shape (n, 3)), by CIE76 distance
+    """
+    lab = rgb_to_lab(np.asarray(rgb).reshape(-1, 3))
+    # |a - b|^2 without the |a|^2 term, which is the same for every name
+    distances = (_NAMED_LAB**2).sum(axis=1) - 2 * lab @ _NAMED_LAB.T
+    return distances.argmin(axis=1)
+
+
+def names_to_hex(names):
+    """Map free-form color names onto the vocabulary, dropping unknown ones"""
+    return [
+        NAMED_COLORS[n]
+        for n in (name.strip().lower() for name in names)
+        if n in NAMED_COLORS
+    ]
+
+
+# The L*a*b* gamut of sRGB, used to number grid cells
+_LAB_MIN = np.array([0.0, -128.0, -128.0])
+_LAB_CELLS_PER_AXIS = 1000
+
+
+def lab_cells(lab, cell_size):
+    """Grid cell ids for L*a*b* points (shape (..., 3)), as plain ints"""
+    coords = np.floor((np.asarray(lab) - _LAB_MIN) / cell_size).astype(np.int64)
+    ids = (
+        coords[..., 0] * _LAB_CELLS_PER_AXIS + coords[..., 1]
+    ) * _LAB_CELLS_PER_AXIS + coords[..., 2]
+    return ids.tolist()
+
+
+def cells_within(lab, radius, cell_size):
+    """
+    Ids of every grid cell that intersects the sphere of ``radius`` around
+    ``lab``. Points within ``radius`` of ``lab`` are always in one of them.
+    """
+    lab = np.asarray(lab, dtype=np.float64)
+    low = np.floor((lab - radius - _LAB_MIN) / cell_size).astype(np.int64)
+    high = np.floor((lab + radius - _LAB_MIN) / cell_size).astype(np.int64)
+    axes = [np.arange(lo, hi + 1) for lo, hi in zip(low, high)]
+    coords = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    # Drop cube corners whose nearest point is farther than the radius
+    cell_min = coords * cell_size + _LAB_MIN
+    nearest = np.clip(lab, cell_min, cell_min + cell_size)
+    coords = coords[np.linalg.norm(nearest - lab, axis=1) <= radius]
+
+    ids = (
+        coords[:, 0] * _LAB_CELLS_PER_AXIS + coords[:, 1]
+    ) * _LAB_CELLS_PER_AXIS + coords[:, 2]
+    return ids.tolist()
@@ -1,6 +1,8 @@
 from cryptography.fernet import Fernet
 from app.config import config
 import base64
+import hashlib
+import hmac
 import os
 
 
@@ -16,8 +18,23 @@ def get_encryption_key():
     return key
 
 
+def get_blind_index_key(encryption_key):
+    """
+    Key for blind indexes. Kept separate from the encryption key so a leaked
+    index can't help decrypt; derived from it only when not configured.
+    """
+    key = os.getenv("BLIND_INDEX_KEY")
+    if key:
+        return key.encode()
+    if isinstance(encryption_key, str):
+        encryption_key = encryption_key.encode()
+    return hmac.new(encryption_key, b"fitcheck-blind-index", hashlib.sha256).digest()
+
+
 # Initialize Fernet cipher
-cipher_suite = Fernet(get_encryption_key())
+_encryption_key = get_encryption_key()
+cipher_suite = Fernet(_encryption_key)
+_blind_index_key = get_blind_index_key(_encryption_key)
 
 
 def encrypt_data(data):
@@ -32,3 +49,14 @@ def decrypt_data(encrypted_data):
     if encrypted_data is None:
         return None
     return cipher_suite.decrypt(encrypted_data.encode()).decode()
+
+
+def blind_index(data):
+    """
+    Deterministic keyed hash of sensitive data, for equality lookups on
+    fields that are stored encrypted. Emails are matched case-insensitively.
+    """
+    if data is None:
+        return None
+    normalized = data.strip().lower()
+    return hmac.new(_blind_index_key, normalized.encode(), hashlib.sha256).hexdigest()
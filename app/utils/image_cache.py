@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+
+import requests
+from PIL import Image
+
+from app.config import config
+
+
+class ImageCache:
+    """
+    Local content-addressed cache of downloaded item images.
+
+    Image bytes are stored under their SHA-256 digest, so re-listed or
+    duplicated images share one file. A small pointer file per URL maps
+    the URL to its digest, so a URL is only ever downloaded once.
+    """
+
+    # Walking the cache to enforce max_bytes is O(files), so only do it
+    # every this many writes
+    EVICT_EVERY = 100
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._writes = 0
+
+    def fetch(self, url: str) -> bytes:
+        """Return the bytes behind ``url``, downloading them on a cache miss."""
+        digest = self._read_pointer(url)
+        if digest:
+            data = self.get(digest)
+            if data is not None:
+                return data
+        return self._download(url)[1]
+
+    def digest(self, url: str) -> str:
+        """Return the content digest of ``url`` without reading the cached bytes."""
+        digest = self._read_pointer(url)
+        if digest and os.path.exists(self._blob_path(digest)):
+            return digest
+        return self._download(url)[0]
+
+    def _download(self, url):
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        digest = self.put(response.content)
+        self._write(self._pointer_path(url), digest.encode())
+        return digest, response.content
+
+    def get(self, digest: str):
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` and return its content digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict()
+        return digest
+
+    def _read_pointer(self, url):
+        try:
+            with open(self._pointer_path(url)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _pointer_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.path, "urls", key[:2], key)
+
+    def _write(self, path, data):
+        # Write-then-rename so concurrent readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _evict(self):
+        """Drop least recently written blobs once the cache is over budget."""
+        blobs = []
+        for root, _, files in os.walk(os.path.join(self.path, "blobs")):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                blobs.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+def prepare_for_model(data: bytes, max_side: int = 1024):
+    """
+    Decode image bytes once and re-encode a downscaled RGB JPEG suitable for
+    a vision model request.
+
+    Returns:
+        Tuple[bytes, str]: The encoded image and its MIME type.
+    """
+    image = Image.open(io.BytesIO(data))
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue(), "image/jpeg"
+
+
+image_cache = ImageCache(config.IMAGE_CACHE_PATH, config.IMAGE_CACHE_MAX_BYTES)
@@ -0,0 +1,196 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, false, or_, true, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from werkzeug.exceptions import BadRequest
+
+from app.extensions import db
+
+
+class InvalidCursor(BadRequest):
+    pass
+
+
+def cursor_params(args):
+    """
+    Read cursor mode from request args. Listings switch from page numbers to
+    keyset pagination when a ``cursor`` parameter is present (empty for the
+    first page); ``with_total=true`` adds an estimated total.
+
+    Returns:
+        Tuple[str, bool] | None: ``(cursor, with_total)``, or None in page mode.
+    """
+    if "cursor" not in args:
+        return None
+    return args["cursor"], args.get("with_total", "false").lower() == "true"
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, next_cursor, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+        self.total = total
+
+    def to_dict(self, serialize=lambda item: item.to_dict(), key="items"):
+        result = {
+            key: [serialize(item) for item in self.items],
+            "next_cursor": self.next_cursor,
+            "has_next": self.has_next,
+        }
+        if self.total is not None:
+            result["total"] = self.total
+            result["total_is_estimate"] = True
+        return result
+
+
+def keyset_paginate(query, order_by, cursor=None, per_page=20, with_total=False):
+    """
+    Paginate ``query`` by the values of its sort keys instead of OFFSET.
+
+    Args:
+        query: A ``Query`` without ORDER BY or LIMIT applied.
+        order_by (list): ``(expression, descending)`` pairs. Must end with a
+            unique column (normally the primary key) so positions are total.
+        cursor (str): The ``next_cursor`` of the previous page, or None/"" for
+            the first page.
+        per_page (int): Page size.
+        with_total (bool): Include a planner estimate of the total row count.
+
+    Returns:
+        KeysetPage: The page, whose ``next_cursor`` is None on the last page.
+    """
+    total = estimate_count(query) if with_total else None
+
+    # Sort keys that aren't plain columns of the entity (ts_rank, distances)
+    # are selected alongside it so the cursor can record their values
+    keys = [expression.label(f"_k{i}") for i, (expression, _) in enumerate(order_by)]
+    query = query.add_columns(*keys)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(order_by):
+            raise InvalidCursor("Cursor does not match this listing")
+        query = query.filter(_after(order_by, values))
+
+    query = query.order_by(
+        *(
+            (expression.desc() if descending else expression.asc())
+            for expression, descending in order_by
+        )
+    )
+    rows = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(list(rows[-1][1:]))
+    return KeysetPage([row[0] for row in rows], next_cursor, total)
+
+
+def _after(order_by, values):
+    """
+    Condition for rows strictly after ``values`` in the given ordering.
+    Postgres sorts NULLs last ascending and first descending.
+    """
+    directions = {descending for _, descending in order_by}
+    if len(directions) == 1 and None not in values:
+        descending = directions.pop()
+        # A row comparison can be answered straight from a composite index.
+        # It never matches NULLs, which is only right when they sort first.
+        if descending or not any(_nullable(e) for e, _ in order_by):
+            row = tuple_(*(expression for expression, _ in order_by))
+            bound = tuple_(*values)
+            return row < bound if descending else row > bound
+
+    clauses, equal_so_far = [], []
+    for (expression, descending), value in zip(order_by, values):
+        if value is None:
+            after = expression.isnot(None) if descending else false()
+            equal = expression.is_(None)
+        elif descending:
+            after = expression < value
+            equal = expression == value
+        else:
+            after = or_(expression > value, expression.is_(None))
+            equal = expression == value
+        clauses.append(and_(*equal_so_far, after) if equal_so_far else after)
+        equal_so_far.append(equal)
+    return or_(*clauses) if clauses else true()
+
+
+def _nullable(expression):
+    column = getattr(expression, "expression", expression)
+    return getattr(column, "nullable", True)
+
+
+def estimate_count(query):
+    """
+    Planner estimate of the number of rows ``query`` returns. Reads the
+    table statistics (pg_class/pg_statistic) instead of running COUNT(*).
+    """
+    plan = db.session.execute(_Explain(query.statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class _Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON)`` of a statement, keeping its bound parameters"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [_decode_value(value) for value in payload]
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"uuid": str(value)}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    if hasattr(value, "value") and hasattr(value, "name"):  # Enum
+        return {"enum": value.name}
+    return value
+
+
+def _decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    if "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    if "uuid" in value:
+        return uuid.UUID(value["uuid"])
+    if "dec" in value:
+        return Decimal(value["dec"])
+    if "enum" in value:
+        return value["enum"]
+    raise ValueError("unknown cursor value")
@@ -0,0 +1,41 @@
+from werkzeug.exceptions import BadRequest
+
+from app.models.clothing_item import item_load_options
+
+
+# Projections clients may ask for; "internal" is for server-side use only
+PUBLIC_PROJECTIONS = ("card", "detail")
+
+
+class InvalidProjection(BadRequest):
+    pass
+
+
+class ItemProjection:
+    """
+    The ``projection``/``fields`` request args of an item listing, with the
+    query option that loads just the columns they need.
+    """
+
+    def __init__(self, projection, fields=None):
+        self.projection = projection
+        self.fields = fields
+        try:
+            self.load_options = item_load_options(projection, fields)
+        except ValueError as e:
+            raise InvalidProjection(str(e)) from e
+
+    @classmethod
+    def from_args(cls, args, default="card"):
+        projection = args.get("projection", default)
+        if projection not in PUBLIC_PROJECTIONS:
+            raise InvalidProjection(
+                f"projection must be one of {', '.join(PUBLIC_PROJECTIONS)}"
+            )
+        fields = args.get("fields")
+        if fields:
+            fields = [name.strip() for name in fields.split(",") if name.strip()]
+        return cls(projection, fields or None)
+
+    def serialize(self, item):
+        return item.to_dict(projection=self.projection, fields=self.fields)
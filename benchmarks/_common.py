@@ -0,0 +1,32 @@
+"""Shared helpers for the benchmark scripts."""
+
+import statistics
+import time
+
+
+def timed(fn, runs):
+    """Call ``fn`` ``runs`` times and return the wall-clock samples in ms."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    """p50 / p95 / max of a list of millisecond samples."""
+    ordered = sorted(samples)
+    p95_index = max(0, int(round(len(ordered) * 0.95)) - 1)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[p95_index],
+        "max": ordered[-1],
+    }
+
+
+def print_row(label, stats):
+    print(
+        f"{label:<40} p50={stats['p50']:8.2f}ms  "
+        f"p95={stats['p95']:8.2f}ms  max={stats['max']:8.2f}ms"
+    )
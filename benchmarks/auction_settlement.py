@@ -0,0 +1,154 @@
+"""
+Auction settlement benchmark.
+
+Seeds auctions that all ended at the same moment, most with a few reserved
+bids, then settles them with ``AuctionSettlementService`` from several
+worker threads at once. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.auction_settlement --auctions 100000 --workers 4
+"""
+
+import argparse
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.services.auction_service import AuctionSettlementService
+
+from ._common import print_row, summarize
+
+SEED_ITEMS_SQL = """
+INSERT INTO items (
+    id, user_id, title, size_type, size_value, size_compatibility,
+    auction_start_price, auction_ends_at, auction_status,
+    is_public, created_at, updated_at
+)
+SELECT
+    gen_random_uuid(), :seller_id, 'Benchmark auction ' || i,
+    'clothing', 'M', '{}'::json,
+    1000, :ended_at, 'ACTIVE', true, now(), now()
+FROM generate_series(1, :count) AS s(i)
+"""
+
+# Three bids on four auctions out of five; the other auctions end unsold
+SEED_BIDS_SQL = """
+INSERT INTO bids (id, amount, created_at, item_id, user_id, status, expires_at)
+SELECT
+    gen_random_uuid(), 1000 + b * 100 + (hashtext(i.id::text) & 255),
+    now() - (b || ' minutes')::interval, i.id,
+    (ARRAY[:bidder_a, :bidder_b, :bidder_c]::uuid[])[b], 'RESERVED',
+    now() + interval '1 day'
+FROM items i, generate_series(1, 3) AS s(b)
+WHERE i.user_id = :seller_id AND hashtext(i.id::text) % 5 <> 0
+"""
+
+
+def seed(count, ended_at):
+    seller_id, *bidders = (uuid.uuid4() for _ in range(4))
+    for user_id in (seller_id, *bidders):
+        db.session.execute(
+            text(
+                "INSERT INTO users (id, username, password_hash, email) "
+                "VALUES (:id, :username, 'x', :email)"
+            ),
+            {
+                "id": user_id,
+                "username": f"bench-{user_id}",
+                "email": f"{user_id}@bench",
+            },
+        )
+    params = {"seller_id": seller_id, "ended_at": ended_at, "count": count}
+    db.session.execute(text(SEED_ITEMS_SQL), params)
+    db.session.execute(
+        text(SEED_BIDS_SQL),
+        {
+            "seller_id": seller_id,
+            "bidder_a": bidders[0],
+            "bidder_b": bidders[1],
+            "bidder_c": bidders[2],
+        },
+    )
+    db.session.commit()
+    db.session.execute(text("ANALYZE items"))
+    db.session.execute(text("ANALYZE bids"))
+    db.session.commit()
+    return [seller_id, *bidders]
+
+
+def cleanup(user_ids):
+    params = {"ids": user_ids}
+    db.session.execute(
+        text(
+            "DELETE FROM notifications WHERE user_id = ANY(:ids) "
+            "OR actor_id = ANY(:ids)"
+        ),
+        params,
+    )
+    db.session.execute(text("DELETE FROM bids WHERE user_id = ANY(:ids)"), params)
+    db.session.execute(text("DELETE FROM items WHERE user_id = ANY(:ids)"), params)
+    db.session.execute(text("DELETE FROM users WHERE id = ANY(:ids)"), params)
+    db.session.commit()
+
+
+def settle(app, service, now, batch_times, counts):
+    with app.app_context():
+        while True:
+            start = time.perf_counter()
+            batch = service.settle_batch(now=now)
+            db.session.commit()
+            if not batch:
+                break
+            batch_times.append((time.perf_counter() - start) * 1000)
+            counts.append(len(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--auctions", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ended_at = db.session.scalar(
+            text("SELECT LOCALTIMESTAMP - interval '1 minute'")
+        )
+        print(f"Seeding {args.auctions} auctions ending at {ended_at}...")
+        user_ids = seed(args.auctions, ended_at)
+        try:
+            service = AuctionSettlementService(batch_size=args.batch_size)
+            now = db.session.scalar(text("SELECT LOCALTIMESTAMP"))
+            batch_times, counts = [], []
+            workers = [
+                threading.Thread(
+                    target=settle, args=(app, service, now, batch_times, counts)
+                )
+                for _ in range(args.workers)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            settled = sum(counts)
+            print(
+                f"Settled {settled} auctions with {args.workers} workers in "
+                f"{elapsed:.2f}s ({settled / elapsed:,.0f}/s), "
+                f"{len(batch_times)} batches"
+            )
+            print_row("settlement batch", summarize(batch_times))
+        finally:
+            db.session.rollback()
+            cleanup(user_ids)
+
+
+if __name__ == "__main__":
+    main()
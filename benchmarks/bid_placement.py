@@ -0,0 +1,218 @@
+"""
+Bid placement load test.
+
+Seeds one active auction and a crowd of funded bidders, then has every
+bidder bid on that item at once from its own thread, each bid one increment
+above the price it last saw. Afterwards it checks the invariants the
+conditional UPDATE in ``BidService`` guarantees:
+
+* exactly one accepted bid per price level, and the accepted amounts only
+  ever go up;
+* the item's current bid and bidder are those of the last accepted bid;
+* only that bid is still reserved, and the bidders' holds add up to it.
+
+The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.bid_placement --bidders 500 --bids-per-bidder 4
+"""
+
+import argparse
+import threading
+import time
+import uuid
+from collections import Counter
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.services.bid_service import bid_service
+
+from ._common import print_row, summarize
+
+START_PRICE = 100.0
+INCREMENT = 1.0
+
+
+def seed(bidders, balance):
+    seller_id = uuid.uuid4()
+    bidder_ids = [uuid.uuid4() for _ in range(bidders)]
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email, balance) "
+            "VALUES (:id, :username, 'x', :email, :balance)"
+        ),
+        [
+            {
+                "id": user_id,
+                "username": f"bench-{user_id}",
+                "email": f"{user_id}@bench",
+                "balance": balance,
+            }
+            for user_id in (seller_id, *bidder_ids)
+        ],
+    )
+    item_id = db.session.scalar(
+        text(
+            """
+            INSERT INTO items (
+                id, user_id, title, size_type, size_value, size_compatibility,
+                auction_start_price, auction_ends_at, auction_status,
+                is_public, created_at, updated_at
+            )
+            VALUES (
+                gen_random_uuid(), :seller_id, 'Benchmark hot item', 'clothing',
+                'M', '{}'::json, :start_price, LOCALTIMESTAMP + interval '1 hour',
+                'ACTIVE', true, now(), now()
+            )
+            RETURNING id
+            """
+        ),
+        {"seller_id": seller_id, "start_price": START_PRICE},
+    )
+    db.session.commit()
+    return item_id, [seller_id, *bidder_ids]
+
+
+def cleanup(user_ids):
+    params = {"ids": user_ids}
+    db.session.execute(text("DELETE FROM bids WHERE user_id = ANY(:ids)"), params)
+    db.session.execute(text("DELETE FROM items WHERE user_id = ANY(:ids)"), params)
+    db.session.execute(text("DELETE FROM users WHERE id = ANY(:ids)"), params)
+    db.session.commit()
+
+
+def bid(app, item_id, user_id, attempts, start, results, latencies):
+    with app.app_context():
+        start.wait()
+        price = START_PRICE - INCREMENT
+        for _ in range(attempts):
+            began = time.perf_counter()
+            result = bid_service.place_bid(user_id, item_id, price + INCREMENT)
+            latencies.append((time.perf_counter() - began) * 1000)
+            results.append((result.status, price + INCREMENT))
+            # Whether this bid won or lost, the next one has to beat it
+            price = result.current_bid if result.current_bid else price + INCREMENT
+        db.session.remove()
+
+
+def verify(item_id, accepted):
+    failures = []
+    levels = Counter(amount for amount in accepted)
+    doubled = [amount for amount, count in levels.items() if count > 1]
+    if doubled:
+        failures.append(f"price levels with more than one winner: {doubled[:10]}")
+
+    history = db.session.execute(
+        text(
+            "SELECT amount FROM bids WHERE item_id = :item_id "
+            "ORDER BY created_at, amount"
+        ),
+        {"item_id": item_id},
+    ).scalars()
+    history = list(history)
+    if any(later <= earlier for earlier, later in zip(history, history[1:])):
+        failures.append("accepted bids did not strictly increase over time")
+    if len(history) != len(accepted):
+        failures.append(f"{len(history)} bids stored, {len(accepted)} accepted")
+
+    item = db.session.execute(
+        text(
+            "SELECT auction_current_bid, auction_current_bidder_id FROM items "
+            "WHERE id = :item_id"
+        ),
+        {"item_id": item_id},
+    ).one()
+    leader = db.session.execute(
+        text(
+            "SELECT user_id, amount FROM bids "
+            "WHERE item_id = :item_id AND status = 'RESERVED'"
+        ),
+        {"item_id": item_id},
+    ).all()
+    if len(leader) != 1:
+        failures.append(f"{len(leader)} reserved bids, expected 1")
+    elif (leader[0].user_id, leader[0].amount) != (
+        item.auction_current_bidder_id,
+        item.auction_current_bid,
+    ):
+        failures.append("item's current bid does not match the reserved bid")
+    if item.auction_current_bid != max(accepted, default=None):
+        failures.append(
+            f"current bid {item.auction_current_bid} is not the highest "
+            f"accepted bid {max(accepted, default=None)}"
+        )
+
+    holds = db.session.scalar(
+        text(
+            "SELECT coalesce(sum(temp_balance_hold), 0) FROM users "
+            "WHERE id IN (SELECT user_id FROM bids WHERE item_id = :item_id)"
+        ),
+        {"item_id": item_id},
+    )
+    if holds != (item.auction_current_bid or 0):
+        failures.append(f"holds total {holds}, current bid {item.auction_current_bid}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bidders", type=int, default=500)
+    parser.add_argument("--bids-per-bidder", type=int, default=4)
+    parser.add_argument("--balance", type=float, default=1_000_000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        item_id, user_ids = seed(args.bidders, args.balance)
+        try:
+            start = threading.Event()
+            results, latencies = [], []
+            threads = [
+                threading.Thread(
+                    target=bid,
+                    args=(
+                        app,
+                        item_id,
+                        user_id,
+                        args.bids_per_bidder,
+                        start,
+                        results,
+                        latencies,
+                    ),
+                )
+                for user_id in user_ids[1:]
+            ]
+            for thread in threads:
+                thread.start()
+            began = time.perf_counter()
+            start.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+
+            statuses = Counter(status for status, _ in results)
+            accepted = [amount for status, amount in results if status == "accepted"]
+            print(
+                f"{len(results)} bids from {args.bidders} bidders in {elapsed:.2f}s "
+                f"({len(results) / elapsed:,.0f} bids/s): "
+                + ", ".join(f"{count} {status}" for status, count in statuses.items())
+            )
+            print_row("place_bid", summarize(latencies))
+
+            failures = verify(item_id, accepted)
+            for failure in failures:
+                print(f"FAIL: {failure}")
+            if not failures:
+                print(
+                    f"OK: one winner per price level across {len(accepted)} "
+                    f"levels, final bid {max(accepted):.2f}"
+                )
+        finally:
+            db.session.rollback()
+            cleanup(user_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Notification email delivery benchmark.
+
+Seeds a batch of notifications of every emailed type and sends their emails
+to a local SMTP stand-in, first one notification per call (the shape of one
+Celery task per notification) and then in batches of ``--batch`` (what the
+outbox relay's merged calls get). The stand-in accepts and discards
+everything; ``--latency`` delays each of its replies to mimic a remote
+server. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.email_delivery --notifications 2000 --batch 100
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.models.notification import NotificationType
+from app.services.notification_service import notification_service
+
+from ._common import print_row, summarize
+
+EMAILED_TYPES = [
+    (NotificationType.BID_RECEIVED, '{"amount": 120.0}'),
+    (NotificationType.BID_OUTBID, '{"new_highest_bid": 130.0}'),
+    (NotificationType.AUCTION_WON, '{"winning_amount": 140.0}'),
+    (NotificationType.AUCTION_EXPIRED, None),
+    (NotificationType.SIZE_RESTOCK, '{"size_value": "M"}'),
+]
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail and throw it away."""
+
+    latency = 0.0
+
+    def reply(self, line):
+        if self.latency:
+            time.sleep(self.latency)
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"220 sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply(b"250 sink")
+            elif command == b"DATA":
+                self.reply(b"354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1
+                self.reply(b"250 queued")
+            elif command == b"QUIT":
+                self.reply(b"221 bye")
+                return
+            else:
+                self.reply(b"250 ok")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    messages = 0
+
+
+def seed(count):
+    ids = [uuid.uuid4() for _ in range(3)]
+    for user_id in ids:
+        db.session.execute(
+            text(
+                "INSERT INTO users (id, username, password_hash, email) "
+                "VALUES (:id, :username, 'x', :email)"
+            ),
+            {
+                "id": user_id,
+                "username": f"bench-{user_id}",
+                "email": f"{user_id}@bench",
+            },
+        )
+    seller_id, bidder_id, watcher_id = ids
+    item_id = db.session.scalar(
+        text(
+            """
+            INSERT INTO items (
+                id, user_id, title, size_type, size_value, size_compatibility,
+                auction_start_price, auction_ends_at, auction_status,
+                is_public, created_at, updated_at
+            )
+            VALUES (
+                gen_random_uuid(), :seller_id, 'Benchmark email item', 'clothing',
+                'M', '{}'::json, 100, LOCALTIMESTAMP + interval '1 hour',
+                'ACTIVE', true, now(), now()
+            )
+            RETURNING id
+            """
+        ),
+        {"seller_id": seller_id},
+    )
+    notification_ids = db.session.scalars(
+        text(
+            """
+            INSERT INTO notifications (
+                id, user_id, type, item_id, actor_id, notification_data,
+                is_read, created_at
+            )
+            SELECT gen_random_uuid(), :watcher_id,
+                   (:types)[n % :type_count + 1]::notificationtype, :item_id,
+                   :bidder_id, ((:data)[n % :type_count + 1])::json, false, now()
+            FROM generate_series(1, :count) AS n
+            RETURNING id
+            """
+        ),
+        {
+            "watcher_id": watcher_id,
+            "bidder_id": bidder_id,
+            "item_id": item_id,
+            "types": [kind.name for kind, _ in EMAILED_TYPES],
+            "data": [data for _, data in EMAILED_TYPES],
+            "type_count": len(EMAILED_TYPES),
+            "count": count,
+        },
+    ).all()
+    db.session.commit()
+    return notification_ids, item_id, ids
+
+
+def cleanup(item_id, user_ids):
+    db.session.execute(
+        text("DELETE FROM notifications WHERE item_id = :id"), {"id": item_id}
+    )
+    db.session.execute(text("DELETE FROM items WHERE id = :id"), {"id": item_id})
+    db.session.execute(
+        text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": user_ids}
+    )
+    db.session.commit()
+
+
+def deliver(label, notification_ids, batch, sink):
+    before = sink.messages
+    samples = []
+    start = time.perf_counter()
+    for offset in range(0, len(notification_ids), batch):
+        call_start = time.perf_counter()
+        notification_service.send_notification_emails(
+            notification_ids[offset : offset + batch]
+        )
+        db.session.rollback()
+        samples.append((time.perf_counter() - call_start) * 1000)
+    elapsed = time.perf_counter() - start
+    delivered = sink.messages - before
+    print(f"{label:<40} {delivered / elapsed:10.0f} emails/s")
+    print_row(f"  per call ({batch} a call)", summarize(samples))
+    return delivered / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notifications", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="ms added to each SMTP reply"
+    )
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    SMTPSink.latency = args.latency / 1000
+    sink = SinkServer(("127.0.0.1", args.port), SMTPSink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    app = create_app()
+    # Flask-Mail reads its settings at init_app; point the live state at the sink
+    state = app.extensions["mail"]
+    state.server, state.port = "127.0.0.1", args.port
+    state.use_tls = state.use_ssl = False
+    state.username = state.password = None
+    state.suppress = False
+    app.config["MAIL_DEFAULT_SENDER"] = "bench@fitcheck.app"
+
+    with app.app_context():
+        notification_ids, item_id, user_ids = seed(args.notifications)
+        try:
+            single = deliver("one notification per call", notification_ids, 1, sink)
+            batched = deliver(
+                f"batches of {args.batch}", notification_ids, args.batch, sink
+            )
+        finally:
+            cleanup(item_id, user_ids)
+    sink.shutdown()
+    print(f"speedup: {batched / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Engagement counter benchmark.
+
+Seeds a public catalogue and replays a skewed stream of item views two ways:
+one ``UPDATE items SET views_count = views_count + 1`` per view, committed
+as a request would, and through the engagement counters (Redis, or the
+in-process store when ENGAGEMENT_REDIS_URL is empty), flushed in batched
+``UPDATE ... FROM (VALUES ...)`` statements. Trending is left out of both, so
+only the counting is compared. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.engagement_counters --items 10000 --views 20000
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.services.engagement import engagement
+
+from .trending_feed import cleanup, seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--views", type=int, default=20_000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        user_id, item_ids = seed(args.items)
+        try:
+            # A few items draw most of the views
+            views = random.choices(
+                item_ids,
+                weights=[1 / rank for rank in range(1, len(item_ids) + 1)],
+                k=args.views,
+            )
+
+            start = time.perf_counter()
+            for item_id in views:
+                db.session.execute(
+                    text(
+                        "UPDATE items SET views_count = views_count + 1 "
+                        "WHERE id = :id"
+                    ),
+                    {"id": item_id},
+                )
+                db.session.commit()
+            per_row = time.perf_counter() - start
+            print(
+                f"{'one UPDATE per view':<40} {args.views / per_row:10.0f} views/s"
+                f"  rows written={args.views}"
+            )
+
+            engagement.TRENDING_KINDS = {}
+            start = time.perf_counter()
+            for item_id in views:
+                engagement.incr(item_id, "views")
+            counted = time.perf_counter() - start
+            start = time.perf_counter()
+            flushed = engagement.flush()
+            flushing = time.perf_counter() - start
+            print(
+                f"{'buffered, one flush':<40} "
+                f"{args.views / (counted + flushing):10.0f} views/s"
+                f"  rows written={flushed}  flush={flushing * 1000:.0f}ms"
+            )
+            print(f"speedup: {per_row / (counted + flushing):.0f}x")
+
+            total = db.session.scalar(
+                text("SELECT sum(views_count) FROM items WHERE user_id = :id"),
+                {"id": user_id},
+            )
+            assert total == 2 * args.views, total
+        finally:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Socket.IO broadcast latency benchmark.
+
+Seeds one public auction item, starts the app's Socket.IO server in a
+subprocess and connects a crowd of websocket clients that all ``watch``
+the item. Once every client is in the room, the server announces a series
+of bids through ``auction_events``, the same path ``create_bid`` uses (so
+through the Redis message queue when SOCKETIO_MESSAGE_QUEUE is set). Each
+client records how long after the bid it received the event.
+
+Clients and server share the machine, so on small hosts the client side's
+own processing is part of the measured latency. Needs ``aiohttp`` for the
+websocket client. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.live_updates --subscribers 5000 --events 10
+"""
+
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import aiohttp
+import socketio
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+
+from ._common import print_row, summarize
+
+
+def seed():
+    seller_id = uuid.uuid4()
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email) "
+            "VALUES (:id, :username, 'x', :email)"
+        ),
+        {
+            "id": seller_id,
+            "username": f"bench-{seller_id}",
+            "email": f"{seller_id}@bench",
+        },
+    )
+    item_id = db.session.scalar(
+        text(
+            """
+            INSERT INTO items (
+                id, user_id, title, size_type, size_value, size_compatibility,
+                auction_start_price, auction_ends_at, auction_status,
+                is_public, created_at, updated_at
+            )
+            VALUES (
+                gen_random_uuid(), :seller_id, 'Benchmark live item', 'clothing',
+                'M', '{}'::json, 100, LOCALTIMESTAMP + interval '1 hour',
+                'ACTIVE', true, now(), now()
+            )
+            RETURNING id
+            """
+        ),
+        {"seller_id": seller_id},
+    )
+    db.session.commit()
+    return item_id, seller_id
+
+
+def cleanup(item_id, seller_id):
+    db.session.execute(text("DELETE FROM items WHERE id = :id"), {"id": item_id})
+    db.session.execute(text("DELETE FROM users WHERE id = :id"), {"id": seller_id})
+    db.session.commit()
+
+
+def serve(args):
+    """Server side: run Socket.IO, and broadcast once the room is full."""
+    from app.extensions import socketio as server
+    from app.services.auction_events import auction_events, item_room
+    from app.services.bid_service import BidResult
+
+    app = create_app()
+    room = item_room(args.item)
+
+    def broadcast():
+        while len(server.server.manager.rooms.get("/", {}).get(room, ())) < (
+            args.subscribers
+        ):
+            server.sleep(0.1)
+        server.sleep(1)
+        for number in range(args.events):
+            now = datetime.utcnow()
+            result = BidResult(
+                "accepted",
+                bid={
+                    "id": str(uuid.uuid4()),
+                    "amount": 100.0 + number,
+                    "created_at": now.isoformat(),
+                },
+            )
+            auction_events.bid_placed(args.item, uuid.uuid4(), result)
+            server.sleep(args.interval)
+
+    server.start_background_task(broadcast)
+    server.run(
+        app,
+        host="127.0.0.1",
+        port=args.port,
+        log_output=False,
+        max_size=args.subscribers + 100,  # eventlet's default caps at 1024
+    )
+
+
+async def watch(session, url, item_id, received, expected, done):
+    client = socketio.AsyncClient(http_session=session, reconnection=False)
+
+    @client.on("bid")
+    async def on_bid(data):
+        sent = datetime.fromisoformat(data["created_at"]).replace(tzinfo=timezone.utc)
+        received.append((data["bid_id"], time.time() - sent.timestamp()))
+        expected[0] -= 1
+        if expected[0] == 0:
+            done.set()
+
+    await client.connect(url, transports=["websocket"])
+    ack = await client.call("watch", {"item_id": str(item_id)})
+    if "error" in ack:
+        raise RuntimeError(ack["error"])
+    return client
+
+
+async def subscribe_all(args, item_id):
+    url = f"http://127.0.0.1:{args.port}"
+    received, expected, done = [], [args.subscribers * args.events], asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        clients = []
+        start = time.perf_counter()
+        for offset in range(0, args.subscribers, args.connect_batch):
+            count = min(args.connect_batch, args.subscribers - offset)
+            clients += await asyncio.gather(
+                *(
+                    watch(session, url, item_id, received, expected, done)
+                    for _ in range(count)
+                )
+            )
+        print(
+            f"{len(clients)} subscribers watching after "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+        try:
+            await asyncio.wait_for(done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            print(f"Timed out with {expected[0]} deliveries missing")
+        await asyncio.gather(*(client.disconnect() for client in clients))
+    return received
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as probe:
+            if probe.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--connect-batch", type=int, default=250)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--item", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    app = create_app()
+    with app.app_context():
+        item_id, seller_id = seed()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.live_updates",
+            "--serve",
+            f"--item={item_id}",
+            f"--port={args.port}",
+            f"--subscribers={args.subscribers}",
+            f"--events={args.events}",
+            f"--interval={args.interval}",
+        ],
+    )
+    try:
+        wait_for_port(args.port)
+        received = asyncio.run(subscribe_all(args, item_id))
+    finally:
+        server.terminate()
+        server.wait()
+        with app.app_context():
+            cleanup(item_id, seller_id)
+
+    if not received:
+        print("No events received")
+        return
+    by_event = {}
+    for bid_id, latency in received:
+        by_event.setdefault(bid_id, []).append(latency * 1000)
+    print(
+        f"{len(received)} deliveries of {len(by_event)} events to "
+        f"{args.subscribers} subscribers"
+    )
+    print_row(
+        "delivery latency",
+        summarize([ms for latencies in by_event.values() for ms in latencies]),
+    )
+    print_row(
+        "last subscriber reached",
+        summarize([max(latencies) for latencies in by_event.values()]),
+    )
+
+
+if __name__ == "__main__":
+    main()
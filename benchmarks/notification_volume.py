@@ -0,0 +1,159 @@
+"""
+Notification volume under heavy bidding.
+
+Seeds a seller with a few auction items and a crowd of bidders, then replays
+a burst of bids through ``record_bid_notifications`` (the seller's
+BID_RECEIVED and the replaced leader's BID_OUTBID, as the task ``create_bid``
+queues records them): once with coalescing off, which writes a row (and, before digests,
+sent an email) per event, and once with the configured window. The
+resulting notifications are then emailed to the local SMTP stand-in from
+``benchmarks.email_delivery``, one email per recipient as the digest sends
+them. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.notification_volume --bids 5000 --bidders 50 --items 5
+"""
+
+import argparse
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import create_app
+from app.config import config
+from app.extensions import db
+from app.services.notification_service import notification_service
+
+from ._common import print_row, summarize
+from .email_delivery import SinkServer, SMTPSink
+
+
+def seed(bidders, items):
+    user_ids = [uuid.uuid4() for _ in range(bidders + 1)]
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email) "
+            "VALUES (:id, :username, 'x', :email)"
+        ),
+        [
+            {"id": user_id, "username": f"bench-{user_id}", "email": f"{user_id}@bench"}
+            for user_id in user_ids
+        ],
+    )
+    item_ids = db.session.scalars(
+        text(
+            """
+            INSERT INTO items (
+                id, user_id, title, size_type, size_value, size_compatibility,
+                auction_start_price, auction_ends_at, auction_status,
+                is_public, created_at, updated_at
+            )
+            SELECT gen_random_uuid(), :seller_id, 'Benchmark popular item ' || n,
+                   'clothing', 'M', '{}'::json, 100,
+                   LOCALTIMESTAMP + interval '1 hour', 'ACTIVE', true, now(), now()
+            FROM generate_series(1, :items) AS n
+            RETURNING id
+            """
+        ),
+        {"seller_id": user_ids[0], "items": items},
+    ).all()
+    db.session.commit()
+    return user_ids[0], user_ids[1:], item_ids
+
+
+def cleanup(user_ids, item_ids):
+    db.session.execute(
+        text("DELETE FROM notifications WHERE item_id = ANY(:ids)"), {"ids": item_ids}
+    )
+    db.session.execute(
+        text("DELETE FROM items WHERE id = ANY(:ids)"), {"ids": item_ids}
+    )
+    db.session.execute(
+        text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": user_ids}
+    )
+    db.session.commit()
+
+
+def replay(label, window, bids, bidders, item_ids, sink):
+    notification_service.coalesce_window = window
+    leaders = {}
+    samples = []
+    for number in range(bids):
+        item_id = item_ids[number % len(item_ids)]
+        bidder_id = bidders[number % len(bidders)]
+        start = time.perf_counter()
+        notification_service.record_bid_notifications(
+            [(item_id, bidder_id, 100.0 + number, leaders.get(item_id))]
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+        leaders[item_id] = bidder_id
+
+    notification_ids = db.session.scalars(
+        text("SELECT id FROM notifications WHERE item_id = ANY(:ids)"),
+        {"ids": item_ids},
+    ).all()
+    before = sink.messages
+    notification_service.send_notification_emails(notification_ids)
+    db.session.rollback()
+    emails = sink.messages - before
+    db.session.execute(
+        text("DELETE FROM notifications WHERE item_id = ANY(:ids)"), {"ids": item_ids}
+    )
+    db.session.commit()
+
+    print(f"{label:<40} rows={len(notification_ids):6d}  emails={emails:6d}")
+    print_row("  recording one bid's notifications", summarize(samples))
+    return len(notification_ids), emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bids", type=int, default=5000)
+    parser.add_argument("--bidders", type=int, default=50)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument(
+        "--window", type=int, default=config.NOTIFICATION_COALESCE_WINDOW
+    )
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    sink = SinkServer(("127.0.0.1", args.port), SMTPSink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    app = create_app()
+    # Flask-Mail reads its settings at init_app; point the live state at the sink
+    state = app.extensions["mail"]
+    state.server, state.port = "127.0.0.1", args.port
+    state.use_tls = state.use_ssl = False
+    state.username = state.password = None
+    state.suppress = False
+    app.config["MAIL_DEFAULT_SENDER"] = "bench@fitcheck.app"
+
+    with app.app_context():
+        seller_id, bidders, item_ids = seed(args.bidders, args.items)
+        try:
+            rows, emails = replay(
+                "one row per event", 0, args.bids, bidders, item_ids, sink
+            )
+            coalesced_rows, digests = replay(
+                f"coalesced ({args.window}s window)",
+                args.window,
+                args.bids,
+                bidders,
+                item_ids,
+                sink,
+            )
+        finally:
+            cleanup([seller_id, *bidders], item_ids)
+    sink.shutdown()
+    # Before digests every row was also an email
+    print(
+        f"rows: {rows / coalesced_rows:.0f}x fewer, "
+        f"emails: {rows / digests:.0f}x fewer than one per event"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Outfit recommendation benchmark at large wardrobes.
+
+Seeds one user with ``--items`` items spread over the outfit slots, with
+random wear tags, dominant colors, last-worn times and ``--dim`` sized
+embeddings, then times the columnar engine: loading the wardrobe, reading
+the shortlisted embeddings, the beam search for one context, one
+recommendation, and every precomputed context from one load. For
+comparison it times the per-item approach the engine replaced (ORM objects
+scored one by one in Python, each slot picked on its own), reimplemented
+here on the columns that exist. The seeded rows are removed afterwards.
+
+Usage:
+    python -m benchmarks.recommendation_engine --items 10000
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.models.clothing_item import Item
+from app.services.recommendation_cache import RecommendationCache
+from app.services.recommendation_service import (
+    FORMAL_TERMS,
+    SLOT_CATEGORIES,
+    RecommendationEngine,
+    Wardrobe,
+)
+from app.utils.color import NAMED_COLORS
+
+from ._common import print_row, summarize, timed
+
+SEED_SQL = """
+INSERT INTO items (
+    id, user_id, title, category, tags, dominant_colors,
+    size_type, size_value, size_compatibility,
+    auction_start_price, auction_ends_at, auction_status,
+    is_public, last_worn_at, embedding, created_at, updated_at
+)
+SELECT
+    gen_random_uuid(), :user_id, 'Wardrobe item ' || i,
+    (:categories)[1 + (random() * (cardinality(:categories) - 1))::int],
+    ARRAY[(:terms)[1 + (random() * (cardinality(:terms) - 1))::int]],
+    ARRAY(
+        SELECT (:colors)[1 + (random() * (cardinality(:colors) - 1))::int]
+        FROM generate_series(1, 1 + i % 5)
+    ),
+    'clothing', 'M', '{}'::json,
+    1000, now() + interval '7 days', 'EXPIRED',
+    false,
+    CASE WHEN random() < 0.7
+         THEN now() - random() * interval '60 days' END,
+    -- Referencing i makes Postgres draw a new vector per row
+    ARRAY(SELECT random() - 0.5 + 0 * i FROM generate_series(1, :dim)),
+    now(), now()
+FROM generate_series(1, :count) AS s(i)
+"""
+
+
+def seed(count, dim=768):
+    user_id = uuid.uuid4()
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email) "
+            "VALUES (:id, :username, 'x', :email)"
+        ),
+        {"id": user_id, "username": f"bench-{user_id}", "email": f"{user_id}@bench"},
+    )
+    db.session.execute(
+        text(SEED_SQL),
+        {
+            "user_id": user_id,
+            "count": count,
+            "dim": dim,
+            "categories": [names[0] for names in SLOT_CATEGORIES.values()],
+            "terms": FORMAL_TERMS + ["casual", "wool", "linen", "waterproof"],
+            "colors": list(NAMED_COLORS.values()),
+        },
+    )
+    db.session.commit()
+    return user_id
+
+
+def cleanup(user_id):
+    db.session.execute(text("DELETE FROM items WHERE user_id = :id"), {"id": user_id})
+    db.session.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+    db.session.commit()
+
+
+def per_item_reference(user_id, occasion):
+    """Whole ORM items, one Python pass per item and per slot."""
+    items = Item.query.filter(Item.user_id == user_id).all()
+    slot_of = {name: slot for slot, names in SLOT_CATEGORIES.items() for name in names}
+
+    def formality(item):
+        terms = set(item.tags or ()) | set(item.style or ()) | set(item.vibe or ())
+        return 5 if terms & set(FORMAL_TERMS) else 3
+
+    rules = {"formal": lambda item: formality(item) >= 4}
+    filtered = [item for item in items if rules.get(occasion, lambda _: True)(item)]
+    filtered = filtered or items
+
+    categorized = {slot: [] for slot in SLOT_CATEGORIES}
+    for item in filtered:
+        slot = slot_of.get((item.category or "").lower())
+        if slot:
+            categorized[slot].append(item)
+
+    color_counts = {}
+    for item in items:
+        for color in item.dominant_colors or ():
+            color_counts[color] = color_counts.get(color, 0) + 1
+    palette = sorted(color_counts, key=lambda color: -color_counts[color])[:3]
+
+    def select(candidates):
+        best, best_score = None, -1
+        for item in candidates:
+            score = 0
+            if any(color in palette for color in item.dominant_colors or ()):
+                score += 2
+            if not item.last_worn_at or item.last_worn_at < (
+                datetime.utcnow() - timedelta(days=7)
+            ):
+                score += 1
+            if score > best_score:
+                best, best_score = item, score
+        return best
+
+    return {slot: select(categorized[slot]) for slot in ("top", "bottom", "shoes")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        user_id = seed(args.items, args.dim)
+        try:
+            wardrobe = Wardrobe.load(user_id)
+            assert len(wardrobe) == args.items, len(wardrobe)
+
+            print_row(
+                "load wardrobe (columnar)",
+                summarize(timed(lambda: Wardrobe.load(user_id), args.runs)),
+            )
+
+            # The engine's steps for one context, on their own
+            engine = RecommendationEngine
+            palette = engine._extract_color_preferences(wardrobe)
+            scores = engine._item_scores(wardrobe, palette, time.time())
+            mask = engine._context_mask(wardrobe, "formal", "cold")
+            shortlist = {
+                slot: engine._shortlist(wardrobe, scores, mask, slot)
+                for slot in SLOT_CATEGORIES
+            }
+            pool = np.sort(np.concatenate(list(shortlist.values())))
+            print_row(
+                f"read {len(pool)} shortlisted embeddings",
+                summarize(timed(lambda: wardrobe.embeddings(pool), args.runs)),
+            )
+            embeddings = wardrobe.embeddings(pool)
+            print_row(
+                "beam search, one context",
+                summarize(
+                    timed(
+                        lambda: engine._pick_outfit(
+                            wardrobe,
+                            scores,
+                            shortlist,
+                            lambda indices: embeddings[np.searchsorted(pool, indices)],
+                            weather="cold",
+                        ),
+                        args.runs,
+                    )
+                ),
+            )
+            print_row(
+                "one outfit (formal)",
+                summarize(
+                    timed(
+                        lambda: RecommendationEngine.recommend_outfit(
+                            user_id, "formal"
+                        ),
+                        args.runs,
+                    )
+                ),
+            )
+            print_row(
+                f"all {len(RecommendationCache.CONTEXTS)} contexts, one load",
+                summarize(
+                    timed(
+                        lambda: RecommendationEngine.recommend_outfits(
+                            user_id, RecommendationCache.CONTEXTS
+                        ),
+                        args.runs,
+                    )
+                ),
+            )
+
+            def reference():
+                per_item_reference(user_id, "formal")
+                db.session.expunge_all()
+
+            print_row(
+                "one outfit, per-item reference",
+                summarize(timed(reference, max(args.runs // 4, 3))),
+            )
+
+            start = time.perf_counter()
+            outfit = RecommendationEngine.recommend_outfit(user_id, "formal", "cold")
+            elapsed = (time.perf_counter() - start) * 1000
+            slots = {
+                slot: (
+                    (value or {}).get("category")
+                    if not isinstance(value, list)
+                    else [item["category"] for item in value]
+                )
+                for slot, value in outfit["outfit"].items()
+            }
+            print(
+                f"formal/cold outfit in {elapsed:.1f}ms, "
+                f"confidence {outfit['confidence']:.2f}: {slots}"
+            )
+        finally:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
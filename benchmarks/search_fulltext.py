@@ -0,0 +1,100 @@
+"""
+Full-text vs ILIKE search benchmark.
+
+Seeds a synthetic catalogue inside a transaction that is rolled back at the
+end, then times ``SearchService.search_items`` in both modes.
+
+Usage:
+    python -m benchmarks.search_fulltext --items 1000000 --runs 20
+"""
+
+import argparse
+import uuid
+
+from sqlalchemy import func, text
+
+from app import create_app
+from app.extensions import db
+from app.models.clothing_item import Item, search_vector_expression
+from app.services.search_service import SearchService
+
+from ._common import print_row, summarize, timed
+
+QUERIES = ["nike", "red hoodie", "vint", "black leather jacket", "zzzz"]
+
+SEED_SQL = """
+INSERT INTO items (
+    id, user_id, title, brand, category, description, tags,
+    size_type, size_value, size_compatibility,
+    auction_start_price, auction_ends_at, auction_status,
+    is_public, price, created_at, updated_at
+)
+SELECT
+    gen_random_uuid(),
+    :user_id,
+    (ARRAY['red','black','blue','white','green','vintage','oversized','slim'])[1 + i % 8]
+        || ' ' ||
+    (ARRAY['hoodie','jacket','jeans','dress','sneakers','skirt','shirt','coat'])[1 + (i / 8) % 8],
+    (ARRAY['Nike','Adidas','Zara','Levis','Prada','Uniqlo','H&M'])[1 + i % 7],
+    (ARRAY['tops','bottoms','shoes','outerwear','dresses'])[1 + i % 5],
+    'Synthetic listing ' || i || ' in great condition, barely worn, leather trim',
+    ARRAY['cotton', (ARRAY['casual','formal','streetwear','sport'])[1 + i % 4]],
+    'clothing', 'M', '{}'::json,
+    1000, now() + interval '7 days', 'ACTIVE',
+    true, 1000 + i % 50000, now() - (i || ' seconds')::interval, now()
+FROM generate_series(1, :count) AS s(i)
+"""
+
+
+def seed(count):
+    user_id = uuid.uuid4()
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email) "
+            "VALUES (:id, :username, 'x', :email)"
+        ),
+        {"id": user_id, "username": f"bench-{user_id}", "email": f"{user_id}@bench"},
+    )
+    db.session.execute(text(SEED_SQL), {"user_id": user_id, "count": count})
+    db.session.execute(
+        Item.__table__.update()
+        .where(Item.user_id == user_id)
+        .values(
+            search_vector=search_vector_expression(
+                title=Item.title,
+                brand=Item.brand,
+                category=Item.category,
+                description=Item.description,
+                tags=func.array_to_string(Item.tags, " "),
+            )
+        )
+    )
+    db.session.execute(text("ANALYZE items"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            print(f"Seeding {args.items} synthetic items...")
+            seed(args.items)
+
+            for mode, sort in (("ilike", "created_at"), ("fulltext", "relevance")):
+                service = SearchService(mode=mode)
+                for query in QUERIES:
+                    samples = timed(
+                        lambda: service.search_items(query=query, sort=sort),
+                        args.runs,
+                    )
+                    print_row(f"{mode:<9} {query!r}", summarize(samples))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
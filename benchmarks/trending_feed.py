@@ -0,0 +1,129 @@
+"""
+Trending feed benchmark.
+
+Seeds a public catalogue, records a skewed burst of views, likes and bids
+spread over the last day through the trending service (Redis, or the
+in-process store when TRENDING_REDIS_URL is empty), flushes them into
+``items.trending_score`` and times ``/feed/trending``: the first page from
+the warm top-K cache, with the cache refreshed on every request, and the
+keyset (cursor) listing that pages past the cache. The seeded rows are
+removed afterwards.
+
+Usage:
+    python -m benchmarks.trending_feed --items 100000 --events 200000
+"""
+
+import argparse
+import random
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+from app.services.trending import trending
+
+from ._common import print_row, summarize, timed
+
+SEED_SQL = """
+INSERT INTO items (
+    id, user_id, title, size_type, size_value, size_compatibility,
+    auction_start_price, auction_ends_at, auction_status,
+    is_public, price, created_at, updated_at
+)
+SELECT
+    gen_random_uuid(), :user_id, 'Trending listing ' || i,
+    'clothing', 'M', '{}'::json,
+    1000, now() + interval '7 days', 'ACTIVE',
+    i % 10 <> 0, 1000 + i % 50000, now() - (i || ' seconds')::interval, now()
+FROM generate_series(1, :count) AS s(i)
+"""
+
+
+def seed(count):
+    user_id = uuid.uuid4()
+    db.session.execute(
+        text(
+            "INSERT INTO users (id, username, password_hash, email) "
+            "VALUES (:id, :username, 'x', :email)"
+        ),
+        {"id": user_id, "username": f"bench-{user_id}", "email": f"{user_id}@bench"},
+    )
+    db.session.execute(text(SEED_SQL), {"user_id": user_id, "count": count})
+    db.session.execute(text("ANALYZE items"))
+    db.session.commit()
+    item_ids = db.session.scalars(
+        text("SELECT id FROM items WHERE user_id = :id"), {"id": user_id}
+    ).all()
+    return user_id, item_ids
+
+
+def cleanup(user_id):
+    db.session.execute(text("DELETE FROM items WHERE user_id = :id"), {"id": user_id})
+    db.session.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        user_id, item_ids = seed(args.items)
+        try:
+            now = time.time()
+            kinds = random.choices(
+                list(trending.WEIGHTS), weights=[90, 8, 2], k=args.events
+            )
+            # A few items draw most of the engagement
+            targets = random.choices(
+                item_ids,
+                weights=[1 / rank for rank in range(1, len(item_ids) + 1)],
+                k=args.events,
+            )
+            start = time.perf_counter()
+            for kind, item_id in zip(kinds, targets):
+                trending.record(item_id, kind, now=now - random.uniform(0, 86400))
+            elapsed = time.perf_counter() - start
+            print(f"recorded {args.events} events at {args.events / elapsed:,.0f}/s")
+
+            start = time.perf_counter()
+            flushed = trending.flush()
+            print(
+                f"flushed {flushed} items in "
+                f"{(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+
+            def first_page():
+                response = client.get("/feed/trending?per_page=20")
+                assert response.status_code == 200, response.status_code
+
+            first_page()
+            print_row("first page, cached", summarize(timed(first_page, args.runs)))
+
+            cache_ttl, trending.cache_ttl = trending.cache_ttl, 0
+            try:
+                print_row(
+                    "first page, cache refreshed each time",
+                    summarize(timed(first_page, max(args.runs // 10, 5))),
+                )
+            finally:
+                trending.cache_ttl = cache_ttl
+
+            def cursor_page():
+                response = client.get("/feed/trending?per_page=20&cursor=")
+                assert response.status_code == 200, response.status_code
+
+            print_row("first page, keyset listing", summarize(timed(cursor_page, 20)))
+        finally:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
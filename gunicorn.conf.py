@@ -1,13 +1,15 @@
-import multiprocessing
-
 # Server socket
 bind = "0.0.0.0:8001"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
+# Socket.IO needs an async worker, and exactly one per server: gunicorn does
+# not pin a client's polling requests to the worker holding its session.
+# Scale out with more servers behind a sticky load balancer; events reach
+# clients on other servers through SOCKETIO_MESSAGE_QUEUE.
+workers = 1
+worker_class = "eventlet"
+worker_connections = 10000  # Each auction watcher holds a connection open
 timeout = 120
 keepalive = 2
 